@@ -0,0 +1,40 @@
+import sys
+from typing import Optional
+
+import psutil
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+
+class RssLimitExceededError(MemoryError):
+    pass
+
+
+def current_rss_mb() -> float:
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def peak_rss_mb() -> float:
+    """
+    Highest RSS of this process since it started (current RSS where the OS does not report it)
+    """
+    if resource is None:
+        return current_rss_mb()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def check_rss_limit(max_rss_mb: Optional[int], context: str = "") -> None:
+    """
+    Raise if the resident memory of this process is above max_rss_mb (no limit when None)
+    """
+    if not max_rss_mb:
+        return
+
+    rss_mb = current_rss_mb()
+    if rss_mb > max_rss_mb:
+        raise RssLimitExceededError(f"RSS {rss_mb:.0f} MB exceeds the limit of {max_rss_mb} MB {context}".strip())
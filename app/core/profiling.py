@@ -0,0 +1,143 @@
+import cProfile
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, List, Tuple, Iterator
+
+
+# <document>[.<label>].<duration ms>ms.<ms timestamp>-<pid>-<n>.collapsed / .prof
+_PROFILE_NAME = re.compile(r"\.(\d+)ms\.\d+-\d+-\d+\.(?:collapsed|prof)$")
+
+
+class _StackSampler:
+    """
+    Samples the stack of one thread from a background thread every `interval_s`,
+    counts identical stacks - the collapsed-stack format of flamegraph.pl / speedscope
+    """
+    def __init__(self, thread_id: int, interval_s: float):
+        self._thread_id = thread_id
+        self._interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.stacks: Counter = Counter()
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        while not self._stop.wait(self._interval_s):
+            frame = sys._current_frames().get(self._thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class DocumentProfiler:
+    """
+    Opt-in per-document profiling: every document runs under a sampling profiler (cProfile where
+    sys._current_frames is not available), profiles of the `keep_slowest` slowest runs and of every
+    run above `threshold_s` are kept in output_dir, others are deleted.
+    Every run gets its own file, <document>[.<label>].<duration ms>ms.<ms timestamp>-<pid>-<n>.collapsed (or .prof),
+    so re-runs of a document and runs in other worker processes never overwrite each other.
+    The slowest runs are ranked from the durations in the file names of output_dir, so the limit holds
+    across all worker processes and pool restarts
+    """
+    def __init__(self,
+                 output_dir: str,
+                 enabled: bool = False,
+                 keep_slowest: int = 5,
+                 threshold_s: Optional[float] = None,
+                 interval_ms: float = 10.0):
+        self._output_dir = Path(output_dir)
+        self.enabled = enabled
+        self._keep_slowest = keep_slowest
+        self._threshold_s = threshold_s
+        self._interval_s = interval_ms / 1000.0
+        self._sampling = hasattr(sys, "_current_frames")
+        self._runs = itertools.count(1)
+
+    @contextmanager
+    def profile(self, document: str, label: Optional[str] = None) -> Iterator[None]:
+        """
+        `label` - what part of the document work runs, e.g. the stages, added to the profile file name
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start_time = time.perf_counter()
+        if self._sampling:
+            sampler, profiler = _StackSampler(threading.get_ident(), self._interval_s), None
+            sampler.start()
+        else:
+            sampler, profiler = None, cProfile.Profile()
+            profiler.enable()
+
+        try:
+            yield
+        finally:
+            if sampler:
+                sampler.stop()
+            else:
+                profiler.disable()
+            duration = time.perf_counter() - start_time
+            self._keep(document, label, duration, sampler, profiler)
+
+    def _profile_stem(self, document: str, label: Optional[str], duration: float) -> str:
+        run = f"{int(time.time() * 1000)}-{os.getpid()}-{next(self._runs)}"
+        parts = [document] + ([label] if label else []) + [f"{int(duration * 1000)}ms", run]
+        return ".".join(re.sub(r"[^\w-]+", "_", part) for part in parts)
+
+    def _kept_profiles(self) -> List[Tuple[float, Path]]:
+        """
+        (duration, path) of the profiles in output_dir, written by any process, slowest first
+        """
+        profiles = []
+        if self._output_dir.is_dir():
+            for path in self._output_dir.iterdir():
+                match = _PROFILE_NAME.search(path.name)
+                if match:
+                    profiles.append((int(match.group(1)) / 1000.0, path))
+        return sorted(profiles, reverse=True)
+
+    def _keep(self, document: str, label: Optional[str], duration: float,
+              sampler: Optional[_StackSampler], profiler: Optional[cProfile.Profile]):
+        above_threshold = self._threshold_s is not None and duration >= self._threshold_s
+        slowest = self._kept_profiles()[:self._keep_slowest]
+        in_top = self._keep_slowest > 0 and (len(slowest) < self._keep_slowest or duration > slowest[-1][0])
+        if not above_threshold and not in_top:
+            return
+
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+        name = self._profile_stem(document, label, duration)
+        if sampler:
+            path = self._output_dir / f"{name}.collapsed"
+            path.write_text("".join(f"{stack} {count}\n" for stack, count in sampler.stacks.most_common()), encoding="utf-8")
+        else:
+            path = self._output_dir / f"{name}.prof"
+            profiler.dump_stats(str(path))
+        print(f"   Profile of {document} ({duration:.1f}s) written to {path}")
+
+        # profiles out of the top N are deleted, a profile above the threshold stays even then.
+        # Another process may add a slower profile meanwhile - it only moves more profiles out of the top N
+        for dropped_duration, dropped_path in self._kept_profiles()[self._keep_slowest:]:
+            if self._threshold_s is None or dropped_duration < self._threshold_s:
+                dropped_path.unlink(missing_ok=True)
@@ -1,4 +1,6 @@
 from functools import lru_cache
+from typing import Optional, List, Dict
+
 from pydantic import BaseModel, field_validator
 from pydantic_settings import BaseSettings
 
@@ -9,6 +11,70 @@ class Settings(BaseSettings):
     OUTPUT_DIR: str = './data/output_dir'
     HG_API_KEY: str
 
+    MAX_RSS_MB: Optional[int] = None        # abort a document when process memory grows above it
+
+    OUTPUT_BACKEND: str = 'files'           # files (txt/csv per protocol), parquet (corpus store) or both
+    CORPUS_STORE_DIR: str = './data/output_dir/corpus'
+
+    PAGE_INDEX_ENABLED: bool = True         # full-text index of extracted pages, see page_search_app.py
+    PAGE_INDEX_PATH: str = './data/output_dir/page_index.sqlite'
+
+    PAGE_CACHE_ENABLED: bool = True         # reuse text/tables of unchanged pages (protocol amendments, re-runs)
+    PAGE_CACHE_PATH: str = './data/output_dir/page_cache.sqlite'
+
+    TABLE_EXTRACTOR: str = 'scan'           # scan (pattern pages + camelot chain) or grobid (camelot on Grobid table regions)
+                                            # the page scheduler of the streaming pipeline always scans
+
+    TEI_STORE_DIR: str = './data/output_dir/tei'
+    GROBID_VERSION: Optional[str] = None    # reuse only TEI of this Grobid version; not set - of the running one (any while it is down)
+
+    HF_MAX_NEW_TOKENS: int = 8192           # upper bound for local generation, streaming stops earlier when done
+    HF_PREFIX_CACHE_ENABLED: bool = True    # reuse KV cache of registered static prompt prefixes
+    HF_INFERENCE_PROFILE: str = 'default'   # default (fp32), bf16 or int8 (dynamic quantization, CPU)
+    HF_NUM_THREADS: Optional[int] = None    # torch intra-op threads, all cores when not set
+    # assisted decoding (greedy) with a small draft model of the same tokenizer, target model -> draft model
+    # e.g. HF_DRAFT_MODELS='{"meta-llama/Meta-Llama-3-8B-Instruct": "meta-llama/Llama-3.2-1B-Instruct"}'
+    HF_DRAFT_MODELS: Dict[str, str] = {}
+
+    BC_VOCABULARY_PATHS: List[str] = []     # extra BiomedicalConcept vocabularies (json/yaml) for the dictionary matcher
+
+    LLM_PROVIDER: str = 'hg_local'          # provider of the conversion pipelines when no router is configured
+    # per provider: rpm, tpm, initial_concurrency, max_concurrency, latency_target_s, max_retries
+    # e.g. LLM_RATE_LIMITS='{"deepseek": {"rpm": 60, "tpm": 100000, "max_concurrency": 8}}'
+    LLM_RATE_LIMITS: Dict[str, Dict[str, float]] = {}
+    LLM_ROUTER_PROVIDERS: List[str] = []    # e.g. ["hg_local", "ollama"] - pipelines balance requests over them
+    LLM_ROUTER_MAX_CONCURRENCY: int = 1     # concurrent requests per backend
+    LLM_ROUTER_TIMEOUT_S: Optional[float] = None    # fail over to the next backend after it
+    LLM_PROMPT_FORMAT: str = 'compact'      # 'compact' (visit ids + legend) or 'csv' - activity tables in the prompt
+    LLM_PROMPT_TOKEN_BUDGET: int = 2048     # compact tables are split into chunks of at most this many tokens
+
+    RUN_JOURNAL_PATH: str = './data/output_dir/run_journal.sqlite'    # per-document, per-stage status for --resume
+    RUN_MAX_ATTEMPTS: int = 3               # failed stages are retried on --resume up to this many attempts
+
+    PROFILE_ENABLED: bool = False           # sample every document of pdf_extractor_app.py, keep profiles of the outliers
+    PROFILE_DIR: str = './data/output_dir/profiles'     # <document>.<duration>ms.<run>.collapsed - speedscope, flamegraph.pl
+    PROFILE_KEEP_SLOWEST: int = 5           # profiles of the N slowest documents are kept (all workers together)
+    PROFILE_THRESHOLD_S: Optional[float] = None     # ... and of every document slower than this
+    PROFILE_INTERVAL_MS: float = 10.0       # sampling interval
+
+    PIPELINE_EXTRACT_WORKERS: int = 2       # streaming pipeline: table extraction processes
+    PIPELINE_LLM_WORKERS: int = 1           # concurrent LLM conversions (raise for remote providers)
+    PIPELINE_QUEUE_SIZE: int = 4            # bound of the queues between stages
+    PIPELINE_CHUNK_ROWS: int = 25           # activity rows sent to the LLM in one request
+    PIPELINE_PREFETCH_PAGES: int = 4        # pages after a table page extracted speculatively (long tables in parallel)
+
+    SERVICE_HOST: str = '127.0.0.1'         # extraction_service_app.py
+    SERVICE_PORT: int = 8000
+    SERVICE_DATA_DIR: str = './data/service_jobs'   # uploads and results, one folder per job
+    SERVICE_WORKERS: int = 2                # warm extraction processes
+    SERVICE_JOBS_CONCURRENCY: int = 2       # jobs run at the same time, the rest wait in the queue
+    SERVICE_MAX_PENDING_JOBS: int = 32      # uploads are rejected (503) when the queue is full
+    SERVICE_MAX_FINISHED_JOBS: int = 256    # older finished jobs are dropped with their folder, 0 - keep all
+    SERVICE_JOB_RETENTION_S: int = 86400    # finished jobs are dropped with their folder after that, 0 - keep
+    SERVICE_EXTRACTION_CONCURRENCY: int = 2     # documents extracted at the same time (text and tables of one in a single job)
+    SERVICE_LLM_CONCURRENCY: int = 1        # LLM conversions
+    SERVICE_PRELOAD_LLM: bool = True        # load the model at start instead of on the first conversion
+
     class Config:
         env_file = '.env'
         env_file_encoding = 'utf-8'
@@ -0,0 +1,25 @@
+import signal
+import threading
+
+
+class GracefulShutdown:
+    """
+    SIGTERM/SIGINT only set a flag: the current document is finished and recorded in the run journal,
+    then the batch loop stops. A second signal exits immediately.
+    """
+    def __init__(self):
+        self._requested = threading.Event()
+
+    def install(self):
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._handle)
+
+    def _handle(self, signum, frame):
+        if self._requested.is_set():
+            raise SystemExit(128 + signum)
+        print(f"Signal {signal.Signals(signum).name} received, stopping after the current document")
+        self._requested.set()
+
+    @property
+    def requested(self) -> bool:
+        return self._requested.is_set()
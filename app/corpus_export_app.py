@@ -0,0 +1,43 @@
+import os
+import sys
+import argparse
+sys.path.append(os.path.abspath(os.sep.join(os.path.dirname(__file__).split(os.sep)[:-1])))
+from pathlib import Path
+
+from app.core.settings import get_settings
+from app.infrastructure.parquet_corpus_store import ParquetCorpusStore
+from app.use_cases.processing_pdf_use_case import PAGE_SEPARATOR
+
+
+def main():
+    """
+    Export documents from the parquet corpus store back to the classic TXT/CSV files
+    """
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Export corpus store to TXT/CSV files")
+    parser.add_argument("--document", help="export only this document (PDF file stem)")
+    parser.add_argument("--output-dir", default=settings.OUTPUT_DIR)
+    args = parser.parse_args()
+
+    store = ParquetCorpusStore(settings.CORPUS_STORE_DIR)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    documents = store.documents()
+    names = [args.document] if args.document else list(documents)
+    for name in names:
+        entry = documents.get(name)
+        if entry is None:
+            print(f"Document {name} is not in the corpus store")
+            continue
+
+        if entry.get("pages"):
+            store.export_text(name, output_dir / f"{name}.txt", PAGE_SEPARATOR)
+        for kind in entry.get("tables", {}):
+            store.export_csv(name, kind, output_dir / f"{name}_{kind}.csv")
+        print(f"Exported {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,17 @@ import logging
 from injector import singleton, Module
 
 from app.core.settings import get_settings, Settings
+from app.core.shutdown import GracefulShutdown
+from app.core.profiling import DocumentProfiler
+from app.infrastructure.parquet_corpus_store import ParquetCorpusStore
+from app.infrastructure.page_text_index import PageTextIndex
+from app.infrastructure.page_cache import PageCache
+from app.infrastructure.run_journal import RunJournal
+from app.infrastructure.tei_artifact_store import TeiArtifactStore
 from app.services.pdf_convertor import GrobidClient
 from app.services.pdf_convertor import PDFConvertor
 from app.services.pdf_convertor_v3 import PDFConvertorV3
+from app.services.grobid_table_extractor import GrobidTableExtractor
 
 
 class AppModule(Module):
@@ -20,15 +28,42 @@ class AppModule(Module):
         binder.bind(Settings, to=settings, scope=singleton)
         binder.bind(logging.Logger, to=logger, scope=singleton)
 
+        run_journal = RunJournal(settings.RUN_JOURNAL_PATH)
+        binder.bind(RunJournal, to=run_journal, scope=singleton)
+        binder.bind(GracefulShutdown, to=GracefulShutdown(), scope=singleton)
+
+        document_profiler = DocumentProfiler(
+            output_dir=settings.PROFILE_DIR,
+            enabled=settings.PROFILE_ENABLED,
+            keep_slowest=settings.PROFILE_KEEP_SLOWEST,
+            threshold_s=settings.PROFILE_THRESHOLD_S,
+            interval_ms=settings.PROFILE_INTERVAL_MS,
+        )
+        binder.bind(DocumentProfiler, to=document_profiler, scope=singleton)
+
+        corpus_store = ParquetCorpusStore(settings.CORPUS_STORE_DIR)
+        binder.bind(ParquetCorpusStore, to=corpus_store, scope=singleton)
+
+        page_index = PageTextIndex(settings.PAGE_INDEX_PATH)
+        binder.bind(PageTextIndex, to=page_index, scope=singleton)
+
         grobid_client = GrobidClient(settings.GROBID_URL)
         binder.bind(GrobidClient, to=grobid_client, scope=singleton)
 
+        tei_store = TeiArtifactStore(settings.TEI_STORE_DIR)
+        binder.bind(TeiArtifactStore, to=tei_store, scope=singleton)
+
         ### this binding is not mandatory - injector will get it automatically from Annotation
         # that convertor uses Grobid in a separate docker instance
-        pdf_convertor = PDFConvertor(client=grobid_client, settings=settings)
+        pdf_convertor = PDFConvertor(client=grobid_client, settings=settings, page_index=page_index, tei_store=tei_store)
         binder.bind(PDFConvertor, to=pdf_convertor, scope=singleton)
 
         # that converter uses pdfplumber and camelot
-        pdf_convertor_v3 = PDFConvertorV3()
+        page_cache = PageCache(settings.PAGE_CACHE_PATH) if settings.PAGE_CACHE_ENABLED else None
+        if settings.TABLE_EXTRACTOR == 'grobid':
+            # tables only from the regions Grobid marked as tables, text still from pdfplumber
+            pdf_convertor_v3 = GrobidTableExtractor(pdf_convertor, max_rss_mb=settings.MAX_RSS_MB, page_cache=page_cache)
+        else:
+            pdf_convertor_v3 = PDFConvertorV3(max_rss_mb=settings.MAX_RSS_MB, page_cache=page_cache)
         binder.bind(PDFConvertorV3, to=pdf_convertor_v3, scope=singleton)
 
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import argparse
+sys.path.append(os.path.abspath(os.sep.join(os.path.dirname(__file__).split(os.sep)[:-1])))
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse, FileResponse
+from injector import Injector
+
+from app.core.settings import get_settings
+from app.di.app_module import AppModule
+from app.infrastructure.job_queue import QueueFullError
+from app.services.activity_converter import ActivityConverter
+from app.services.biomedical_concept_matcher import BiomedicalConceptMatcher
+from app.services.soa_prompt_encoder import SoAPromptEncoder
+from app.use_cases.extraction_service_use_case import ExtractionServiceUseCase
+
+
+def create_app(service: ExtractionServiceUseCase, converter: Optional[ActivityConverter] = None) -> FastAPI:
+    """
+    POST /jobs                        upload a PDF (multipart "file"), ?convert=true to also run the LLM conversion
+    GET  /jobs, /jobs/{id}            job status, stages and artifacts
+    GET  /jobs/{id}/events            NDJSON stream of the job events until it is done
+    GET  /jobs/{id}/artifacts/{name}  download a result file
+    GET  /health                      workers and queue
+    """
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await service.start(converter)
+        yield
+        await service.stop()
+
+    app = FastAPI(title="PDF to USDM extraction service", lifespan=lifespan)
+
+    def get_job(job_id: str):
+        job = service.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        return job
+
+    @app.post("/jobs", status_code=202)
+    async def submit_job(file: UploadFile = File(...), convert: bool = False):
+        if not (file.filename or "").lower().endswith(".pdf"):
+            raise HTTPException(status_code=400, detail="Only PDF files are accepted")
+        try:
+            job = service.submit(file.filename, await file.read(), convert)
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return job.to_dict()
+
+    @app.get("/jobs")
+    async def list_jobs():
+        return [job.to_dict() for job in service.jobs.list()]
+
+    @app.get("/jobs/{job_id}")
+    async def job_status(job_id: str):
+        return get_job(job_id).to_dict()
+
+    @app.get("/jobs/{job_id}/events")
+    async def job_events(job_id: str):
+        job = get_job(job_id)
+
+        async def lines():
+            async for event in service.jobs.follow(job):
+                yield json.dumps(event) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/jobs/{job_id}/artifacts/{name}")
+    async def job_artifact(job_id: str, name: str):
+        job = get_job(job_id)
+        artifacts = {Path(a).name: a for a in job.artifacts}
+        if name not in artifacts:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} has no artifact {name}")
+        return FileResponse(artifacts[name], filename=name)
+
+    @app.get("/health")
+    async def health():
+        return service.stats()
+
+    return app
+
+
+def main():
+    """
+    Extraction as a service: workers, DI and models stay warm between uploads
+    """
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="PDF -> USDM extraction service")
+    parser.add_argument("--host", default=settings.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVICE_PORT)
+    parser.add_argument("--model", default="meta-llama/Meta-Llama-3-8B-Instruct")
+    parser.add_argument("--no-llm", action="store_true", help="extraction only, jobs can not ask for conversion")
+    args = parser.parse_args()
+
+    converter = None
+    if not args.no_llm:
+        # the client factory imports torch/transformers, an extraction-only service does not need them
+        from app.infrastructure.llm.llm_client_factory import llm_client_factory
+
+        activity_example = (Path(__file__).parent / "json_templates" / "activity_example.json").read_text(encoding="utf-8")
+        converter = ActivityConverter(
+            llm_client=llm_client_factory.for_pipeline(),
+            model=args.model,
+            activity_example=activity_example,
+            concept_matcher=BiomedicalConceptMatcher(settings.BC_VOCABULARY_PATHS),
+            prompt_encoder=SoAPromptEncoder(settings.LLM_PROMPT_TOKEN_BUDGET) if settings.LLM_PROMPT_FORMAT == "compact" else None,
+        )
+
+    service = Injector([AppModule()]).get(ExtractionServiceUseCase)
+    uvicorn.run(create_app(service, converter), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,32 @@ from pathlib import Path
 from injector import inject
 
 from app.core.settings import Settings
-from app.use_cases.processing_pdf_use_case import ProcessingPdfUseCase
+from app.core.shutdown import GracefulShutdown
+from app.infrastructure.run_journal import RunJournal
+from app.use_cases.processing_pdf_use_case import ProcessingPdfUseCase, EXTRACTION_STAGES
 
 
 class Application:
     @inject
     def __init__(self,
                  processing_pdf_use_case: ProcessingPdfUseCase,
+                 journal: RunJournal,
+                 shutdown: GracefulShutdown,
                  settings: Settings,
                  logger: logging.Logger):
         self._processing_pdf_use_case = processing_pdf_use_case
+        self._journal = journal
+        self._shutdown = shutdown
         self._input_dir = settings.INPUT_DIR
         self._output_dir = settings.OUTPUT_DIR
         self._logger = logger
 
-    def launch(self):
-        self._logger.info("Running the application.")
+    def launch(self, resume: bool = False):
+        self._logger.info("Running the application." + (" Resuming the previous run." if resume else ""))
+        self._shutdown.install()
+        if not resume:
+            # the LLM stages recorded by pipeline.py are kept
+            self._journal.reset(EXTRACTION_STAGES)
 
         Path(self._output_dir).mkdir(parents=True, exist_ok=True)
 
@@ -29,11 +39,17 @@ class Application:
         self._logger.info(f"Scanning {self._input_dir} folder... {len(pdf_files)} files found.")
 
         for pdf_file in pdf_files:
+            if self._shutdown.requested:
+                self._logger.warning("Shutdown requested, run it again with --resume to continue")
+                break
             self._processing_pdf_use_case.run_extraction_pipeline(
                 pdf_file=pdf_file,
-                output_dir=self._output_dir
+                output_dir=self._output_dir,
+                resume=resume
             )
 
+        self._logger.info(f"Run journal: {self._journal.summary()}")
+
 
 
 
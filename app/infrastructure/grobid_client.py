@@ -1,3 +1,5 @@
+from typing import Optional
+
 import httpx
 
 
@@ -5,6 +7,12 @@ class GrobidClient:
     def __init__(self, base_url: str):
         self._client = httpx.Client(base_url=base_url, timeout=240)
 
+        #coord_tags = {'figure', 'table', 'formula', 'list', 'item', 'label'}
+        # 's' - sentence coordinates give page numbers of the text, 'figure'/'table' - table regions for GrobidTableExtractor
+        coord_tags = {'figure', 'table', 's'}
+        # form fields sent to processFulltextDocument, also part of the TEI artifact key
+        self.fulltext_params = {'teiCoordinates': sorted(coord_tags), 'segmentSentences': '1'}
+
     def check_server(self) -> bool:
         try:
             response = self._client.get("/api/isalive", timeout=5)
@@ -16,21 +24,29 @@ class GrobidClient:
             print(f"GROBID server at {self._client.base_url} is not reachable: {e}")
             return False
 
+    def get_version(self) -> Optional[str]:
+        """
+        Version of the running Grobid, None when the server is not reachable
+        """
+        try:
+            response = self._client.get("/api/version", timeout=5)
+            response.raise_for_status()
+            return response.text.strip() or "unknown"
+        except Exception as e:
+            print(f"Could not get GROBID version from {self._client.base_url}: {e}")
+            return None
+
     def call_process_fulltext(self, pdf_path: str) -> str:
         try:
-            #coord_tags = {'figure', 'table', 'formula', 'list', 'item', 'label'}
-            coord_tags = { 'table'}
-            params = {
-                'consolidateHeader': '1',
-                'consolidateCitations': '1',
-                'includeRawCitations': '0',
-                'includeRawAffiliations': '0',
-                'teiCoordinates': list(coord_tags)
-            }
+            # params = {
+            #     'consolidateHeader': '1',
+            #     'consolidateCitations': '1',
+            #     'includeRawCitations': '0',
+            #     'includeRawAffiliations': '0',
+            # }
             with open(pdf_path, 'rb') as f:
                 files = {'input': f}
-                data = {'teiCoordinates': True, 'segmentSentences': True}
-                response = self._client.post("/api/processFulltextDocument", files=files, data=data)
+                response = self._client.post("/api/processFulltextDocument", files=files, data=self.fulltext_params)
 
             response.raise_for_status()
             print(f"Successfully processed PDF with GROBID: {pdf_path}")
@@ -0,0 +1,129 @@
+import asyncio
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, List, Dict, AsyncIterator
+
+from app.infrastructure.run_journal import RUNNING, DONE, FAILED
+
+QUEUED = "queued"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    pdf_path: Path
+    output_dir: Path
+    convert: bool                   # also run LLM conversion of the activity table
+    status: str = QUEUED
+    stages: Dict[str, Dict] = field(default_factory=dict)      # stage -> {"status", "artifacts", "error"}
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    events: List[Dict] = field(default_factory=list)
+
+    @property
+    def artifacts(self) -> List[str]:
+        return [a for stage in self.stages.values() for a in stage.get("artifacts", [])]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "document": self.pdf_path.name,
+            "status": self.status,
+            "convert": self.convert,
+            "stages": self.stages,
+            "artifacts": [Path(a).name for a in self.artifacts],
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    In-memory jobs of the extraction service: bounded queue of pending jobs, status of every job and
+    an event log per job that clients follow while it runs (stage started / done / failed, job done).
+    Finished jobs are kept for `retention_s` seconds and at most `max_finished` of them, older ones are dropped
+    together with their folder (upload and results)
+    """
+    def __init__(self, data_dir: str, max_pending: int, max_finished: int = 0, retention_s: float = 0):
+        self._data_dir = Path(data_dir)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._jobs: Dict[str, Job] = {}
+        self._changed = asyncio.Condition()
+        self._max_finished = max_finished       # 0 - no limit
+        self._retention_s = retention_s         # 0 - no limit
+
+    def _evict(self):
+        finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        expired = len(finished) - self._max_finished if self._max_finished else 0
+        now = time.time()
+        for i, job in enumerate(finished):
+            if i >= expired and not (self._retention_s and now - job.finished_at > self._retention_s):
+                continue
+            # a client still following the job keeps its own reference, only the listing and the files go
+            del self._jobs[job.id]
+            shutil.rmtree(job.output_dir, ignore_errors=True)
+
+    def create(self, filename: str, content: bytes, convert: bool) -> Job:
+        self._evict()
+        if self._queue.full():
+            raise QueueFullError(f"{self._queue.maxsize} jobs are already waiting")
+
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = self._data_dir / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        pdf_path = job_dir / Path(filename).name
+        pdf_path.write_bytes(content)
+
+        job = Job(job_id, pdf_path, job_dir, convert)
+        self._jobs[job_id] = job
+        self._queue.put_nowait(job)
+        job.events.append({"event": QUEUED, "job": job_id, "time": job.created_at})
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    async def next(self) -> Job:
+        return await self._queue.get()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def publish(self, job: Job, event: str, **payload):
+        job.events.append({"event": event, "job": job.id, "time": time.time(), **payload})
+        if event in (DONE, FAILED):
+            job.status = event
+            job.finished_at = time.time()
+            self._evict()
+        elif job.status == QUEUED:
+            job.status = RUNNING
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self, job: Job) -> AsyncIterator[Dict]:
+        """
+        All events of the job so far, then new ones as they come, until the job is done or failed
+        """
+        sent = 0
+        while True:
+            while sent < len(job.events):
+                sent += 1
+                yield job.events[sent - 1]
+            if job.status in (DONE, FAILED):
+                return
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(job.events) > sent)
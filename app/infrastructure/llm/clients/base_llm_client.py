@@ -1,11 +1,39 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List, Callable
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, List, Callable, AsyncIterator
 import time
 
 import httpx
 from loguru import logger
 
 
+RATE_LIMIT_STATUS_CODES = (429, 503)
+
+
+class RateLimitedError(Exception):
+    """
+    Provider asked to slow down (429 / 503), retry_after_s comes from the Retry-After header when it was sent
+    """
+    def __init__(self, message: str, status_code: int, retry_after_s: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after_s = retry_after_s
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
 class BaseLLMClient(ABC):
 
     async def _measure_request(self, operation: str, model: str, func, **kwargs):
@@ -19,6 +47,10 @@ class BaseLLMClient(ABC):
             return result
 
         except httpx.HTTPStatusError as e:
+            if e.response.status_code in RATE_LIMIT_STATUS_CODES:
+                retry_after_s = parse_retry_after(e.response.headers.get("Retry-After"))
+                logger.warning(f"[{operation.upper()}] Rate limited ({e.response.status_code}), retry after {retry_after_s}s")
+                raise RateLimitedError(f"API rate limit: {str(e)}", e.response.status_code, retry_after_s)
             logger.error(f"[{operation.upper()}] HTTP error {e.response.status_code} - {str(e)}")
             raise Exception(f"API error: {str(e)}")
 
@@ -38,4 +70,27 @@ class BaseLLMClient(ABC):
 
     @abstractmethod
     async def chat(self, operation: str, model: str, prompt: str, history: Optional[list] = None, image: Optional[str] = None):
-        pass
\ No newline at end of file
+        pass
+
+
+    def register_prefix(self, model: str, messages: list, placeholder: str) -> None:
+        """
+        Announce a static prompt prefix shared by many requests: `messages` is a prompt where the variable part
+        is `placeholder`, everything before it is the prefix. Clients that can cache prefill state override it.
+        """
+        pass
+
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Client counters (throttling, routing) for logs, empty for plain clients
+        """
+        return {}
+
+
+    async def stream_generate(self, operation: str, model: str, prompt: str, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Yield the completion in text chunks as they are produced; closing the iterator stops the generation.
+        Clients without native streaming return the whole completion as a single chunk.
+        """
+        yield await self.generate(operation=operation, model=model, prompt=prompt)
\ No newline at end of file
@@ -1,7 +1,16 @@
-from typing import Optional
+import asyncio
+import copy
+import statistics
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Dict, Tuple, AsyncIterator, List
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+from transformers import DynamicCache
 from huggingface_hub import login
 from loguru import logger
 
@@ -9,54 +18,382 @@ from app.infrastructure.llm.clients.base_llm_client import BaseLLMClient
 from app.core.settings import get_settings
 
 
+class _StopEventCriteria(StoppingCriteria):
+    """
+    Stops model.generate() running in a background thread as soon as the consumer sets the event
+    """
+    def __init__(self, stop_event: threading.Event):
+        self._stop_event = stop_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self._stop_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+# CPU inference profiles:
+#   default - fp32 weights
+#   bf16    - bfloat16 weights, only where the CPU has native bf16 (AVX512-BF16 / AMX), fp32 otherwise
+#   int8    - fp32 load + int8 dynamic quantization of all Linear layers (CPU only)
+INFERENCE_PROFILES = ("default", "bf16", "int8")
+
+
+def _cpu_supports_bf16() -> bool:
+    try:
+        cpu_flags = Path("/proc/cpuinfo").read_text()
+    except OSError:
+        return False
+    return "avx512_bf16" in cpu_flags or "amx_bf16" in cpu_flags
+
+
+class _ForwardCounter:
+    """
+    Forward passes of a model per generating thread - target vs draft passes of assisted decoding
+    """
+    def __init__(self, hf_model):
+        self._counts: Dict[int, int] = defaultdict(int)
+        hf_model.register_forward_hook(self._hook)
+
+    def _hook(self, module, inputs, output):
+        self._counts[threading.get_ident()] += 1
+
+    def take(self) -> int:
+        return self._counts.pop(threading.get_ident(), 0)
+
+
+@dataclass
+class AssistedStats:
+    """
+    One assisted generation: every target pass verifies the draft candidates and adds one token of its own,
+    so plain greedy decoding would need `new_tokens` target passes instead of `target_passes`.
+    Wall time against plain greedy decoding is measured on the same prompt by assisted_decoding_benchmark only
+    """
+    draft_model: str
+    new_tokens: int = 0
+    target_passes: int = 0
+    draft_passes: int = 0           # one proposed token each
+    elapsed_s: float = 0.0
+    draft_cost_ratio: float = 0.0   # time of a draft forward pass / time of a target pass, measured at draft load
+
+    @property
+    def accepted_tokens(self) -> int:
+        return max(self.new_tokens - self.target_passes, 0)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted_tokens / self.draft_passes if self.draft_passes else 0.0
+
+    @property
+    def tokens_per_target_pass(self) -> float:
+        return self.new_tokens / self.target_passes if self.target_passes else 0.0
+
+    @property
+    def estimated_speedup(self) -> float:
+        """
+        Plain greedy cost (new_tokens target passes) over the assisted cost in target pass units - an estimate:
+        pass times differ with the sequence length and verification passes take several tokens at once
+        """
+        return _estimated_speedup(self.new_tokens, self.target_passes, self.draft_passes, self.draft_cost_ratio)
+
+
+def _estimated_speedup(new_tokens: int, target_passes: int, draft_passes: int, draft_cost_ratio: float) -> float:
+    cost = target_passes + draft_passes * draft_cost_ratio
+    return new_tokens / cost if cost else 0.0
+
+
+@dataclass
+class _AssistedTotals:
+    requests: int = 0
+    new_tokens: int = 0
+    target_passes: int = 0
+    draft_passes: int = 0
+    draft_cost_ratio: float = 0.0
+
+    def add(self, stats: AssistedStats):
+        self.requests += 1
+        self.new_tokens += stats.new_tokens
+        self.target_passes += stats.target_passes
+        self.draft_passes += stats.draft_passes
+        self.draft_cost_ratio = stats.draft_cost_ratio
+
+
+@dataclass
+class _PromptPrefix:
+    text: str                       # formatted (chat template applied) prefix text
+    input_ids: torch.Tensor         # [1, prefix_len]
+    past_key_values: DynamicCache   # KV cache after prefill of input_ids, never mutated - copied per request
+
+
 class LocalHFClient(BaseLLMClient):
-    def __init__(self):
+    def __init__(self,
+                 inference_profile: Optional[str] = None,
+                 num_threads: Optional[int] = None,
+                 draft_models: Optional[Dict[str, str]] = None):
         super().__init__()
 
         # Login to Hugging Face Hub before loading models/tokenizers
-        hf_token = get_settings().HG_API_KEY
-        login(token=hf_token)
+        settings = get_settings()
+        login(token=settings.HG_API_KEY)
+
+        self._inference_profile = inference_profile or settings.HF_INFERENCE_PROFILE
+        if self._inference_profile not in INFERENCE_PROFILES:
+            raise ValueError(f"Unknown inference profile {self._inference_profile}, use one of {INFERENCE_PROFILES}")
 
+        # pin intra-op threads, e.g. to half of the cores when two models share a box
+        num_threads = num_threads or settings.HF_NUM_THREADS
+        if num_threads:
+            torch.set_num_threads(num_threads)
 
-    def _generate_text(self, prompt: str, model: str, max_new_tokens: int = 500, temperature: float = 0.7) -> str:
-        self.tokenizer = AutoTokenizer.from_pretrained(model)
-        self.model = AutoModelForCausalLM.from_pretrained(model)
-        self.model.eval()
+        self._max_new_tokens = settings.HF_MAX_NEW_TOKENS
+        self._models: Dict[str, Tuple[AutoTokenizer, AutoModelForCausalLM]] = {}     # loaded once per model name
+        self._forward_counters: Dict[str, _ForwardCounter] = {}
+
+        # assisted decoding: target model -> small draft model of the same tokenizer, loaded into _models on first use
+        self._draft_models: Dict[str, str] = dict(settings.HF_DRAFT_MODELS if draft_models is None else draft_models)
+        self._compatible_drafts: Dict[str, bool] = {}
+        self._draft_cost_ratios: Dict[str, float] = {}      # target model -> draft/target forward pass time
+        self._assisted_totals: Dict[str, _AssistedTotals] = defaultdict(_AssistedTotals)
+        self.last_assisted_stats: Optional[AssistedStats] = None
+
+        # precomputed KV caches of static prompt prefixes (system message, activity example)
+        self.prefix_cache_enabled = settings.HF_PREFIX_CACHE_ENABLED
+        self._prefixes: Dict[str, List[_PromptPrefix]] = {}
 
         # Move to GPU if available
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
 
-        # Assign pad_token if missing
-        if self.tokenizer.pad_token is None:
-            if self.tokenizer.eos_token is not None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
 
-        prompt_formatted = self.tokenizer.apply_chat_template(prompt, tokenize=False, add_generation_prompt=True)
+    def _load_model(self, model: str) -> Tuple[AutoTokenizer, AutoModelForCausalLM]:
+        if model not in self._models:
+            logger.info(f"Loading {model} to {self.device} with '{self._inference_profile}' profile...")
+            tokenizer = AutoTokenizer.from_pretrained(model)
+            hf_model = AutoModelForCausalLM.from_pretrained(model, torch_dtype=self._model_dtype(), low_cpu_mem_usage=True)
+            hf_model.eval()
+            hf_model.to(self.device)
+
+            if self._inference_profile == "int8" and self.device.type == "cpu":
+                # in place: a quantized copy would hold the fp32 weights twice at the peak of the load
+                hf_model = torch.ao.quantization.quantize_dynamic(hf_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+            # Assign pad_token if missing
+            if tokenizer.pad_token is None:
+                if tokenizer.eos_token is not None:
+                    tokenizer.pad_token = tokenizer.eos_token
+
+            self._models[model] = (tokenizer, hf_model)
+            self._forward_counters[model] = _ForwardCounter(hf_model)
+
+        return self._models[model]
+
+    def register_draft(self, model: str, draft_model: str) -> None:
+        self._draft_models[model] = draft_model
+        self._compatible_drafts.pop(model, None)
+        self._draft_cost_ratios.pop(model, None)
+
+    def _load_draft(self, model: str) -> Optional[str]:
+        """
+        Draft model name of the target, None when there is none or its vocabulary differs from the target one
+        """
+        draft_model = self._draft_models.get(model)
+        if not draft_model:
+            return None
+        if model not in self._compatible_drafts:
+            tokenizer, _ = self._load_model(model)
+            draft_tokenizer, _ = self._load_model(draft_model)
+            compatible = draft_tokenizer.get_vocab() == tokenizer.get_vocab()
+            if not compatible:
+                logger.warning(f"Draft model {draft_model} has another tokenizer than {model}, assisted decoding is off")
+            else:
+                self._draft_cost_ratios[model] = self._measure_draft_cost_ratio(model, draft_model)
+            self._compatible_drafts[model] = compatible
+        return draft_model if self._compatible_drafts[model] else None
 
-        inputs = self.tokenizer(prompt_formatted, return_tensors="pt", padding=True, truncation=True)
-        input_ids = inputs["input_ids"].to(self.device)
-        attention_mask = inputs["attention_mask"].to(self.device)
+    def _measure_draft_cost_ratio(self, model: str, draft_model: str) -> float:
+        """
+        Time of one single-token forward pass with a short context, draft over target: the cost of a proposed
+        token in target passes. One warm-up pass, then the median of 3
+        """
+        tokenizer, _ = self._load_model(model)
+        input_ids = self._tokenize(tokenizer, "Vital signs, hematology and informed consent at screening")
 
-        eos_token_id = self.tokenizer.eos_token_id or self.tokenizer.pad_token_id or 0
-        pad_token_id = self.tokenizer.pad_token_id or eos_token_id or 0
+        def pass_time(name: str) -> float:
+            _, hf_model = self._load_model(name)
+            times = []
+            with torch.inference_mode():
+                for _ in range(4):
+                    start_time = time.perf_counter()
+                    hf_model(input_ids=input_ids)
+                    times.append(time.perf_counter() - start_time)
+            self._forward_counters[name].take()
+            return statistics.median(times[1:])
+
+        ratio = pass_time(draft_model) / pass_time(model)
+        logger.info(f"Draft model {draft_model} forward pass costs {ratio:.2f} of a {model} pass")
+        return ratio
+
+    def _model_dtype(self) -> torch.dtype:
+        if self._inference_profile == "bf16":
+            if self.device.type == "cuda" or _cpu_supports_bf16():
+                return torch.bfloat16
+            logger.warning("CPU has no native bf16 support, falling back to fp32")
+        return torch.float32
+
+    def _format_prompt(self, tokenizer, prompt) -> str:
+        # prompt is a list of chat messages, a plain string is sent as a single user message
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def _tokenize(self, tokenizer, text: str) -> torch.Tensor:
+        # the chat template already contains BOS and other special tokens
+        return tokenizer(text, return_tensors="pt", add_special_tokens=False)["input_ids"].to(self.device)
+
+    def register_prefix(self, model: str, messages: list, placeholder: str) -> None:
+        tokenizer, hf_model = self._load_model(model)
+        prompt_formatted = self._format_prompt(tokenizer, messages)
+        if placeholder not in prompt_formatted:
+            raise ValueError(f"Placeholder {placeholder!r} is not found in the prompt")
+
+        prefix_text = prompt_formatted.split(placeholder)[0]
+        if any(p.text == prefix_text for p in self._prefixes.get(model, [])):
+            return
+
+        prefix_ids = self._tokenize(tokenizer, prefix_text)
+        start_time = time.time()
+        with torch.inference_mode():
+            outputs = hf_model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+
+        self._prefixes.setdefault(model, []).append(
+            _PromptPrefix(text=prefix_text, input_ids=prefix_ids, past_key_values=outputs.past_key_values)
+        )
+        logger.info(f"Prefix of {prefix_ids.shape[1]} tokens cached for {model} in {(time.time() - start_time):.2f}s")
+
+    def _find_prefix(self, model: str, prompt_formatted: str) -> Optional[_PromptPrefix]:
+        if not self.prefix_cache_enabled:
+            return None
+        matches = [p for p in self._prefixes.get(model, []) if prompt_formatted.startswith(p.text)]
+        return max(matches, key=lambda p: len(p.text)) if matches else None
+
+    @staticmethod
+    def _starts_with(input_ids: torch.Tensor, prefix_ids: torch.Tensor) -> bool:
+        prefix_len = prefix_ids.shape[-1]
+        return input_ids.shape[-1] > prefix_len and torch.equal(input_ids[..., :prefix_len], prefix_ids)
+
+    def _generation_kwargs(self, tokenizer, model: str, prompt, max_new_tokens: Optional[int], temperature: float,
+                           greedy: bool = False, draft_model: Optional[str] = None) -> dict:
+        prompt_formatted = self._format_prompt(tokenizer, prompt)
+
+        kwargs = {}
+        input_ids = self._tokenize(tokenizer, prompt_formatted)
+        prefix = self._find_prefix(model, prompt_formatted)
+        if prefix and self._starts_with(input_ids, prefix.input_ids):
+            # prefill only the tokens after the cached prefix
+            with torch.inference_mode():
+                kwargs["past_key_values"] = copy.deepcopy(prefix.past_key_values)
+            logger.debug(f" Reusing cached prefix of {prefix.input_ids.shape[1]} tokens")
+        elif prefix:
+            # BPE merged tokens across the prefix boundary, the cached state is not of this input
+            logger.debug(" Prompt tokens do not start with the cached prefix, prefilling the whole prompt")
+
+        eos_token_id = tokenizer.eos_token_id or tokenizer.pad_token_id or 0
+        pad_token_id = tokenizer.pad_token_id or eos_token_id or 0
+
+        kwargs.update(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=max_new_tokens or self._max_new_tokens,
+            pad_token_id=pad_token_id,
+            eos_token_id=eos_token_id,
+        )
+        if draft_model:
+            # greedy verification keeps the output token for token the same as plain greedy decoding of the target
+            # (the target prefix cache is used as is, the draft prefills the whole prompt on its own)
+            kwargs.update(assistant_model=self._load_model(draft_model)[1], do_sample=False)
+        elif greedy:
+            kwargs.update(do_sample=False)
+        else:
+            kwargs.update(temperature=temperature, do_sample=True)
+        return kwargs
+
+    def _run_generate(self, hf_model, model: str, draft_model: Optional[str], kwargs: dict) -> torch.Tensor:
+        """
+        model.generate() with forward passes of the target and the draft counted, in the calling (generating) thread
+        """
+        counters = [self._forward_counters[model]] + ([self._forward_counters[draft_model]] if draft_model else [])
+        for counter in counters:
+            counter.take()
+
+        start_time = time.perf_counter()
+        with torch.inference_mode():
+            output_ids = hf_model.generate(**kwargs)
+        elapsed = time.perf_counter() - start_time
+        new_tokens = output_ids.shape[-1] - kwargs["input_ids"].shape[-1]
+
+        target_passes = counters[0].take()
+        if not draft_model:
+            return output_ids
+
+        stats = AssistedStats(draft_model, new_tokens, target_passes, counters[1].take(), elapsed,
+                              self._draft_cost_ratios.get(model, 0.0))
+        self.last_assisted_stats = stats
+        self._assisted_totals[model].add(stats)
+        logger.info(
+            f" Assisted by {draft_model}: {new_tokens} tokens in {target_passes} target passes "
+            f"({stats.tokens_per_target_pass:.2f} tokens/pass), acceptance {stats.acceptance_rate:.0%} "
+            f"of {stats.draft_passes} draft tokens, est. speedup x{stats.estimated_speedup:.2f} "
+            f"(draft pass = {stats.draft_cost_ratio:.2f} target pass), {elapsed:.2f}s"
+        )
+        return output_ids
+
+    def metrics(self) -> Dict:
+        result = {}
+        for model, totals in self._assisted_totals.items():
+            accepted = max(totals.new_tokens - totals.target_passes, 0)
+            result[model] = {
+                "assisted_requests": totals.requests,
+                "acceptance_rate": round(accepted / totals.draft_passes, 3) if totals.draft_passes else 0.0,
+                "tokens_per_target_pass": round(totals.new_tokens / totals.target_passes, 2) if totals.target_passes else 0.0,
+                # in target pass units with the draft cost ratio measured at load, not a wall time ratio
+                "estimated_speedup": round(_estimated_speedup(totals.new_tokens, totals.target_passes,
+                                                              totals.draft_passes, totals.draft_cost_ratio), 2),
+            }
+        return result
+
+    def _generate_text(self, prompt, model: str, max_new_tokens: Optional[int] = None, temperature: float = 0.7,
+                       greedy: bool = False, assisted: bool = True) -> str:
+        tokenizer, hf_model = self._load_model(model)
+        draft_model = self._load_draft(model) if assisted else None
+        kwargs = self._generation_kwargs(tokenizer, model, prompt, max_new_tokens, temperature, greedy, draft_model)
+        input_ids = kwargs["input_ids"]
 
         logger.debug(f" Start LLM generation for  {input_ids.shape[1]} input tokens...wait...")
-        with torch.no_grad():
-            output_ids = self.model.generate(
-                input_ids,
-                attention_mask=attention_mask,
-                #max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                do_sample=True,
-                pad_token_id=pad_token_id,
-                eos_token_id=eos_token_id,
-            )
+        output_ids = self._run_generate(hf_model, model, draft_model, kwargs)
 
         output_ids_stripped = output_ids[0][input_ids.shape[-1]:]       # remove input from context
-        generated_text = self.tokenizer.decode(output_ids_stripped, skip_special_tokens=True)
+        generated_text = tokenizer.decode(output_ids_stripped, skip_special_tokens=True)
         return generated_text
 
+    def _start_streaming(self, prompt, model: str, max_new_tokens: Optional[int], stop_event: threading.Event,
+                         temperature: float = 0.7) -> Tuple[TextIteratorStreamer, threading.Thread, List[BaseException]]:
+        tokenizer, hf_model = self._load_model(model)
+        draft_model = self._load_draft(model)
+        kwargs = self._generation_kwargs(tokenizer, model, prompt, max_new_tokens, temperature, draft_model=draft_model)
+
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        kwargs.update(streamer=streamer, stopping_criteria=StoppingCriteriaList([_StopEventCriteria(stop_event)]))
+        errors: List[BaseException] = []
+
+        def run():
+            try:
+                self._run_generate(hf_model, model, draft_model, kwargs)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                # generate() ends the streamer only when it completes, without it the consumer waits forever
+                streamer.end()
+
+        logger.debug(f" Start streaming LLM generation for  {kwargs['input_ids'].shape[1]} input tokens...")
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return streamer, thread, errors
+
     async def _make_generate_request(self, prompt: str, model: str) -> str:
         return self._generate_text(prompt, model)
 
@@ -67,7 +404,7 @@ class LocalHFClient(BaseLLMClient):
             chat_prompt += f"{msg['role'].capitalize()}: {msg['content']}\n"
         chat_prompt += f"User: {prompt}\nAssistant:"
 
-        return self._generate_text(chat_prompt)
+        return self._generate_text(chat_prompt, model)
 
     async def generate(self, operation: str, model: str, prompt: str, image: Optional[str] = None):
         return await self._measure_request(
@@ -85,3 +422,38 @@ class LocalHFClient(BaseLLMClient):
             prompt=prompt,
             history=history,
         )
+
+    async def stream_generate(self, operation: str, model: str, prompt: str, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        # timing and error logging of _measure_request, for the whole stream
+        loop = asyncio.get_running_loop()
+        stop_event = threading.Event()
+
+        start_time = time.time()
+        logger.info(f"[{operation.upper()}] LLM streaming request to {model} started")
+        thread = None
+        chunks_count = 0
+        try:
+            streamer, thread, errors = await loop.run_in_executor(
+                None, self._start_streaming, prompt, model, max_new_tokens, stop_event
+            )
+            while True:
+                chunk = await loop.run_in_executor(None, next, streamer, None)
+                if chunk is None:
+                    break
+                if chunks_count == 0:
+                    logger.info(f"[{operation.upper()}] First token in {(time.time() - start_time):.2f}s")
+                chunks_count += 1
+                yield chunk
+
+            await loop.run_in_executor(None, thread.join)
+            if errors:
+                raise errors[0]
+            logger.info(f"[{operation.upper()}] Success, streamed {chunks_count} chunks in {(time.time() - start_time):.2f}s")
+        except Exception as e:
+            logger.exception(f"[{operation.upper()}] Unexpected error after {chunks_count} chunks: {str(e)}")
+            raise Exception(f"API unexpected error: {str(e)}")
+        finally:
+            # consumer is done (or closed the iterator early) - stop generation instead of burning CPU
+            stop_event.set()
+            if thread is not None:
+                await loop.run_in_executor(None, thread.join)
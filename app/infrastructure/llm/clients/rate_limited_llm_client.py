@@ -0,0 +1,109 @@
+import asyncio
+import time
+from typing import Optional, AsyncIterator, Dict
+
+from loguru import logger
+
+from app.infrastructure.llm.clients.base_llm_client import BaseLLMClient, RateLimitedError
+from app.infrastructure.llm.rate_limiter import RateLimiter
+
+
+def estimate_tokens(text) -> int:
+    # ~4 characters per token, good enough for budgeting
+    return max(1, len(str(text)) // 4)
+
+
+class RateLimitedLLMClient(BaseLLMClient):
+    """
+    Wraps a client of a hosted provider: every request passes the provider's RateLimiter (RPM/TPM budget,
+    adaptive concurrency) and is retried on 429/503 after Retry-After or exponential backoff
+    """
+    def __init__(self, client: BaseLLMClient, limiter: RateLimiter, expected_output_tokens: int = 512):
+        super().__init__()
+        self._client = client
+        self._limiter = limiter
+        self._expected_output_tokens = expected_output_tokens
+
+    async def _call(self, operation: str, prompt, call):
+        estimated_tokens = estimate_tokens(prompt) + self._expected_output_tokens
+        for attempt in range(self._limiter.max_retries + 1):
+            await self._limiter.acquire(estimated_tokens)
+            start_time = time.monotonic()
+            try:
+                result = await call()
+            except RateLimitedError as e:
+                await self._limiter.release(None, throttled=True, started_at=start_time)
+                if attempt == self._limiter.max_retries:
+                    raise
+                delay_s = self._limiter.backoff(attempt, e.retry_after_s)
+                logger.warning(f"[{operation.upper()}] Throttled ({e.status_code}), retry {attempt + 1} in {delay_s:.1f}s")
+                await asyncio.sleep(delay_s)
+                continue
+            except BaseException:
+                await self._limiter.release(None)
+                raise
+
+            # charge what the answer really took over the estimate
+            extra_tokens = estimate_tokens(result) - self._expected_output_tokens
+            await self._limiter.release(time.monotonic() - start_time, extra_tokens=max(0, extra_tokens), started_at=start_time)
+            return result
+
+    def register_prefix(self, model: str, messages: list, placeholder: str) -> None:
+        self._client.register_prefix(model, messages, placeholder)
+
+    async def generate(self, operation: str, model: str, prompt: str, image: Optional[str] = None):
+        return await self._call(
+            operation, prompt,
+            lambda: self._client.generate(operation=operation, model=model, prompt=prompt, image=image)
+        )
+
+    async def chat(self, operation: str, model: str, prompt: str, history: Optional[list] = None, image: Optional[str] = None):
+        return await self._call(
+            operation, [prompt, history],
+            lambda: self._client.chat(operation=operation, model=model, prompt=prompt, history=history, image=image)
+        )
+
+    async def stream_generate(self, operation: str, model: str, prompt: str, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Retried only until the first chunk arrives
+        """
+        estimated_tokens = estimate_tokens(prompt) + self._expected_output_tokens
+        for attempt in range(self._limiter.max_retries + 1):
+            await self._limiter.acquire(estimated_tokens)
+            start_time = time.monotonic()
+            stream = self._client.stream_generate(operation=operation, model=model, prompt=prompt, max_new_tokens=max_new_tokens)
+            try:
+                first_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                await self._limiter.release(time.monotonic() - start_time, started_at=start_time)
+                return
+            except RateLimitedError as e:
+                await stream.aclose()
+                await self._limiter.release(None, throttled=True, started_at=start_time)
+                if attempt == self._limiter.max_retries:
+                    raise
+                await asyncio.sleep(self._limiter.backoff(attempt, e.retry_after_s))
+                continue
+            except BaseException:
+                await stream.aclose()
+                await self._limiter.release(None)
+                raise
+
+            output_chars, failed = len(first_chunk), False
+            try:
+                yield first_chunk
+                async for chunk in stream:
+                    output_chars += len(chunk)
+                    yield chunk
+            except Exception:
+                failed = True
+                raise
+            finally:
+                await stream.aclose()
+                extra_tokens = max(0, output_chars // 4 - self._expected_output_tokens)
+                await self._limiter.release(None if failed else time.monotonic() - start_time, extra_tokens=extra_tokens,
+                                           started_at=start_time)
+            return
+
+    def metrics(self) -> Dict:
+        return {**self._limiter.metrics.as_dict(), **self._client.metrics()}
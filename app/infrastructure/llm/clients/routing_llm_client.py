@@ -0,0 +1,182 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional, List, AsyncIterator, Dict, Set
+
+from loguru import logger
+
+from app.infrastructure.llm.clients.base_llm_client import BaseLLMClient
+
+
+@dataclass
+class LLMBackend:
+    name: str
+    client: BaseLLMClient
+    max_concurrency: int = 1
+    model: Optional[str] = None             # model name on this backend, the requested one when not set
+
+    in_flight: int = 0
+    ewma_latency_s: Optional[float] = None
+    requests: int = 0
+    failures: int = 0
+    unhealthy_until: float = 0.0            # monotonic time, backend is skipped after a failure until then
+
+
+class RoutingLLMClient(BaseLLMClient):
+    """
+    One client over a pool of backends (local HF workers, Ollama, remote APIs).
+    Each request goes to the backend with the lowest expected latency - EWMA latency x (in-flight + 1) -
+    among those below their concurrency cap; a request waits when every backend is full.
+    A failed or timed out request is retried on the next best backend, the failed one cools down for a while.
+    """
+    def __init__(self,
+                 backends: List[LLMBackend],
+                 request_timeout_s: Optional[float] = None,
+                 cooldown_s: float = 30.0,
+                 ewma_alpha: float = 0.3,
+                 default_latency_s: float = 1.0):
+        super().__init__()
+        if not backends:
+            raise ValueError("RoutingLLMClient needs at least one backend")
+        self._backends = backends
+        self._request_timeout_s = request_timeout_s
+        self._cooldown_s = cooldown_s
+        self._ewma_alpha = ewma_alpha
+        self._default_latency_s = default_latency_s     # assumed for backends without requests yet
+        self._slot_freed = asyncio.Condition()
+
+    # ---------- backend selection ----------
+
+    def _expected_latency(self, backend: LLMBackend) -> float:
+        latency = backend.ewma_latency_s if backend.ewma_latency_s is not None else self._default_latency_s
+        return latency * (backend.in_flight + 1)
+
+    def _pick(self, exclude: Set[str]) -> Optional[LLMBackend]:
+        now = time.monotonic()
+        candidates = [b for b in self._backends if b.name not in exclude]
+        # when every backend has failed recently, still try the cooling ones instead of failing the request
+        healthy = [b for b in candidates if b.unhealthy_until <= now] or candidates
+        free = [b for b in healthy if b.in_flight < b.max_concurrency]
+        return min(free, key=self._expected_latency) if free else None
+
+    async def _acquire(self, exclude: Set[str]) -> Optional[LLMBackend]:
+        async with self._slot_freed:
+            while True:
+                if all(b.name in exclude for b in self._backends):
+                    return None
+                backend = self._pick(exclude)
+                if backend is not None:
+                    backend.in_flight += 1
+                    return backend
+                await self._slot_freed.wait()
+
+    async def _release(self, backend: LLMBackend, latency_s: Optional[float]):
+        async with self._slot_freed:
+            backend.in_flight -= 1
+            backend.requests += 1
+            if latency_s is None:
+                backend.failures += 1
+                backend.unhealthy_until = time.monotonic() + self._cooldown_s
+            elif backend.ewma_latency_s is None:
+                backend.ewma_latency_s = latency_s
+            else:
+                backend.ewma_latency_s += self._ewma_alpha * (latency_s - backend.ewma_latency_s)
+            self._slot_freed.notify_all()
+
+    async def _route(self, operation: str, model: str, call):
+        """
+        call(backend, model) -> awaitable; tried on backends in order of expected latency until one succeeds
+        """
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while (backend := await self._acquire(tried)) is not None:
+            tried.add(backend.name)
+            start_time = time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(backend, backend.model or model), self._request_timeout_s)
+            except asyncio.CancelledError:
+                # the caller gave up - free the slot without counting it as a backend failure
+                asyncio.ensure_future(self._release(backend, time.monotonic() - start_time))
+                raise
+            except Exception as e:
+                await self._release(backend, None)
+                last_error = e
+                logger.warning(f"[{operation.upper()}] Backend {backend.name} failed ({type(e).__name__}: {e}), failing over")
+                continue
+            await self._release(backend, time.monotonic() - start_time)
+            return result
+
+        raise Exception(f"All LLM backends failed: {last_error}")
+
+    # ---------- BaseLLMClient ----------
+
+    def register_prefix(self, model: str, messages: list, placeholder: str) -> None:
+        for backend in self._backends:
+            backend.client.register_prefix(backend.model or model, messages, placeholder)
+
+    async def generate(self, operation: str, model: str, prompt: str, image: Optional[str] = None):
+        return await self._route(
+            operation, model,
+            lambda backend, backend_model: backend.client.generate(operation=operation, model=backend_model, prompt=prompt, image=image)
+        )
+
+    async def chat(self, operation: str, model: str, prompt: str, history: Optional[list] = None, image: Optional[str] = None):
+        return await self._route(
+            operation, model,
+            lambda backend, backend_model: backend.client.chat(operation=operation, model=backend_model, prompt=prompt, history=history, image=image)
+        )
+
+    async def stream_generate(self, operation: str, model: str, prompt: str, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Fails over only until the first chunk arrives - after that the output is already consumed and the error is raised
+        """
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while (backend := await self._acquire(tried)) is not None:
+            tried.add(backend.name)
+            start_time = time.monotonic()
+            stream = backend.client.stream_generate(
+                operation=operation, model=backend.model or model, prompt=prompt, max_new_tokens=max_new_tokens
+            )
+            try:
+                first_chunk = await asyncio.wait_for(stream.__anext__(), self._request_timeout_s)
+            except StopAsyncIteration:
+                await self._release(backend, time.monotonic() - start_time)
+                return
+            except Exception as e:
+                await stream.aclose()
+                await self._release(backend, None)
+                last_error = e
+                logger.warning(f"[{operation.upper()}] Backend {backend.name} failed ({type(e).__name__}: {e}), failing over")
+                continue
+
+            failed = False
+            try:
+                yield first_chunk
+                async for chunk in stream:
+                    yield chunk
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # closed early by the consumer counts as success
+                await stream.aclose()
+                await self._release(backend, None if failed else time.monotonic() - start_time)
+            return
+
+        raise Exception(f"All LLM backends failed: {last_error}")
+
+    def metrics(self) -> Dict:
+        return {"backends": self.stats()}
+
+    def stats(self) -> List[Dict]:
+        return [
+            {
+                "backend": b.name,
+                "in_flight": b.in_flight,
+                "ewma_latency_s": b.ewma_latency_s,
+                "requests": b.requests,
+                "failures": b.failures,
+            }
+            for b in self._backends
+        ]
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Optional, AsyncIterator, List
+
+import httpx
+
+from app.infrastructure.llm.clients.base_llm_client import RateLimitedError, parse_retry_after
+from app.infrastructure.llm.clients.rate_limited_llm_client import estimate_tokens
+from app.infrastructure.llm.clients.stub_llm_client import StubLLMClient
+
+
+# one activity per table row, about the size of a real one
+DEFAULT_ACTIVITY = {
+    "id": "NA", "extensionAttributes": [], "name": "ACTIVITY", "label": "NA", "description": "NA",
+    "previousId": None, "nextId": None, "childIds": [], "definedProcedures": [], "biomedicalConceptIds": [],
+    "bcCategoryIds": [], "bcSurrogateIds": [], "timelineId": None, "notes": [], "instanceType": "Activity",
+}
+
+
+@dataclass
+class SimulationProfile:
+    """
+    Latency model of an LLM server: prompt prefill at one token rate, generation at another,
+    `max_concurrency` requests decoded together (continuous batching) each slower by `batch_slowdown` per extra request
+    """
+    overhead_s: float = 0.05                # network + scheduling, before prefill
+    prefill_tokens_per_s: float = 500.0
+    decode_tokens_per_s: float = 20.0       # of one request decoded alone
+    jitter: float = 0.1                     # +- fraction of every delay
+    max_concurrency: int = 1                # requests decoded at the same time, the rest wait in the server queue
+    batch_slowdown: float = 0.0             # e.g. 0.1 - every extra request in the batch slows decoding by 10%
+    max_queue: Optional[int] = None         # requests waiting beyond it get 429
+    throttle_rate: float = 0.0              # random 429s, e.g. a shared provider quota
+    retry_after_s: float = 1.0
+    error_rate: float = 0.0                 # random 500s
+    chunk_tokens: int = 4                   # tokens per streamed chunk
+
+
+def _prompt_text(prompt) -> str:
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(str(message.get("content", "")) for message in prompt)
+
+
+def table_row_numbers(prompt_text: str) -> List[int]:
+    """
+    Row numbers of a conversion prompt: "- [3] name: V1" lines of a compact table or the "row" column of the CSV
+    """
+    if "\nActivities:\n" in prompt_text:
+        lines = prompt_text.split("\nActivities:\n", 1)[1].splitlines()
+        numbers = [re.match(r"\s*- \[(\d+)\]", line) for line in lines]
+        return [int(m.group(1)) for m in numbers if m] or [1]
+    if "CSV table:" in prompt_text:
+        lines = [line.strip() for line in prompt_text.split("CSV table:", 1)[1].splitlines() if line.strip()]
+        return [int(line.split(",", 1)[0]) for line in lines[1:] if line.split(",", 1)[0].isdigit()] or [1]
+    return [1]
+
+
+class SimulatedBackendError(Exception):
+    pass
+
+
+@dataclass
+class SimulatedRequest:
+    backend: "SimulatedBackend"
+    prompt_tokens: int
+    prefill_tokens: int
+    response: str
+    queue_wait_s: float = 0.0
+    _released: bool = False
+
+    async def chunks(self) -> AsyncIterator[str]:
+        backend = self.backend
+        profile = backend.profile
+        try:
+            await asyncio.sleep(backend.jittered(profile.overhead_s + self.prefill_tokens / profile.prefill_tokens_per_s))
+            chunk_chars = max(profile.chunk_tokens * 4, 1)     # estimate_tokens: ~4 chars per token
+            for start in range(0, len(self.response), chunk_chars):
+                chunk = self.response[start:start + chunk_chars]
+                rate = profile.decode_tokens_per_s / (1 + profile.batch_slowdown * (backend.running - 1))
+                await asyncio.sleep(backend.jittered(estimate_tokens(chunk) / rate))
+                backend.stats.output_tokens += estimate_tokens(chunk)
+                yield chunk
+        finally:
+            self.release()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.backend.release()
+
+
+@dataclass
+class BackendStats:
+    requests: int = 0
+    throttled: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    prefill_tokens: int = 0          # prompt tokens not covered by a registered prefix
+    output_tokens: int = 0
+    queue_waits: List[float] = field(default_factory=list)
+
+
+class SimulatedBackend:
+    """
+    The server side of the simulation, shared by the in-process client and the HTTP stub:
+    admission (429 / errors), a queue in front of `max_concurrency` slots, prefill and decode delays
+    """
+    def __init__(self, profile: SimulationProfile, response_item: Optional[dict] = None, seed: Optional[int] = None):
+        self.profile = profile
+        self._response_item = response_item or DEFAULT_ACTIVITY
+        self._random = random.Random(seed)
+        self._slots = asyncio.Semaphore(profile.max_concurrency)
+        self._prefixes: List[str] = []
+        self.waiting = 0
+        self.running = 0
+        self.stats = BackendStats()
+
+    def jittered(self, delay: float) -> float:
+        return max(0.0, delay * (1 + self._random.uniform(-self.profile.jitter, self.profile.jitter)))
+
+    def register_prefix(self, prefix_text: str):
+        if prefix_text and prefix_text not in self._prefixes:
+            self._prefixes.append(prefix_text)
+
+    @property
+    def prefixes_count(self) -> int:
+        return len(self._prefixes)
+
+    def release(self):
+        self.running -= 1
+        self._slots.release()
+
+    async def open(self, prompt) -> SimulatedRequest:
+        """
+        Admit the request and wait for a decoding slot, the slot is released when its chunks are consumed or closed
+        """
+        profile = self.profile
+        self.stats.requests += 1
+        if self._random.random() < profile.throttle_rate or (profile.max_queue is not None and self.waiting >= profile.max_queue):
+            self.stats.throttled += 1
+            raise RateLimitedError("simulated 429: too many requests", 429, profile.retry_after_s)
+
+        text = _prompt_text(prompt)
+        prompt_tokens = estimate_tokens(text)
+        prefix = max((p for p in self._prefixes if text.startswith(p)), key=len, default="")
+        prefill_tokens = prompt_tokens - (estimate_tokens(prefix) if prefix else 0)
+        response = "[" + ", ".join(json.dumps({**self._response_item, "row": row}) for row in table_row_numbers(text)) + "]"
+
+        start_time = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        queue_wait = time.perf_counter() - start_time
+        self.stats.queue_waits.append(queue_wait)
+        self.stats.prompt_tokens += prompt_tokens
+        self.stats.prefill_tokens += prefill_tokens
+
+        if self._random.random() < profile.error_rate:
+            self.stats.errors += 1
+            self.release()
+            raise SimulatedBackendError("simulated 500: backend failure")
+        return SimulatedRequest(self, prompt_tokens, prefill_tokens, response, queue_wait)
+
+
+class SimulatedLLMClient(StubLLMClient):
+    """
+    In-process client of a SimulatedBackend: prefill/decode latency, batching, queueing, 429s and failures
+    of a real server without a model - for load tests of the conversion pipelines
+    """
+    def __init__(self, backend: SimulatedBackend, name: str = "simulated"):
+        super().__init__(name=name, latency_s=0.0)
+        self._backend = backend
+
+    def register_prefix(self, model: str, messages: list, placeholder: str) -> None:
+        self._backend.register_prefix(_prompt_text(messages).split(placeholder)[0])
+
+    async def _make_generate_request(self, prompt, model: str) -> str:
+        return "".join([chunk async for chunk in self.stream_generate("generate", model, prompt)])
+
+    async def stream_generate(self, operation: str, model: str, prompt, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        self.calls += 1
+        request = await self._backend.open(prompt)
+        try:
+            async for chunk in request.chunks():
+                yield chunk
+        finally:
+            # the consumer may stop early (all activities parsed), the slot must not wait for the generator GC
+            request.release()
+
+    def metrics(self) -> dict:
+        stats = self._backend.stats
+        return {"requests": stats.requests, "throttled": stats.throttled, "errors": stats.errors,
+                "prompt_tokens": stats.prompt_tokens, "prefill_tokens": stats.prefill_tokens,
+                "output_tokens": stats.output_tokens}
+
+    @property
+    def queue_waits(self) -> List[float]:
+        return self._backend.stats.queue_waits
+
+
+class SimulatedHttpLLMClient(StubLLMClient):
+    """
+    Client of the HTTP stub (simulated_llm_server.py) - OpenAI style /v1/chat/completions with SSE streaming,
+    so the load test also covers HTTP, connection pooling and 429 handling
+    """
+    def __init__(self, base_url: str, name: str = "simulated_http", timeout_s: float = 600.0, max_connections: int = 100):
+        super().__init__(name=name, latency_s=0.0)
+        self._base_url = base_url.rstrip("/")
+        self._client = httpx.AsyncClient(
+            timeout=timeout_s, limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.queue_waits: List[float] = []
+
+    def register_prefix(self, model: str, messages: list, placeholder: str) -> None:
+        # sync API of BaseLLMClient, the stub takes it as a plain blocking call
+        httpx.post(f"{self._base_url}/v1/prefixes", json={"prefix": _prompt_text(messages).split(placeholder)[0]})
+
+    async def _make_generate_request(self, prompt, model: str) -> str:
+        return "".join([chunk async for chunk in self.stream_generate("generate", model, prompt)])
+
+    async def stream_generate(self, operation: str, model: str, prompt, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        self.calls += 1
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        payload = {"model": model, "messages": messages, "stream": True, "max_tokens": max_new_tokens}
+        async with self._client.stream("POST", f"{self._base_url}/v1/chat/completions", json=payload) as response:
+            if response.status_code == 429:
+                raise RateLimitedError("HTTP 429 from the stub", 429, parse_retry_after(response.headers.get("Retry-After")))
+            if response.status_code >= 400:
+                raise SimulatedBackendError(f"HTTP {response.status_code} from the stub")
+            self.queue_waits.append(float(response.headers.get("X-Queue-Wait", 0.0)))
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    return
+                content = json.loads(data)["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,56 @@
+import asyncio
+import random
+from typing import Optional, AsyncIterator
+
+from app.infrastructure.llm.clients.base_llm_client import BaseLLMClient
+
+
+class StubLLMClient(BaseLLMClient):
+    """
+    Local stand-in for a real backend: fixed response after a (jittered) delay, optional random failures.
+    For router / pipeline tests without a model.
+    """
+    def __init__(self,
+                 name: str = "stub",
+                 latency_s: float = 0.1,
+                 jitter_s: float = 0.0,
+                 failure_rate: float = 0.0,
+                 response: str = '{"name": "STUB_ACTIVITY", "instanceType": "Activity"}',
+                 chunk_size: int = 8,
+                 seed: Optional[int] = None):
+        super().__init__()
+        self.name = name
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.failure_rate = failure_rate
+        self.response = response
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency_s + self._random.uniform(-self.jitter_s, self.jitter_s))
+
+    async def _make_generate_request(self, prompt: str, model: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        if self._random.random() < self.failure_rate:
+            raise RuntimeError(f"{self.name}: simulated backend failure")
+        return self.response
+
+    async def generate(self, operation: str, model: str, prompt: str, image: Optional[str] = None):
+        return await self._measure_request(
+            operation=operation,
+            model=model,
+            func=self._make_generate_request,
+            prompt=prompt,
+        )
+
+    async def chat(self, operation: str, model: str, prompt: str, history: Optional[list] = None, image: Optional[str] = None):
+        return await self.generate(operation=operation, model=model, prompt=prompt)
+
+    async def stream_generate(self, operation: str, model: str, prompt: str, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        text = await self._make_generate_request(prompt, model)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+            await asyncio.sleep(0)
@@ -1,17 +1,22 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, List
 
 from loguru import logger
 
+from app.core.settings import get_settings
 from app.models.provider_schema import LLMProvider
 from app.infrastructure.llm.clients.base_llm_client import BaseLLMClient
 from app.infrastructure.llm.clients.deepseek_client import DeepSeekClient
 from app.infrastructure.llm.clients.ollama_client import OllamaClient
 from app.infrastructure.llm.clients.local_hf_client import LocalHFClient
+from app.infrastructure.llm.clients.routing_llm_client import RoutingLLMClient, LLMBackend
+from app.infrastructure.llm.clients.rate_limited_llm_client import RateLimitedLLMClient
+from app.infrastructure.llm.rate_limiter import RateLimiter, AimdConcurrencyLimiter
 
 
 class LLMClientFactory:
     def __init__(self):
         self._llm_providers: Dict[str, BaseLLMClient] = {}      # this is a singleton cache for providers
+        self._rate_limited: Dict[str, RateLimitedLLMClient] = {}  # one limiter per provider, shared by all users
         self._default_llm_provider = LLMProvider.ollama
 
 
@@ -32,5 +37,59 @@ class LLMClientFactory:
 
         return self._llm_providers[current_provider.value]
 
+
+    def limited(self, provider: LLMProvider) -> BaseLLMClient:
+        """
+        Provider client behind its rate limiter when LLM_RATE_LIMITS has an entry for it, the plain client otherwise
+        """
+        limits = get_settings().LLM_RATE_LIMITS.get(provider.value)
+        if limits is None:
+            return self.of(provider)
+
+        if provider.value not in self._rate_limited:
+            limiter = RateLimiter(
+                requests_per_minute=limits.get("rpm"),
+                tokens_per_minute=limits.get("tpm"),
+                concurrency=AimdConcurrencyLimiter(
+                    initial=int(limits.get("initial_concurrency", 2)),
+                    maximum=int(limits.get("max_concurrency", 32)),
+                    latency_target_s=limits.get("latency_target_s"),
+                ),
+                max_retries=int(limits.get("max_retries", 5)),
+            )
+            self._rate_limited[provider.value] = RateLimitedLLMClient(self.of(provider), limiter)
+        return self._rate_limited[provider.value]
+
+
+    def router(self,
+               providers: List[LLMProvider],
+               max_concurrency: int = 1,
+               models: Optional[Dict[LLMProvider, str]] = None,
+               request_timeout_s: Optional[float] = None) -> RoutingLLMClient:
+        """
+        Routing client over the cached clients of several providers,
+        models - model name per provider when it differs from the one the caller asks for (Ollama tags etc.)
+        """
+        models = models or {}
+        backends = [
+            LLMBackend(name=provider.value, client=self.limited(provider), max_concurrency=max_concurrency, model=models.get(provider))
+            for provider in providers
+        ]
+        return RoutingLLMClient(backends, request_timeout_s=request_timeout_s)
+
+
+    def for_pipeline(self) -> BaseLLMClient:
+        """
+        Client of the conversion pipelines: router over LLM_ROUTER_PROVIDERS when configured, LLM_PROVIDER otherwise
+        """
+        settings = get_settings()
+        if not settings.LLM_ROUTER_PROVIDERS:
+            return self.limited(LLMProvider(settings.LLM_PROVIDER))
+        return self.router(
+            [LLMProvider(p) for p in settings.LLM_ROUTER_PROVIDERS],
+            max_concurrency=settings.LLM_ROUTER_MAX_CONCURRENCY,
+            request_timeout_s=settings.LLM_ROUTER_TIMEOUT_S,
+        )
+
 # instantiation here insures that we load it only once.
 llm_client_factory = LLMClientFactory()
\ No newline at end of file
@@ -0,0 +1,166 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict
+
+
+@dataclass
+class LimiterMetrics:
+    requests: int = 0
+    throttled: int = 0                  # 429/503 responses
+    retries: int = 0
+    bucket_waits: int = 0               # requests delayed by the RPM/TPM budget
+    bucket_wait_s: float = 0.0
+    concurrency_waits: int = 0          # requests delayed by the concurrency limit
+    concurrency_decreases: int = 0
+    concurrency_limit: float = 0.0
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+class TokenBucket:
+    """
+    `per_minute` units (requests or tokens) refilled continuously, burst up to `capacity`.
+    A request may take more than what is left - the bucket goes negative and the next ones wait longer.
+    """
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self._rate_per_s = per_minute / 60.0
+        self._capacity = capacity if capacity is not None else per_minute
+        self._level = self._capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self._capacity, self._level + (now - self._updated) * self._rate_per_s)
+        self._updated = now
+
+    def debit(self, amount: float):
+        self._refill()
+        self._level -= amount
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        Waits until the bucket is not in debt, takes `amount`; returns seconds waited
+        """
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            if self._level < min(amount, self._capacity):
+                wait_s = (min(amount, self._capacity) - self._level) / self._rate_per_s
+                await asyncio.sleep(wait_s)
+                waited = wait_s
+                self._refill()
+            self._level -= amount
+        return waited
+
+
+class AimdConcurrencyLimiter:
+    """
+    Additive increase / multiplicative decrease of the number of concurrent requests:
+    +1 per window of successful requests, x0.5 on throttling, x0.9 when latency goes above the target.
+    The limit is decreased at most once per congestion event: requests started before the last decrease
+    were sent under the old limit, their throttles and slow answers do not decrease it again
+    """
+    def __init__(self,
+                 initial: int = 2,
+                 minimum: int = 1,
+                 maximum: int = 32,
+                 latency_target_s: Optional[float] = None):
+        self.limit = float(initial)
+        self._minimum = minimum
+        self._maximum = maximum
+        self._latency_target_s = latency_target_s
+        self._in_flight = 0
+        self._slot_freed = asyncio.Condition()
+        self._last_decrease = float("-inf")         # time.monotonic()
+
+    async def acquire(self) -> bool:
+        """
+        Returns True when the request had to wait for a slot
+        """
+        waited = False
+        async with self._slot_freed:
+            while self._in_flight >= int(self.limit):
+                waited = True
+                await self._slot_freed.wait()
+            self._in_flight += 1
+        return waited
+
+    async def release(self, latency_s: Optional[float], throttled: bool = False, started_at: Optional[float] = None) -> bool:
+        """
+        `started_at` - time.monotonic() when the request was sent, unknown start counts as a new congestion event.
+        Returns True when the limit was decreased
+        """
+        async with self._slot_freed:
+            self._in_flight -= 1
+            decreased = False
+            slow = latency_s is not None and self._latency_target_s and latency_s > self._latency_target_s
+            if throttled or slow:
+                if started_at is None or started_at >= self._last_decrease:
+                    self.limit = max(self._minimum, self.limit * (0.5 if throttled else 0.9))
+                    self._last_decrease = time.monotonic()
+                    decreased = True
+            elif latency_s is not None:
+                self.limit = min(self._maximum, self.limit + 1.0 / self.limit)
+            self._slot_freed.notify_all()
+            return decreased
+
+
+class RateLimiter:
+    """
+    Shared by all clients of one provider: RPM and TPM buckets, AIMD concurrency, global pause after Retry-After
+    """
+    def __init__(self,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 concurrency: Optional[AimdConcurrencyLimiter] = None,
+                 max_retries: int = 5,
+                 backoff_base_s: float = 1.0):
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = concurrency or AimdConcurrencyLimiter()
+        self.max_retries = max_retries
+        self._backoff_base_s = backoff_base_s
+        self._paused_until = 0.0
+        self.metrics = LimiterMetrics(concurrency_limit=self.concurrency.limit)
+
+    async def acquire(self, estimated_tokens: int):
+        pause_s = self._paused_until - time.monotonic()
+        if pause_s > 0:
+            await asyncio.sleep(pause_s)
+
+        waited = 0.0
+        if self._requests:
+            waited += await self._requests.acquire(1)
+        if self._tokens:
+            waited += await self._tokens.acquire(estimated_tokens)
+        if waited:
+            self.metrics.bucket_waits += 1
+            self.metrics.bucket_wait_s += waited
+
+        if await self.concurrency.acquire():
+            self.metrics.concurrency_waits += 1
+        self.metrics.requests += 1
+
+    async def release(self, latency_s: Optional[float], throttled: bool = False, extra_tokens: int = 0,
+                      started_at: Optional[float] = None):
+        if throttled:
+            self.metrics.throttled += 1
+        if extra_tokens and self._tokens:
+            self._tokens.debit(extra_tokens)
+        if await self.concurrency.release(latency_s, throttled, started_at):
+            self.metrics.concurrency_decreases += 1
+        self.metrics.concurrency_limit = self.concurrency.limit
+
+    def backoff(self, attempt: int, retry_after_s: Optional[float]) -> float:
+        """
+        Delay before the retry: Retry-After when the provider sent it (applies to all requests), exponential with jitter otherwise
+        """
+        self.metrics.retries += 1
+        if retry_after_s is not None:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after_s)
+            return retry_after_s
+        return self._backoff_base_s * (2 ** attempt) * random.uniform(0.5, 1.5)
@@ -0,0 +1,70 @@
+import json
+import time
+from dataclasses import asdict
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.infrastructure.llm.clients.base_llm_client import RateLimitedError
+from app.infrastructure.llm.clients.simulated_llm_client import (
+    SimulatedBackend, SimulatedBackendError, SimulationProfile,
+)
+
+
+def create_stub_app(backend: SimulatedBackend) -> FastAPI:
+    """
+    HTTP stub of an OpenAI style LLM server backed by the SimulatedBackend:
+    POST /v1/chat/completions (stream or not), POST /v1/prefixes, GET /health
+    """
+    app = FastAPI(title="Simulated LLM server")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: dict):
+        try:
+            simulated = await backend.open(request.get("messages") or [])
+        except RateLimitedError as e:
+            return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after_s)})
+        except SimulatedBackendError as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+        headers = {"X-Queue-Wait": f"{simulated.queue_wait_s:.6f}"}
+        completion_id = f"chatcmpl-{int(time.time() * 1000)}"
+        model = request.get("model")
+
+        if not request.get("stream"):
+            content = "".join([chunk async for chunk in simulated.chunks()])
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": simulated.prompt_tokens},
+            }, headers=headers)
+
+        async def events():
+            try:
+                async for chunk in simulated.chunks():
+                    data = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                            "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(data)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                # client disconnected early - free the slot now
+                simulated.release()
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    @app.post("/v1/prefixes")
+    async def register_prefix(request: dict):
+        backend.register_prefix(request.get("prefix", ""))
+        return {"prefixes": backend.prefixes_count}
+
+    @app.get("/health")
+    async def health():
+        return {"waiting": backend.waiting, "running": backend.running, "profile": asdict(backend.profile)}
+
+    return app
+
+
+def serve(profile: SimulationProfile, host: str = "127.0.0.1", port: int = 8090, seed: Optional[int] = None):
+    uvicorn.run(create_stub_app(SimulatedBackend(profile, seed=seed)), host=host, port=port, log_level="warning")
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import Optional, List
+
+import pandas as pd
+
+
+class PageCache:
+    """
+    Per-page extraction results (pdfplumber text, camelot tables) keyed by page fingerprint,
+    so an amended protocol only re-extracts the pages that actually changed
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS page_text (
+            fingerprint TEXT PRIMARY KEY,
+            text TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS page_tables (
+            fingerprint TEXT NOT NULL,
+            flavor TEXT NOT NULL,
+            tables TEXT NOT NULL,
+            PRIMARY KEY (fingerprint, flavor)
+        );
+    """
+
+    def __init__(self, db_path: str, busy_timeout_s: float = 30.0):
+        self._db_path = Path(db_path)
+        self._busy_timeout_s = busy_timeout_s
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            # shared by the pipeline, the page scheduler workers and the service workers:
+            # WAL lets readers go on during a write, writers wait for the lock instead of failing at once
+            self._conn = sqlite3.connect(str(self._db_path), timeout=self._busy_timeout_s)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self._SCHEMA)
+        return self._conn
+
+    def get_text(self, fingerprint: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT text FROM page_text WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_text(self, fingerprint: str, text: str):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO page_text (fingerprint, text) VALUES (?, ?)", (fingerprint, text))
+        conn.commit()
+
+    def get_tables(self, fingerprint: str, flavor: str) -> Optional[List[pd.DataFrame]]:
+        row = self._connection().execute(
+            "SELECT tables FROM page_tables WHERE fingerprint = ? AND flavor = ?", (fingerprint, flavor)
+        ).fetchone()
+        if row is None:
+            return None
+        return [pd.DataFrame(t["data"], columns=t["columns"]) for t in json.loads(row[0])]
+
+    def put_tables(self, fingerprint: str, flavor: str, tables: List[pd.DataFrame]):
+        payload = json.dumps([{"columns": list(t.columns), "data": t.values.tolist()} for t in tables])
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO page_tables (fingerprint, flavor, tables) VALUES (?, ?, ?)",
+            (fingerprint, flavor, payload),
+        )
+        conn.commit()
@@ -0,0 +1,134 @@
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, List, Iterable, Tuple
+
+
+@dataclass
+class PageHit:
+    document: str
+    source: str             # pdfplumber, grobid
+    page: Optional[int]     # None when the source has no page information
+    snippet: str
+    score: float
+
+
+class PageTextIndex:
+    """
+    SQLite FTS5 full-text index of extracted pages, keyed by (document, source, page).
+    Re-indexing a document replaces only its own pages.
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER PRIMARY KEY,
+            document TEXT NOT NULL,
+            source TEXT NOT NULL,
+            page INTEGER,
+            text TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS pages_document_idx ON pages (document, source);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+            text, content='pages', content_rowid='id', tokenize='porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+            INSERT INTO pages_fts(rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+            INSERT INTO pages_fts(pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END;
+
+        CREATE TABLE IF NOT EXISTS documents (
+            document TEXT NOT NULL,
+            source TEXT NOT NULL,
+            pages INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (document, source)
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self._db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self._db_path))
+            self._conn.executescript(self._SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- indexing ----------
+
+    def begin_document(self, document: str, source: str):
+        conn = self._connection()
+        conn.execute("DELETE FROM pages WHERE document = ? AND source = ?", (document, source))
+
+    def add_page(self, document: str, source: str, page: Optional[int], text: str):
+        self._connection().execute(
+            "INSERT INTO pages (document, source, page, text) VALUES (?, ?, ?, ?)",
+            (document, source, page, text),
+        )
+
+    def commit_document(self, document: str, source: str, pages_count: int):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (document, source, pages, updated_at) VALUES (?, ?, ?, ?)",
+            (document, source, pages_count, datetime.now(timezone.utc).isoformat()),
+        )
+        conn.commit()
+
+    def rollback(self):
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def index_pages(self, document: str, source: str, pages: Iterable[Tuple[Optional[int], str]]) -> int:
+        self.begin_document(document, source)
+        pages_count = 0
+        for page, text in pages:
+            self.add_page(document, source, page, text)
+            pages_count += 1
+        self.commit_document(document, source, pages_count)
+        return pages_count
+
+    # ---------- querying ----------
+
+    def search(self,
+               query: str,
+               limit: int = 20,
+               document: Optional[str] = None,
+               source: Optional[str] = None) -> List[PageHit]:
+        """
+        FTS5 query syntax: 'ECG', '"vital signs"', 'HbA1c OR glucose', 'schedule NEAR activities'
+        Best matches (bm25) first.
+        """
+        sql = """
+            SELECT p.document, p.source, p.page,
+                   snippet(pages_fts, 0, '[', ']', '...', 12),
+                   bm25(pages_fts)
+            FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid
+            WHERE pages_fts MATCH ?
+        """
+        params: list = [query]
+        if document is not None:
+            sql += " AND p.document = ?"
+            params.append(document)
+        if source is not None:
+            sql += " AND p.source = ?"
+            params.append(source)
+        sql += " ORDER BY bm25(pages_fts) LIMIT ?"
+        params.append(limit)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        return [PageHit(document=r[0], source=r[1], page=r[2], snippet=r[3], score=r[4]) for r in rows]
+
+    def documents(self) -> List[Tuple[str, str, int, str]]:
+        return self._connection().execute(
+            "SELECT document, source, pages, updated_at FROM documents ORDER BY document"
+        ).fetchall()
@@ -0,0 +1,242 @@
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:     # Windows: manifest updates of concurrent writers are not serialized
+    fcntl = None
+
+
+PAGES_SCHEMA = pa.schema([
+    ("document", pa.string()),
+    ("page", pa.int32()),
+    ("text", pa.string()),
+])
+
+# one row per table cell (long format), so tables with different headers share one dataset
+# 'kind' (activities, objectives) is a hive partition: tables/kind=activities/part-<document>.parquet
+TABLES_SCHEMA = pa.schema([
+    ("document", pa.string()),
+    ("page", pa.int32()),
+    ("table", pa.int32()),
+    ("row", pa.int32()),
+    ("column", pa.int32()),
+    ("header", pa.string()),
+    ("value", pa.string()),
+])
+
+
+class PageWriter:
+    """
+    Append pages of one document to its parquet file, one row group per batch of pages
+    """
+    def __init__(self, path: Path, document: str, batch_size: int):
+        self.document = document
+        self._batch_size = batch_size
+        self._writer = pq.ParquetWriter(str(path), PAGES_SCHEMA)
+        self._pages: List[int] = []
+        self._texts: List[str] = []
+        self.pages_count = 0
+
+    def write(self, page_num: int, text: str):
+        self._pages.append(page_num)
+        self._texts.append(text)
+        self.pages_count += 1
+        if len(self._pages) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pages:
+            return
+        batch = pa.record_batch([
+            pa.array([self.document] * len(self._pages), pa.string()),
+            pa.array(self._pages, pa.int32()),
+            pa.array(self._texts, pa.string()),
+        ], schema=PAGES_SCHEMA)
+        self._writer.write_batch(batch)
+        self._pages, self._texts = [], []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+class ParquetCorpusStore:
+    """
+    Corpus wide columnar storage of extracted page text and tables:
+        <root>/pages/part-<document>.parquet
+        <root>/tables/kind=<kind>/part-<document>.parquet
+        <root>/manifest.json
+    Re-processing a document overwrites its own parts only.
+    """
+    def __init__(self, root_dir: str, pages_per_row_group: int = 64):
+        self._root = Path(root_dir)
+        self._pages_dir = self._root / "pages"
+        self._tables_dir = self._root / "tables"
+        self._manifest_path = self._root / "manifest.json"
+        self._pages_per_row_group = pages_per_row_group
+
+    @staticmethod
+    def _part_name(document: str) -> str:
+        return "part-" + re.sub(r"[^\w.-]", "_", document) + ".parquet"
+
+    # ---------- writing ----------
+
+    def open_page_writer(self, document: str) -> PageWriter:
+        self._pages_dir.mkdir(parents=True, exist_ok=True)
+        return PageWriter(self._pages_dir / self._part_name(document), document, self._pages_per_row_group)
+
+    def close_page_writer(self, writer: PageWriter, source: Optional[str] = None):
+        writer.close()
+        self._update_manifest(writer.document, source=source, pages=writer.pages_count)
+
+    def append_table(self,
+                     document: str,
+                     kind: str,
+                     table: pd.DataFrame,
+                     source_pages: Optional[List[Optional[int]]] = None,
+                     table_num: int = 0,
+                     source: Optional[str] = None):
+        n_rows, n_cols = table.shape
+        headers = [str(h) for h in table.columns]
+        pages = source_pages if source_pages and len(source_pages) == n_rows else [None] * n_rows
+
+        values = table.astype(str).to_numpy()
+        arrow_table = pa.table({
+            "document": pa.array([document] * (n_rows * n_cols), pa.string()),
+            "page": pa.array([pages[r] for r in range(n_rows) for _ in range(n_cols)], pa.int32()),
+            "table": pa.array([table_num] * (n_rows * n_cols), pa.int32()),
+            "row": pa.array([r for r in range(n_rows) for _ in range(n_cols)], pa.int32()),
+            "column": pa.array([c for _ in range(n_rows) for c in range(n_cols)], pa.int32()),
+            "header": pa.array(headers * n_rows, pa.string()),
+            "value": pa.array(values.ravel().tolist(), pa.string()),
+        }, schema=TABLES_SCHEMA)
+
+        partition_dir = self._tables_dir / f"kind={kind}"
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        pq.write_table(arrow_table, partition_dir / self._part_name(document))
+
+        self._update_manifest(document, source=source, tables={kind: n_rows})
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if self._manifest_path.exists():
+            return json.loads(self._manifest_path.read_text(encoding="utf-8"))
+        return {"documents": {}}
+
+    @contextmanager
+    def _manifest_lock(self):
+        """
+        Exclusive lock of the manifest for its read-modify-write: pipelines, scheduler workers and service jobs
+        of different processes write parts of the same store
+        """
+        self._root.mkdir(parents=True, exist_ok=True)
+        with open(self._root / "manifest.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update_manifest(self, document: str, source: Optional[str] = None,
+                         pages: Optional[int] = None, tables: Optional[Dict[str, int]] = None):
+        with self._manifest_lock():
+            manifest = self._read_manifest()
+            entry = manifest["documents"].setdefault(document, {"tables": {}})
+            if source is not None:
+                entry["source"] = source
+            if pages is not None:
+                entry["pages"] = pages
+            if tables:
+                entry["tables"].update(tables)
+            entry["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+            # readers never see a half written manifest
+            tmp_path = self._manifest_path.with_suffix(f".json.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self._manifest_path)
+
+    # ---------- reading ----------
+
+    def documents(self) -> Dict[str, Any]:
+        return self._read_manifest()["documents"]
+
+    def _tables_dataset(self) -> ds.Dataset:
+        partitioning = ds.partitioning(pa.schema([("kind", pa.string())]), flavor="hive")
+        return ds.dataset(str(self._tables_dir), format="parquet", partitioning=partitioning)
+
+    def query_tables(self,
+                     kind: Optional[str] = None,
+                     document: Optional[str] = None,
+                     contains: Optional[str] = None,
+                     columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Cells of stored tables; filters are pushed down to the parquet scan (partition pruning for kind)
+        """
+        if not self._tables_dir.exists():
+            return pd.DataFrame(columns=columns or TABLES_SCHEMA.names + ["kind"])
+
+        filters = []
+        if kind is not None:
+            filters.append(pc.field("kind") == kind)
+        if document is not None:
+            filters.append(pc.field("document") == document)
+        if contains:
+            filters.append(pc.match_substring(pc.field("value"), contains, ignore_case=True))
+
+        expression = None
+        for f in filters:
+            expression = f if expression is None else expression & f
+
+        return self._tables_dataset().to_table(columns=columns, filter=expression).to_pandas()
+
+    def find_rows(self, term: str, kind: str = "activities") -> pd.DataFrame:
+        """
+        All cells of the table rows where any cell mentions term, e.g. find_rows("ECG")
+        """
+        keys = ["document", "table", "row"]
+        hits = self.query_tables(kind=kind, contains=term, columns=keys).drop_duplicates()
+        if hits.empty:
+            return hits
+
+        expression = (pc.field("kind") == kind) & pc.field("document").isin(hits["document"].unique().tolist())
+        cells = self._tables_dataset().to_table(filter=expression).to_pandas()
+        return cells.merge(hits, on=keys).sort_values(keys + ["column"], ignore_index=True)
+
+    def read_table(self, document: str, kind: str, table_num: int = 0) -> pd.DataFrame:
+        cells = self.query_tables(kind=kind, document=document)
+        cells = cells[cells["table"] == table_num]
+        if cells.empty:
+            return pd.DataFrame()
+
+        headers = cells.drop_duplicates("column").sort_values("column")["header"].tolist()
+        wide = cells.pivot(index="row", columns="column", values="value").sort_index()
+        wide.columns = headers
+        return wide.reset_index(drop=True)
+
+    def read_pages(self, document: str) -> pd.DataFrame:
+        path = self._pages_dir / self._part_name(document)
+        if not path.exists():
+            return pd.DataFrame(columns=PAGES_SCHEMA.names)
+        return pq.read_table(path).to_pandas().sort_values("page", ignore_index=True)
+
+    # ---------- CSV/TXT export ----------
+
+    def export_csv(self, document: str, kind: str, output_path: Path):
+        self.read_table(document, kind).to_csv(output_path, index=False)
+
+    def export_text(self, document: str, output_path: Path, separator: str):
+        pages = self.read_pages(document)
+        output_path.write_text(separator.join(pages["text"].tolist()), encoding="utf-8")
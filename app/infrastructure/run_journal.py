@@ -0,0 +1,101 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Iterable
+
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+
+class RunJournal:
+    """
+    Durable per-document, per-stage status of batch runs, so a killed run can be resumed:
+    done stages (with their artifacts still on disk) are skipped, failed and interrupted ones are retried
+    until the attempt cap
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS stages (
+            document TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            artifacts TEXT NOT NULL DEFAULT '[]',
+            error TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (document, stage)
+        );
+    """
+
+    def __init__(self, db_path: str, busy_timeout_s: float = 30.0):
+        self._db_path = Path(db_path)
+        self._busy_timeout_s = busy_timeout_s
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            # service workers record stages of different documents at the same time
+            self._conn = sqlite3.connect(str(self._db_path), timeout=self._busy_timeout_s)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self._SCHEMA)
+        return self._conn
+
+    def reset(self, stages: Optional[Iterable[str]] = None):
+        """
+        Forget previous runs - a run without --resume starts from scratch.
+        `stages` - only these stages, an entry point must not wipe the stages recorded by another one
+        """
+        conn = self._connection()
+        if stages is None:
+            conn.execute("DELETE FROM stages")
+        else:
+            stages = list(stages)
+            conn.execute(f"DELETE FROM stages WHERE stage IN ({', '.join('?' * len(stages))})", stages)
+        conn.commit()
+
+    def get(self, document: str, stage: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            "SELECT status, attempts, artifacts, error FROM stages WHERE document = ? AND stage = ?", (document, stage)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "attempts": row[1], "artifacts": json.loads(row[2]), "error": row[3]}
+
+    def should_run(self, document: str, stage: str, max_attempts: int) -> bool:
+        entry = self.get(document, stage)
+        if entry is None:
+            return True
+        if entry["status"] == DONE:
+            # re-run a done stage only if its output has gone
+            return not all(Path(p).exists() for p in entry["artifacts"])
+        # failed, or running when the previous run was killed
+        return entry["attempts"] < max_attempts
+
+    def start(self, document: str, stage: str):
+        conn = self._connection()
+        conn.execute(
+            """INSERT INTO stages (document, stage, status, attempts, updated_at) VALUES (?, ?, ?, 1, ?)
+               ON CONFLICT (document, stage) DO UPDATE SET status = excluded.status, attempts = attempts + 1,
+                                                         error = NULL, updated_at = excluded.updated_at""",
+            (document, stage, RUNNING, time.time()),
+        )
+        conn.commit()
+
+    def finish(self, document: str, stage: str, artifacts: List[str]):
+        self._set_status(document, stage, DONE, artifacts=json.dumps([str(p) for p in artifacts]))
+
+    def fail(self, document: str, stage: str, error: str):
+        self._set_status(document, stage, FAILED, error=error)
+
+    def _set_status(self, document: str, stage: str, status: str, artifacts: Optional[str] = None, error: Optional[str] = None):
+        conn = self._connection()
+        conn.execute(
+            "UPDATE stages SET status = ?, artifacts = COALESCE(?, artifacts), error = ?, updated_at = ? "
+            "WHERE document = ? AND stage = ?",
+            (status, artifacts, error, time.time(), document, stage),
+        )
+        conn.commit()
+
+    def summary(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM stages GROUP BY status").fetchall()
+        return dict(rows)
@@ -0,0 +1,61 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+
+class TeiArtifactStore:
+    """
+    Gzip compressed Grobid TEI documents keyed by PDF content hash, Grobid version and request parameters:
+        <root>/<pdf hash[:2]>/<pdf hash>-<params hash>-<grobid version>.tei.xml.gz
+    """
+    def __init__(self, root_dir: str, compress_level: int = 6):
+        self._root = Path(root_dir)
+        self._compress_level = compress_level
+
+    @staticmethod
+    def pdf_hash(pdf_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def params_hash(params: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    def _path(self, pdf_hash: str, params_hash: str, grobid_version: str) -> Path:
+        version = re.sub(r"[^\w.-]", "_", grobid_version)
+        return self._root / pdf_hash[:2] / f"{pdf_hash}-{params_hash}-{version}.tei.xml.gz"
+
+    def get(self, pdf_hash: str, params_hash: str, grobid_version: Optional[str] = None) -> Optional[str]:
+        """
+        TEI for this PDF and parameters; with no grobid_version given the most recent artifact of any version
+        """
+        if grobid_version:
+            path = self._path(pdf_hash, params_hash, grobid_version)
+            candidates = [path] if path.exists() else []
+        else:
+            candidates = sorted((self._root / pdf_hash[:2]).glob(f"{pdf_hash}-{params_hash}-*.tei.xml.gz"),
+                                key=lambda p: p.stat().st_mtime, reverse=True)
+
+        if not candidates:
+            return None
+        with gzip.open(candidates[0], 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    def put(self, pdf_hash: str, params_hash: str, grobid_version: str, tei_xml: str) -> Path:
+        path = self._path(pdf_hash, params_hash, grobid_version)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # one tmp file per writer: service workers and pre-warm threads may store the same key at the same time
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=self._compress_level) as f:
+            f.write(tei_xml)
+        tmp_path.replace(path)
+        return path
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import argparse
+import sqlite3
+sys.path.append(os.path.abspath(os.sep.join(os.path.dirname(__file__).split(os.sep)[:-1])))
+
+from app.core.settings import get_settings
+from app.infrastructure.page_text_index import PageTextIndex
+
+
+def main():
+    """
+    Search the full-text index of extracted protocol pages, e.g.
+        python ./app/page_search_app.py '"vital signs" AND ECG' --source pdfplumber
+        python ./app/page_search_app.py COVID-19 --phrase
+    """
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Full-text search over extracted protocol pages")
+    parser.add_argument("query", help="FTS5 query")
+    parser.add_argument("--document", help="search only this document (PDF file stem)")
+    parser.add_argument("--source", choices=["pdfplumber", "grobid"])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--phrase", action="store_true",
+                        help="search the query as one literal phrase (terms with '-', ':' or other FTS5 operators)")
+    args = parser.parse_args()
+
+    index = PageTextIndex(settings.PAGE_INDEX_PATH)
+
+    query = '"' + args.query.replace('"', '""') + '"' if args.phrase else args.query
+
+    start_time = time.perf_counter()
+    try:
+        hits = index.search(query, limit=args.limit, document=args.document, source=args.source)
+    except sqlite3.OperationalError as e:
+        print(f"Invalid FTS5 query {args.query!r}: {e}")
+        print("Quote terms with '-' or ':' (e.g. '\"COVID-19\"') or use --phrase to search the query literally")
+        index.close()
+        sys.exit(2)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    for hit in hits:
+        page = hit.page if hit.page is not None else "-"
+        print(f"{hit.document}  page {page}  [{hit.source}]  {hit.snippet}")
+    print(f"{len(hits)} hits in {elapsed_ms:.1f} ms")
+
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
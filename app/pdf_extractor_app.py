@@ -1,5 +1,6 @@
 import os
 import sys
+import argparse
 sys.path.append(os.path.abspath(os.sep.join(os.path.dirname(__file__).split(os.sep)[:-1])))
 from injector import Injector
 from app.di.app_module import AppModule
@@ -7,13 +8,17 @@ from app.infrastructure.application import Application
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract text and tables from protocol PDFs")
+    parser.add_argument("--resume", action="store_true", help="skip stages done by the previous run, retry failed ones")
+    args = parser.parse_args()
+
     injector = Injector([AppModule()])
 
     # Create an instance of Application and resolve all its constructor arguments using the bindings you’ve configured
     # injector must provide: extractor_use_case, setting, logger
     # it gets it from app_module binding section
     application = injector.get(Application)
-    application.launch()
+    application.launch(resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,21 @@
 import os
 import sys
 import asyncio
+import argparse
 import json
 
-import yaml
+import pandas as pd
 from pathlib import Path
 
 from app.core.settings import get_settings
+from app.core.shutdown import GracefulShutdown
+from app.infrastructure.run_journal import RunJournal
 from app.models.provider_schema import LLMProvider
 from app.infrastructure.llm.llm_client_factory import LLMClientFactory, llm_client_factory
+from app.services.activity_converter import ActivityConverter
+from app.services.biomedical_concept_matcher import BiomedicalConceptMatcher
+from app.services.soa_prompt_encoder import SoAPromptEncoder
+from app.services.usdm_builder import UsdmBuilder, build_activity_usdm
 
 sys.path.append(os.path.abspath(os.sep.join(os.path.dirname(__file__).split(os.sep)[:-1])))
 
@@ -37,28 +44,30 @@ activity = {
 setings = get_settings()
 base_path = Path(__file__).parent       # TODO: remove late
 
-
 def test_pipeline():
     #####  EXAMPLE how to work with json
 
-    with open(base_path / "json_templates" / "usdm_template.yaml", "r", encoding="utf-8") as f:
-        usdm_data = yaml.safe_load(f)
-
-    study_version = usdm_data["study"]["versions"][0]
-    study_design = study_version["studyDesigns"][0]
+    builder = UsdmBuilder()
 
     # Add entries
-    study_design["activities"].append(activity)
+    builder.add("activities", activity)
 
     # Export to JSON
-    with open(base_path / setings.OUTPUT_DIR / "usdm_filled.json", "w") as file:
-        json.dump(usdm_data, file, indent=2)
+    builder.write(base_path / setings.OUTPUT_DIR / "usdm_filled.json")
 
 
 
-async def pipeline():
+async def pipeline(resume: bool = False):
     # TODO: refactor it to be Application with dependency injection and be a separate class
 
+    # LLM stage of every CSV is recorded, a killed run continues with --resume
+    journal = RunJournal(setings.RUN_JOURNAL_PATH)
+    if not resume:
+        # attempts of earlier runs must not count against a later --resume
+        journal.reset(["llm"])
+    shutdown = GracefulShutdown()
+    shutdown.install()
+
     # load extracted Activity CSV table and temple
     output_dir = setings.OUTPUT_DIR
     csv_files = list(Path(output_dir).glob("*.csv"))
@@ -68,53 +77,62 @@ async def pipeline():
         activity_example = f.read()
 
     # get LLM client
-    llm_client = llm_client_factory.of(LLMProvider.hg_local)
+    llm_client = llm_client_factory.for_pipeline()
     model = "meta-llama/Meta-Llama-3-8B-Instruct"       # GPT-2, maximum context length of 1024 tokens
     #model = "mistralai/Mistral-7B-Instruct-v0.2"
 
-
-
+    # known BiomedicalConcepts are resolved from the dictionary, only the rest goes to LLM
+    concept_matcher = BiomedicalConceptMatcher(setings.BC_VOCABULARY_PATHS)
+    # visit columns go to the LLM as visit ids + one legend instead of the raw CSV
+    prompt_encoder = SoAPromptEncoder(setings.LLM_PROMPT_TOKEN_BUDGET) if setings.LLM_PROMPT_FORMAT == "compact" else None
+    converter = ActivityConverter(llm_client, model, activity_example, concept_matcher, prompt_encoder)
 
     for csv_file in csv_files:
-        csv_text = csv_file.read_text(encoding="utf-8")
-
-        user_prompt = f"""
-        Given the following CSV table extracted from a clinical trial protocol, convert each row into a JSON activity section exactly as per the example. Fill unknown values with "NA". Return only the JSON objects for each activity, with no extra explanation or text.
-        Here is the CSV table:
-        {csv_text}
-
-        Example JSON for first activity:
-        {activity_example}
-        """
-
-
-        prompt = [
-            {"role": "system",
-             "content": "You are a clinical data structuring assistant and you help to convert clinical trial protocols to USDM json.", },
-            {"role": "user", "content": user_prompt}
-        ]
-
-
-        result_json = await llm_client.generate(
-            operation="activity_CSV_to_JSON",
-            model=model,
-            prompt=prompt
-        )
-
-        print(result_json)
-
-        # safe json to output dir
-        output_file = Path(output_dir) / f"{csv_file.stem}_activities.json"
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(result_json)
-
+        if shutdown.requested:
+            print("Shutdown requested, run it again with --resume to continue")
+            break
+        if resume and not journal.should_run(csv_file.stem, "llm", setings.RUN_MAX_ATTEMPTS):
+            print(f"Skipping {csv_file.name}: done or out of attempts")
+            continue
+
+        journal.start(csv_file.stem, "llm")
+        try:
+            table = pd.read_csv(csv_file)
+            activities = await converter.convert(table)
+        except Exception as e:
+            print(f"LLM conversion of {csv_file.name} failed: {e}")
+            journal.fail(csv_file.stem, "llm", str(e))
+            continue
+
+        try:
+            # safe json to output dir
+            output_file = Path(output_dir) / f"{csv_file.stem}_activities.json"
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(activities, f, indent=2)
+
+            # USDM document with the activities, the dictionary BiomedicalConcepts they refer to and the table visits
+            usdm_file = Path(output_dir) / f"{csv_file.stem}_usdm.json"
+            builder = build_activity_usdm(activities, table, concept_matcher.find_concept)
+            builder.write(usdm_file)
+        except Exception as e:
+            print(f"Writing USDM of {csv_file.name} failed: {e}")
+            journal.fail(csv_file.stem, "llm", str(e))
+            continue
+        journal.finish(csv_file.stem, "llm", [output_file, usdm_file])
+
+    if llm_client.metrics():
+        print(f"LLM client metrics: {llm_client.metrics()}")
     print("All activity JSONs have been generated")
 
 
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert extracted activity tables to USDM with LLM")
+    parser.add_argument("--resume", action="store_true", help="skip CSVs done by the previous run, retry failed ones")
+    args = parser.parse_args()
+
     #test_pipeline()
-    asyncio.run(pipeline())
+    asyncio.run(pipeline(resume=args.resume))
 
 
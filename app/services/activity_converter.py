@@ -0,0 +1,211 @@
+import asyncio
+import re
+from typing import List, Optional, Dict
+
+import pandas as pd
+
+from app.infrastructure.llm.clients.base_llm_client import BaseLLMClient
+from app.services.biomedical_concept_matcher import BiomedicalConceptMatcher, MATCHED
+from app.services.json_stream_parser import iter_json_objects
+from app.services.soa_prompt_encoder import SoAPromptEncoder, estimate_tokens
+
+
+CSV_PLACEHOLDER = "<<CSV_TABLE>>"
+
+
+def build_activity_prompt(activity_example: str, csv_text: str, compact: bool = False) -> list:
+    # static part (system message, instructions, example) goes first, so every request shares the same prefix
+    if compact:
+        user_prompt = f"""
+        Given a Schedule of Activities table extracted from a clinical trial protocol in a compact form (a legend of visit ids, then one line per activity with its row number in brackets and the visit ids it is scheduled at), convert each activity line into a JSON activity section exactly as per the example, plus a "row" field with the row number of the line. Refer to visits by their ids (V1, V2, ...). Fill unknown values with "NA". Return only the JSON objects for each activity, with no extra explanation or text.
+
+        Example JSON for first activity:
+        {activity_example}
+
+        Here is the table:
+        {csv_text}
+        """
+    else:
+        user_prompt = f"""
+        Given a CSV table extracted from a clinical trial protocol, convert each row into a JSON activity section exactly as per the example, plus a "row" field with the number from the "row" column. Fill unknown values with "NA". Return only the JSON objects for each activity, with no extra explanation or text.
+
+        Example JSON for first activity:
+        {activity_example}
+
+        Here is the CSV table:
+        {csv_text}
+        """
+
+    return [
+        {"role": "system",
+         "content": "You are a clinical data structuring assistant and you help to convert clinical trial protocols to USDM json.", },
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def activity_from_row(name: str, concept: Optional[dict] = None, description: Optional[str] = None) -> dict:
+    """
+    Activity for an SoA row built without the LLM: from its BiomedicalConcept known from the dictionary,
+    or a bare one for a row the LLM left without an activity
+    """
+    return {
+        "id": None,
+        "extensionAttributes": [],
+        "name": re.sub(r"\W+", "_", name).strip("_").upper(),
+        "label": name,
+        "description": description or name,
+        "previousId": None,
+        "nextId": None,
+        "childIds": [],
+        "definedProcedures": [],
+        "biomedicalConceptIds": [concept["id"]] if concept else [],
+        "bcCategoryIds": [],
+        "bcSurrogateIds": [],
+        "timelineId": None,
+        "notes": [],
+        "instanceType": "Activity",
+    }
+
+
+def take_row_number(activity: dict) -> Optional[int]:
+    """
+    Remove the "row" field the LLM echoes back (1-based row of the prompt table) and return it
+    """
+    row = activity.pop("row", None)
+    try:
+        return int(row)
+    except (TypeError, ValueError):
+        return None
+
+
+def link_activities(activities: List[dict]) -> List[dict]:
+    """
+    Number activities in table order and chain them with previousId/nextId
+    """
+    for n, activity in enumerate(activities, start=1):
+        activity["id"] = f"Activity_{n}"
+        activity["previousId"] = f"Activity_{n - 1}" if n > 1 else None
+        activity["nextId"] = f"Activity_{n + 1}" if n < len(activities) else None
+    return activities
+
+
+class ActivityConverter:
+    """
+    SoA activities table -> list of USDM Activity dicts.
+    Rows with a single dictionary match of BiomedicalConcept are converted locally,
+    only unmatched and ambiguous rows are sent to the LLM.
+    With a prompt encoder the table goes to the LLM in the compact visit-id form, in chunks within its token budget,
+    and visit ids in the LLM output are expanded back to the full visit headers.
+    """
+    def __init__(self,
+                 llm_client: BaseLLMClient,
+                 model: str,
+                 activity_example: str,
+                 concept_matcher: Optional[BiomedicalConceptMatcher] = None,
+                 prompt_encoder: Optional[SoAPromptEncoder] = None):
+        self._llm_client = llm_client
+        self._model = model
+        self._activity_example = activity_example
+        self._concept_matcher = concept_matcher
+        self._prompt_encoder = prompt_encoder
+        self._prefix_registered = False
+        self._prefix_lock = asyncio.Lock()
+
+    @property
+    def concept_matcher(self) -> Optional[BiomedicalConceptMatcher]:
+        return self._concept_matcher
+
+    def warm_up(self):
+        """
+        Load the model and prefill the static prompt prefix before the first table comes
+        """
+        self._register_prefix()
+
+    def _register_prefix(self):
+        # prefill of the shared system message + activity example is computed once
+        if not self._prefix_registered:
+            prompt = build_activity_prompt(self._activity_example, CSV_PLACEHOLDER, compact=self._prompt_encoder is not None)
+            self._llm_client.register_prefix(self._model, prompt, CSV_PLACEHOLDER)
+            self._prefix_registered = True
+
+    async def _register_prefix_async(self):
+        # model load + prefix prefill take minutes on CPU, they must not block the event loop
+        async with self._prefix_lock:
+            if not self._prefix_registered:
+                await asyncio.to_thread(self._register_prefix)
+
+    async def _stream_activities(self, prompt: list, rows: List[int]) -> Dict[int, dict]:
+        # activities are parsed while the model is still generating,
+        # the generation is stopped as soon as every row got its activity.
+        # Activities are placed by the row number the LLM echoes, not by their order:
+        # a skipped or merged row must not shift the activities of the rows after it
+        activities: Dict[int, dict] = {}
+        token_stream = self._llm_client.stream_generate(
+            operation="activity_CSV_to_JSON",
+            model=self._model,
+            prompt=prompt
+        )
+        async for activity in iter_json_objects(token_stream, limit=len(rows)):
+            row_number = take_row_number(activity)
+            row = row_number - 1 if row_number is not None else None
+            if row not in rows or row in activities:
+                print(f"  activity {activity.get('name')} has no valid row number ({row_number}), skipped")
+                continue
+            activities[row] = activity
+            print(f"  activity {len(activities)}/{len(rows)}: {activity.get('name')}")
+        return activities
+
+    async def convert_with_llm(self, table: pd.DataFrame) -> List[dict]:
+        """
+        One activity per table row, in the table order; rows the LLM left without an activity
+        get a bare one named after the row
+        """
+        if table.empty:
+            return []
+
+        await self._register_prefix_async()
+        numbered = table.reset_index(drop=True)
+        csv_table = numbered.copy()
+        csv_table.insert(0, "row", range(1, len(numbered) + 1), allow_duplicates=True)
+        csv_text = csv_table.to_csv(index=False)
+
+        if self._prompt_encoder is None:
+            prompt = build_activity_prompt(self._activity_example, csv_text)
+            activities = await self._stream_activities(prompt, list(range(len(numbered))))
+        else:
+            chunks, visit_map = self._prompt_encoder.encode(numbered)
+            print(f"  compact table: {sum(c.tokens for c in chunks)} tokens in {len(chunks)} chunks "
+                  f"(CSV ~{estimate_tokens(csv_text)} tokens)")
+            activities = {}
+            for chunk in chunks:
+                prompt = build_activity_prompt(self._activity_example, chunk.text, compact=True)
+                chunk_activities = await self._stream_activities(prompt, chunk.rows)
+                activities.update((row, visit_map.expand_json(a)) for row, a in chunk_activities.items())
+
+        names = numbered.iloc[:, 0].fillna("").astype(str).str.strip()
+        unfilled = [row for row in range(len(numbered)) if row not in activities]
+        if unfilled:
+            print(f"  LLM left {len(unfilled)} rows without an activity: {[names[row] for row in unfilled]}")
+        return [activities[row] if row in activities else activity_from_row(names[row], description="NA")
+                for row in range(len(numbered))]
+
+    async def convert(self, table: pd.DataFrame) -> List[dict]:
+        if self._concept_matcher is None:
+            return link_activities(await self.convert_with_llm(table))
+
+        matches = self._concept_matcher.match_activities(table)
+        print(f"  BiomedicalConcept dictionary: {self._concept_matcher.stats(matches)}")
+
+        is_matched = matches["status"] == MATCHED
+        llm_activities = iter(await self.convert_with_llm(table[~is_matched]))
+
+        # put activities back in the table order, one LLM activity for every unmatched row
+        activities = []
+        for index in table.index:
+            if is_matched[index]:
+                concept = self._concept_matcher.concept(matches.at[index, "bc_ids"][0])
+                activities.append(activity_from_row(matches.at[index, "activity"], concept))
+            else:
+                activities.append(next(llm_activities))
+
+        return link_activities(activities)
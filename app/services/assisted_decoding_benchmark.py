@@ -0,0 +1,55 @@
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.infrastructure.llm.clients.local_hf_client import LocalHFClient
+from app.services.activity_converter import build_activity_prompt
+
+
+MODEL = "meta-llama/Meta-Llama-3-8B-Instruct"
+DRAFT_MODEL = "meta-llama/Llama-3.2-1B-Instruct"
+TABLE = """Activity,Screening:Visit 1:Day -28,Treatment:Visit 2:Day 1,Treatment:Visit 3:Day 8,Follow-up:Visit 4:Day 28
+Informed consent,X,,,
+Vital signs,X,X,X,X
+Hematology,X,,X,X
+"""
+
+
+def main(draft_model: str = DRAFT_MODEL, max_new_tokens: int = 256, num_threads: Optional[int] = None):
+    """
+    Plain greedy vs assisted decoding of the same activity conversion prompt: same text, time, target passes, acceptance rate
+    """
+    activity_example = (Path(__file__).parent.parent / "json_templates" / "activity_example.json").read_text(encoding="utf-8")
+    prompt = build_activity_prompt(activity_example, TABLE)
+    client = LocalHFClient(num_threads=num_threads, draft_models={MODEL: draft_model})
+    client._load_model(MODEL)
+    client._load_draft(MODEL)
+
+    start_time = time.perf_counter()
+    plain_text = client._generate_text(prompt, MODEL, max_new_tokens=max_new_tokens, greedy=True, assisted=False)
+    plain_time = time.perf_counter() - start_time
+    # counted in this thread and not taken by a plain run - one pass per generated token
+    plain_passes = client._forward_counters[MODEL].take()
+    tokenizer, _ = client._load_model(MODEL)
+    plain_tokens = len(tokenizer(plain_text, add_special_tokens=False)["input_ids"])
+
+    start_time = time.perf_counter()
+    assisted_text = client._generate_text(prompt, MODEL, max_new_tokens=max_new_tokens)
+    assisted_time = time.perf_counter() - start_time
+    stats = client.last_assisted_stats
+
+    if stats is None:
+        print(f"Draft model {draft_model} is not compatible with {MODEL}")
+        return
+
+    print(f"{'decoding':<10}{'time, s':>10}{'tokens':>8}{'target passes':>15}{'tokens/pass':>13}{'acceptance':>12}")
+    print(f"{'greedy':<10}{plain_time:>10.1f}{plain_tokens:>8}{plain_passes:>15}"
+          f"{plain_tokens / plain_passes if plain_passes else 0.0:>13.2f}{'':>12}")
+    print(f"{'assisted':<10}{assisted_time:>10.1f}{stats.new_tokens:>8}{stats.target_passes:>15}"
+          f"{stats.tokens_per_target_pass:>13.2f}{stats.acceptance_rate:>12.0%}")
+    print(f"Speedup x{plain_time / assisted_time:.2f} (estimated from passes x{stats.estimated_speedup:.2f}, "
+          f"draft pass = {stats.draft_cost_ratio:.2f} target pass), outputs are {'identical' if plain_text == assisted_text else 'DIFFERENT'}")
+
+
+if __name__ == '__main__':
+    main()
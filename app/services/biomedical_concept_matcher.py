@@ -0,0 +1,228 @@
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Iterable, Tuple
+
+import pandas as pd
+import yaml
+
+
+TEMPLATES_DIR = Path(__file__).parent.parent / "json_templates"
+BUILTIN_VOCABULARIES = [
+    TEMPLATES_DIR / "biomedical_concepts_example.json",
+    TEMPLATES_DIR / "biomedical_concept_template.yaml",
+]
+
+# every phrase of a group is rewritten to the first one before matching,
+# so "ECG", "EKG" and "Electrocardiogram" hit the same concept
+DEFAULT_SYNONYM_GROUPS = [
+    ["electrocardiogram", "ecg", "ekg", "12 lead ecg", "12 lead electrocardiogram"],
+    ["vital sign", "vitals"],
+    ["hba1c", "hemoglobin a1c", "haemoglobin a1c", "glycated hemoglobin", "glycated haemoglobin", "glycosylated hemoglobin", "a1c"],
+    ["blood pressure", "bp"],
+    ["heart rate", "pulse rate"],
+    ["physical examination", "physical exam"],
+    ["adverse event", "ae", "teae"],
+    ["informed consent", "icf", "informed consent form"],
+    ["concomitant medication", "conmed", "con med"],
+]
+
+MATCHED, AMBIGUOUS, UNMATCHED = "matched", "ambiguous", "unmatched"
+
+# footnote refs at the end of an activity name: "Vital signs (a)", "ECG [b,c]", "Hematology*", "HbA1c¹"
+_TRAILING_FOOTNOTE = re.compile(r"(?:\s*[\(\[][a-z0-9,\s]{1,8}[\)\]]|\s*[*†‡§¶¹²³⁴⁵⁶⁷⁸⁹⁰]+)+$", re.IGNORECASE)
+
+
+@dataclass
+class MatchStats:
+    total_rows: int
+    matched: int
+    ambiguous: int
+    unmatched: int
+
+    @property
+    def hit_rate(self) -> float:
+        return self.matched / self.total_rows if self.total_rows else 0.0
+
+    @property
+    def llm_rows_avoided(self) -> int:
+        return self.matched
+
+    def __str__(self):
+        return (f"{self.matched}/{self.total_rows} rows matched from dictionary (hit rate {self.hit_rate:.0%}), "
+                f"{self.ambiguous} ambiguous, {self.unmatched} unmatched -> {self.ambiguous + self.unmatched} rows go to LLM, "
+                f"{self.llm_rows_avoided} LLM rows avoided")
+
+
+class BiomedicalConceptMatcher:
+    """
+    Dictionary-first BiomedicalConcept lookup for SoA activity names.
+    Concept names, labels and synonyms are normalized to token sequences and stored in a token trie;
+    an activity name is scanned once for the longest trie matches starting at every token.
+    """
+    def __init__(self, vocabulary_paths: Iterable[str] = (), synonym_groups: Optional[List[List[str]]] = None):
+        self._concepts: Dict[str, dict] = {}
+        self._synonym_trie: dict = {}       # phrase tokens -> canonical tokens
+        self._concept_trie: dict = {}       # canonical tokens -> concept ids
+
+        for group in synonym_groups or DEFAULT_SYNONYM_GROUPS:
+            self._add_synonym_group(group)
+
+        for path in list(BUILTIN_VOCABULARIES) + [Path(p) for p in vocabulary_paths]:
+            self._load_vocabulary(path)
+
+    # ---------- vocabulary ----------
+
+    def _load_vocabulary(self, path: Path):
+        """
+        A vocabulary file (json/yaml) holds a BiomedicalConcept, a list of them, {"concepts": [...], "synonym_groups": [...]}
+        or a plain {"concept name": ["synonym", ...]} mapping
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f) if path.suffix == ".json" else yaml.safe_load(f)
+
+        if isinstance(data, dict) and "concepts" in data:
+            for group in data.get("synonym_groups", []):
+                self._add_synonym_group(group)
+            data = data["concepts"]
+
+        if isinstance(data, dict) and "id" not in data:
+            data = [self._concept_from_mapping(name, synonyms) for name, synonyms in data.items()]
+        elif isinstance(data, dict):
+            data = [data]
+
+        for concept in data:
+            self.add_concept(concept)
+
+    @staticmethod
+    def _concept_from_mapping(name: str, synonyms: List[str]) -> dict:
+        return {
+            "id": "BiomedicalConcept_" + re.sub(r"\W+", "_", name).strip("_").upper(),
+            "extensionAttributes": [],
+            "name": name,
+            "label": name,
+            "synonyms": list(synonyms or []),
+            "reference": None,
+            "properties": [],
+            "notes": [],
+            "instanceType": "BiomedicalConcept",
+        }
+
+    def add_concept(self, concept: dict):
+        self._concepts[concept["id"]] = concept
+        terms = [concept.get("name"), concept.get("label")] + list(concept.get("synonyms") or [])
+        for term in filter(None, terms):
+            tokens = self._canonical_tokens(self._tokenize(term))
+            if tokens:
+                node = self._concept_trie
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node.setdefault("$", set()).add(concept["id"])
+
+    def _add_synonym_group(self, group: List[str]):
+        canonical = tuple(self._tokenize(group[0]))
+        for phrase in group:
+            node = self._synonym_trie
+            for token in self._tokenize(phrase):
+                node = node.setdefault(token, {})
+            node["$"] = canonical
+
+    def concept(self, concept_id: str) -> dict:
+        return self._concepts[concept_id]
+
+    def find_concept(self, concept_id: str) -> Optional[dict]:
+        return self._concepts.get(concept_id)
+
+    # ---------- normalization ----------
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        text = unicodedata.normalize("NFKD", str(text)).lower()
+        tokens = re.sub(r"[^0-9a-z]+", " ", text).split()
+        # crude plural folding: "signs" -> "sign", "examinations" -> "examination"
+        return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokens]
+
+    @staticmethod
+    def _longest_match(trie: dict, tokens: List[str], start: int) -> Tuple[int, Optional[object]]:
+        node, end, value = trie, start, None
+        for i in range(start, len(tokens)):
+            node = node.get(tokens[i])
+            if node is None:
+                break
+            if "$" in node:
+                end, value = i + 1, node["$"]
+        return end, value
+
+    def _canonical_tokens(self, tokens: List[str]) -> List[str]:
+        result, i = [], 0
+        while i < len(tokens):
+            end, canonical = self._longest_match(self._synonym_trie, tokens, i)
+            if canonical is not None:
+                result.extend(canonical)
+                i = end
+            else:
+                result.append(tokens[i])
+                i += 1
+        return result
+
+    # ---------- matching ----------
+
+    def match(self, text: str) -> List[str]:
+        """
+        Ids of all concepts mentioned in text (longest match at every position)
+        """
+        tokens = self._canonical_tokens(self._tokenize(text))
+        found, i = [], 0
+        while i < len(tokens):
+            end, concept_ids = self._longest_match(self._concept_trie, tokens, i)
+            if concept_ids:
+                found.extend(cid for cid in sorted(concept_ids) if cid not in found)
+                i = end
+            else:
+                i += 1
+        return found
+
+    def match_name(self, name: str) -> List[str]:
+        """
+        Ids of the concepts whose name, label or synonym is the whole activity name (footnote refs aside).
+        A concept mentioned in a longer name ("Withdrawal of informed consent") is not a match of the name
+        """
+        tokens = self._canonical_tokens(self._tokenize(_TRAILING_FOOTNOTE.sub("", name)))
+        end, concept_ids = self._longest_match(self._concept_trie, tokens, 0)
+        return sorted(concept_ids) if concept_ids and end == len(tokens) else []
+
+    def match_activities(self, table: pd.DataFrame, column: Optional[str] = None) -> pd.DataFrame:
+        """
+        One pass over the activity column of an SoA table: every distinct activity name is matched once.
+        Returns a frame aligned with the table: activity, bc_ids, status:
+            matched   - the whole name is the term of a single concept
+            ambiguous - the whole name is a term of several concepts or concepts are only mentioned in it
+            unmatched - no concept at all
+        """
+        column = column if column is not None else table.columns[0]
+        names = table[column].fillna("").astype(str).str.strip()
+
+        def status_of(name: str) -> Tuple[List[str], str]:
+            exact = self.match_name(name)
+            if len(exact) == 1:
+                return exact, MATCHED
+            mentioned = exact or self.match(name)
+            return mentioned, AMBIGUOUS if mentioned else UNMATCHED
+
+        matches_by_name = {name: status_of(name) for name in names.unique()}
+        bc_ids = names.map(lambda name: matches_by_name[name][0])
+        status = names.map(lambda name: matches_by_name[name][1])
+
+        return pd.DataFrame({"activity": names, "bc_ids": bc_ids, "status": status}, index=table.index)
+
+    @staticmethod
+    def stats(matches: pd.DataFrame) -> MatchStats:
+        counts = matches["status"].value_counts()
+        return MatchStats(
+            total_rows=len(matches),
+            matched=int(counts.get(MATCHED, 0)),
+            ambiguous=int(counts.get(AMBIGUOUS, 0)),
+            unmatched=int(counts.get(UNMATCHED, 0)),
+        )
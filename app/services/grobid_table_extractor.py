@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Tuple
+
+import camelot
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from app.infrastructure.page_cache import PageCache
+from app.services.pdf_convertor import PDFConvertor
+from app.services.pdf_convertor_v3 import PDFConvertorV3
+
+
+# (x0, top, x1, bottom) in PDF points, origin at the top left corner of the page - as Grobid reports it
+BBox = Tuple[float, float, float, float]
+
+
+@dataclass
+class TableRegion:
+    page: int               # starting from 1, as camelot and pdfplumber pages
+    bbox: BBox
+    caption: str
+
+
+class GrobidTableExtractor(PDFConvertorV3):
+    """
+    Table extraction driven by Grobid: camelot reads only the regions of <figure type="table"> elements
+    found in the TEI (teiCoordinates), instead of scanning every page for SoA/objectives patterns and
+    parsing whole pages. The TEI comes from the artifact store, so Grobid is called once per PDF.
+    Falls back to the full scan of PDFConvertorV3, per table kind, when the regions give no table of that kind.
+    """
+    def __init__(self,
+                 grobid_convertor: PDFConvertor,
+                 max_rss_mb: Optional[int] = None,
+                 page_cache: Optional[PageCache] = None,
+                 fallback_to_scan: bool = True):
+        super().__init__(max_rss_mb=max_rss_mb, page_cache=page_cache)
+        self._grobid_convertor = grobid_convertor
+        self._fallback_to_scan = fallback_to_scan
+        self._last_regions: Tuple[Optional[str], List[Tuple[TableRegion, pd.DataFrame]]] = (None, [])
+
+    # ---------- TEI geometry ----------
+
+    def _page_heights(self, soup) -> Dict[int, float]:
+        # <facsimile><surface n="1" ulx="0.0" uly="0.0" lrx="612.0" lry="792.0"/>
+        heights = {}
+        for surface in soup.find_all("surface"):
+            try:
+                heights[int(surface.get("n"))] = float(surface.get("lry")) - float(surface.get("uly") or 0.0)
+            except (TypeError, ValueError):
+                continue
+        return heights
+
+    def _table_regions(self, soup) -> List[TableRegion]:
+        """
+        One region per page of every table figure: a table split over two pages has boxes on both
+        """
+        regions = []
+        for figure_tag in soup.find_all("figure", {"type": "table"}):
+            table_tag = figure_tag.find("table")
+            coords = (table_tag.get("coords") if table_tag else None) or figure_tag.get("coords") or ""
+            caption = " ".join(t.get_text(" ", strip=True) for t in figure_tag.find_all(["head", "label", "figDesc"]))
+
+            boxes_by_page: Dict[int, BBox] = {}
+            for box in filter(None, coords.split(";")):
+                page_num, bbox = self._grobid_convertor._extract_page_and_bbox(box)
+                if page_num is None:
+                    continue
+                page = page_num + 1
+                if page in boxes_by_page:
+                    x0, top, x1, bottom = boxes_by_page[page]
+                    bbox = (min(x0, bbox[0]), min(top, bbox[1]), max(x1, bbox[2]), max(bottom, bbox[3]))
+                boxes_by_page[page] = bbox
+
+            regions.extend(TableRegion(page, bbox, caption) for page, bbox in sorted(boxes_by_page.items()))
+        return regions
+
+    @staticmethod
+    def _camelot_area(bbox: BBox, page_height: float) -> str:
+        # camelot table_areas: "x1,y1,x2,y2" - left-top and right-bottom corners, origin at the bottom left
+        x0, top, x1, bottom = bbox
+        return f"{x0:.1f},{page_height - top:.1f},{x1:.1f},{page_height - bottom:.1f}"
+
+    # ---------- region extraction ----------
+
+    def _read_region_table(self, pdf_path: str, region: TableRegion, page_height: float) -> Optional[pd.DataFrame]:
+        area = self._camelot_area(region.bbox, page_height)
+        # lattice needs ruling lines, borderless tables come out of stream
+        for flavor in ("lattice", "stream"):
+            try:
+                extracted_tables = camelot.read_pdf(pdf_path, pages=str(region.page), flavor=flavor, table_areas=[area])
+            except Exception as e:
+                print(f"Error in camelot ({flavor}, page {region.page}): {e}")
+                continue
+            tables = [table.df.map(lambda x: self._clean_cell_value(x)) for table in extracted_tables]
+            tables = [t for t in tables if not t.empty]
+            if tables:
+                return max(tables, key=lambda t: t.size)
+        return None
+
+    def _region_tables(self, pdf_path: str) -> List[Tuple[TableRegion, pd.DataFrame]]:
+        """
+        Tables of all Grobid table regions of the PDF, read once for both table kinds
+        """
+        if self._last_regions[0] == str(pdf_path):
+            return self._last_regions[1]
+
+        result = []
+        tei_xml = self._grobid_convertor.fetch_tei(pdf_path)
+        if tei_xml:
+            soup = BeautifulSoup(tei_xml, "lxml-xml")
+            page_heights = self._page_heights(soup)
+            regions = self._table_regions(soup)
+            print(f"    Grobid found {len(regions)} table regions in {len(set(r.page for r in regions))} pages")
+            for region in regions:
+                if region.page not in page_heights:
+                    continue
+                table = self._read_region_table(pdf_path, region, page_heights[region.page])
+                if table is not None:
+                    result.append((region, table))
+
+        self._last_regions = (str(pdf_path), result)
+        return result
+
+    def _extract_region_tables(self, pdf_path: str, kind: str) -> Optional[pd.DataFrame]:
+        spec = self.table_kinds()[kind]
+
+        # page -> table as the camelot chain collects it; on a page with several tables the one passing
+        # the table heuristic or the caption patterns wins. Caption matches are passed on as known pages,
+        # so the continuity filter keeps them even when the heuristic alone would drop the table
+        all_tables: Dict[int, pd.DataFrame] = {}
+        caption_pages = set()
+        for region, table in self._region_tables(pdf_path):
+            if table.shape[1] <= spec["min_table_col_allowed"]:
+                continue
+            by_caption = any(p.search(region.caption) for p in spec["patterns"])
+            if by_caption or spec["is_valid_table_fn"](table) or region.page not in all_tables:
+                all_tables[region.page] = table
+                if by_caption:
+                    caption_pages.add(region.page)
+                else:
+                    caption_pages.discard(region.page)
+
+        result = self._process_page_tables(
+            all_tables, spec["is_continuous_fn"], spec.get("headers_row_count"), known_pages=caption_pages
+        )
+        if result is None and self._fallback_to_scan:
+            print(f"    No {kind} table in the Grobid table regions of {pdf_path}, scanning pages")
+            return self._extract_and_process_tables(pdf_path, **spec)
+        return result
+
+    def extract_activity_tables_from_pdf(self, pdf_path: str) -> Optional[pd.DataFrame]:
+        return self._extract_region_tables(pdf_path, "activities")
+
+    def extract_objectives_tables_from_pdf(self, pdf_path: str) -> Optional[pd.DataFrame]:
+        return self._extract_region_tables(pdf_path, "objectives")
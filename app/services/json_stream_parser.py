@@ -0,0 +1,68 @@
+import json
+from typing import List, Optional, AsyncIterator
+
+from loguru import logger
+
+
+class JsonObjectStreamParser:
+    """
+    Incremental parser for LLM output: feed text chunks, get back every top-level JSON object
+    as soon as its closing brace arrives. Objects inside a top-level array count as top-level,
+    any text between objects (array brackets, commas, prose, markdown fences) is ignored.
+    """
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[dict]:
+        objects = []
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._buffer = [ch]
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    text = ''.join(self._buffer)
+                    self._buffer = []
+                    try:
+                        objects.append(json.loads(text))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed JSON object from LLM output: {e}")
+
+        return objects
+
+
+async def iter_json_objects(chunks: AsyncIterator[str], limit: Optional[int] = None) -> AsyncIterator[dict]:
+    """
+    Parse a stream of text chunks into JSON objects; once `limit` objects are complete
+    the chunk stream is closed, which stops the generation behind it
+    """
+    parser = JsonObjectStreamParser()
+    count = 0
+    try:
+        async for chunk in chunks:
+            for obj in parser.feed(chunk):
+                yield obj
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+    finally:
+        await chunks.aclose()
@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import random
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Optional, List, AsyncIterator, Callable, Dict
+
+import httpx
+import pandas as pd
+from loguru import logger
+
+from app.infrastructure.llm.clients.base_llm_client import BaseLLMClient
+from app.infrastructure.llm.clients.rate_limited_llm_client import RateLimitedLLMClient, estimate_tokens
+from app.infrastructure.llm.clients.simulated_llm_client import (
+    SimulatedBackend, SimulatedLLMClient, SimulatedHttpLLMClient, SimulationProfile,
+)
+from app.infrastructure.llm.rate_limiter import RateLimiter, AimdConcurrencyLimiter
+from app.infrastructure.llm.simulated_llm_server import serve
+from app.services.activity_converter import ActivityConverter
+from app.services.soa_matrix_benchmark import synthetic_soa
+from app.services.soa_prompt_encoder import SoAPromptEncoder
+
+
+MODEL = "simulated"
+ACTIVITY_EXAMPLE_PATH = Path(__file__).parent.parent / "json_templates" / "activity_example.json"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+@dataclass
+class RequestRecord:
+    start: float
+    first_chunk: Optional[float] = None
+    end: Optional[float] = None
+    error: Optional[str] = None
+    output_tokens: int = 0
+
+
+class _RecordingLLMClient(BaseLLMClient):
+    """
+    Client side timing of every streamed request: latency and time to first chunk as the converter sees them,
+    rate limiter waits and retries included
+    """
+    def __init__(self, client: BaseLLMClient):
+        super().__init__()
+        self._client = client
+        self.records: List[RequestRecord] = []
+
+    def register_prefix(self, model: str, messages: list, placeholder: str) -> None:
+        self._client.register_prefix(model, messages, placeholder)
+
+    async def generate(self, operation: str, model: str, prompt: str, image: Optional[str] = None):
+        return await self._client.generate(operation, model, prompt, image)
+
+    async def chat(self, operation: str, model: str, prompt: str, history: Optional[list] = None, image: Optional[str] = None):
+        return await self._client.chat(operation, model, prompt, history, image)
+
+    async def stream_generate(self, operation: str, model: str, prompt: str, max_new_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        record = RequestRecord(start=time.perf_counter())
+        self.records.append(record)
+        try:
+            async for chunk in self._client.stream_generate(operation, model, prompt, max_new_tokens):
+                if record.first_chunk is None:
+                    record.first_chunk = time.perf_counter()
+                record.output_tokens += estimate_tokens(chunk)
+                yield chunk
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            record.end = time.perf_counter()
+
+    def metrics(self) -> Dict:
+        return self._client.metrics()
+
+
+@dataclass
+class LevelResult:
+    concurrency: int
+    jobs: int = 0
+    failed_jobs: int = 0
+    activities: int = 0
+    makespan_s: float = 0.0
+    job_queue_delays: List[float] = field(default_factory=list)
+    server_queue_waits: List[float] = field(default_factory=list)
+    records: List[RequestRecord] = field(default_factory=list)
+    metrics: Dict = field(default_factory=dict)
+
+
+def load_tables(csv_dir: Optional[str], documents: int, rows: int, visits: int, density: float, seed: int) -> List[pd.DataFrame]:
+    if csv_dir:
+        return [pd.read_csv(path) for path in sorted(Path(csv_dir).glob("*.csv"))]
+    return [synthetic_soa(rows, visits, density, seed=seed + i) for i in range(documents)]
+
+
+def split_jobs(tables: List[pd.DataFrame], chunk_rows: int) -> List[pd.DataFrame]:
+    # the way the streaming pipeline sends a table: PIPELINE_CHUNK_ROWS rows per conversion
+    return [table.iloc[start:start + chunk_rows] for table in tables for start in range(0, len(table), chunk_rows)]
+
+
+async def run_level(make_client: Callable[[], BaseLLMClient],
+                    jobs: List[pd.DataFrame],
+                    concurrency: int,
+                    prompt_encoder: Optional[SoAPromptEncoder],
+                    arrival_rate: Optional[float],
+                    limiter_args: dict,
+                    seed: int = 0) -> LevelResult:
+    """
+    `concurrency` conversions in flight; all jobs arrive at once (a batch run of pipeline())
+    or one by one at `arrival_rate` jobs/s (Poisson, on-demand uploads)
+    """
+    backend_client = make_client()
+    limiter = RateLimiter(concurrency=AimdConcurrencyLimiter(initial=concurrency, maximum=concurrency), **limiter_args)
+    client = _RecordingLLMClient(RateLimitedLLMClient(backend_client, limiter))
+    converter = ActivityConverter(client, MODEL, ACTIVITY_EXAMPLE_PATH.read_text(encoding="utf-8"), prompt_encoder=prompt_encoder)
+    result = LevelResult(concurrency=concurrency)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    randomizer = random.Random(seed)
+
+    async def producer():
+        for job in jobs:
+            if arrival_rate:
+                await asyncio.sleep(randomizer.expovariate(arrival_rate))
+            queue.put_nowait((time.perf_counter(), job))
+        for _ in range(concurrency):
+            queue.put_nowait(None)
+
+    async def worker():
+        while (item := await queue.get()) is not None:
+            arrived_at, table = item
+            result.job_queue_delays.append(time.perf_counter() - arrived_at)
+            try:
+                activities = await converter.convert(table)
+                result.activities += len(activities)
+                result.jobs += 1
+            except Exception:
+                result.failed_jobs += 1
+
+    start_time = time.perf_counter()
+    # the converter prints every activity, a load test only needs the totals
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    result.makespan_s = time.perf_counter() - start_time
+
+    result.records = client.records
+    result.server_queue_waits = list(backend_client.queue_waits)
+    result.metrics = client.metrics()
+    if isinstance(backend_client, SimulatedHttpLLMClient):
+        await backend_client.aclose()
+    return result
+
+
+def print_report(results: List[LevelResult], time_scale: float):
+    """
+    Times in simulated seconds: measured * time_scale
+    """
+    def ms(values: List[float], q: float) -> str:
+        return f"{percentile(values, q) * time_scale:.1f}"
+
+    header = (f"{'conc':>5}{'jobs':>6}{'fail':>6}{'act/s':>8}{'tok/s':>8}"
+              f"{'lat p50':>9}{'p95':>8}{'p99':>8}{'ttft p50':>10}{'p95':>8}"
+              f"{'queue p50':>11}{'p95':>8}{'p99':>8}{'srvq p95':>10}{'429':>6}{'retry':>7}")
+    print(header)
+    for r in results:
+        done = [rec for rec in r.records if rec.end is not None and rec.error is None]
+        latencies = [rec.end - rec.start for rec in done]
+        ttfts = [rec.first_chunk - rec.start for rec in done if rec.first_chunk is not None]
+        makespan = r.makespan_s * time_scale
+        output_tokens = sum(rec.output_tokens for rec in done)
+        print(f"{r.concurrency:>5}{r.jobs:>6}{r.failed_jobs:>6}"
+              f"{r.activities / makespan if makespan else 0:>8.2f}{output_tokens / makespan if makespan else 0:>8.1f}"
+              f"{ms(latencies, 50):>9}{ms(latencies, 95):>8}{ms(latencies, 99):>8}{ms(ttfts, 50):>10}{ms(ttfts, 95):>8}"
+              f"{ms(r.job_queue_delays, 50):>11}{ms(r.job_queue_delays, 95):>8}{ms(r.job_queue_delays, 99):>8}"
+              f"{ms(r.server_queue_waits, 95):>10}{r.metrics.get('throttled', 0):>6}{r.metrics.get('retries', 0):>7}")
+    print("act/s, tok/s - activities and output tokens per second; lat - request latency, ttft - time to first token, "
+          "queue - job wait for a free conversion slot, srvq - wait in the server queue; times in s")
+
+
+def _start_stub(profile: SimulationProfile, port: int, seed: int) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve, kwargs={"profile": profile, "port": port, "seed": seed}, daemon=True
+    )
+    process.start()
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"LLM stub did not start on port {port}")
+
+
+def _profile_from_args(args, time_scale: float) -> SimulationProfile:
+    # a time scale of 10 runs the simulation 10x faster, all rates and delays are scaled
+    return SimulationProfile(
+        overhead_s=args.overhead / time_scale,
+        prefill_tokens_per_s=args.prefill_tps * time_scale,
+        decode_tokens_per_s=args.decode_tps * time_scale,
+        max_concurrency=args.server_concurrency,
+        batch_slowdown=args.batch_slowdown,
+        max_queue=args.max_queue,
+        throttle_rate=args.throttle_rate,
+        retry_after_s=args.retry_after / time_scale,
+        error_rate=args.error_rate,
+    )
+
+
+def main():
+    """
+    Capacity of the activity conversion stage against a simulated LLM server:
+    throughput and p50/p95/p99 latency and queueing at every concurrency level, no model needed
+        python -m app.services.llm_load_test --concurrency 1 2 4 8 --server-concurrency 4 --time-scale 20
+        python -m app.services.llm_load_test --backend http ...            (stub started on --stub-port)
+        python -m app.services.llm_load_test --serve-stub --stub-port 8090 (only the HTTP stub)
+    """
+    parser = argparse.ArgumentParser(description="Load test of the activity conversion with a simulated LLM")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="conversions in flight")
+    parser.add_argument("--backend", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--url", help="running HTTP stub or OpenAI style server, otherwise a stub is started")
+    parser.add_argument("--stub-port", type=int, default=8090)
+    parser.add_argument("--serve-stub", action="store_true", help="run the HTTP stub only")
+    # workload
+    parser.add_argument("--csv-dir", help="real activity CSVs (e.g. OUTPUT_DIR), synthetic tables otherwise")
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--visits", type=int, default=30)
+    parser.add_argument("--density", type=float, default=0.3)
+    parser.add_argument("--chunk-rows", type=int, default=25, help="rows per conversion request")
+    parser.add_argument("--prompt-format", choices=("compact", "csv"), default="compact")
+    parser.add_argument("--token-budget", type=int, default=2048)
+    parser.add_argument("--arrival-rate", type=float, help="jobs/s in simulated time, all at once when not set")
+    # server model
+    parser.add_argument("--overhead", type=float, default=0.05)
+    parser.add_argument("--prefill-tps", type=float, default=500.0)
+    parser.add_argument("--decode-tps", type=float, default=20.0)
+    parser.add_argument("--server-concurrency", type=int, default=1)
+    parser.add_argument("--batch-slowdown", type=float, default=0.0)
+    parser.add_argument("--max-queue", type=int)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    # client
+    parser.add_argument("--rpm", type=float)
+    parser.add_argument("--tpm", type=float)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="run the simulation this many times faster")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    time_scale = args.time_scale
+    profile = _profile_from_args(args, time_scale)
+    if args.serve_stub:
+        serve(profile, port=args.stub_port, seed=args.seed)
+        return
+
+    logger.disable("app")
+    jobs = split_jobs(load_tables(args.csv_dir, args.documents, args.rows, args.visits, args.density, args.seed), args.chunk_rows)
+    prompt_encoder = SoAPromptEncoder(args.token_budget) if args.prompt_format == "compact" else None
+    limiter_args = {
+        "requests_per_minute": args.rpm * time_scale if args.rpm else None,
+        "tokens_per_minute": args.tpm * time_scale if args.tpm else None,
+        "max_retries": args.max_retries,
+        "backoff_base_s": 1.0 / time_scale,
+    }
+    arrival_rate = args.arrival_rate * time_scale if args.arrival_rate else None
+
+    stub = None
+    url = args.url
+    if args.backend == "http" and not url:
+        # a stub restarted per level would measure its start, one stub serves all levels (its queue drains between them)
+        stub = _start_stub(profile, args.stub_port, args.seed)
+        url = f"http://127.0.0.1:{args.stub_port}"
+
+    def make_client() -> BaseLLMClient:
+        if args.backend == "http":
+            return SimulatedHttpLLMClient(url)
+        return SimulatedLLMClient(SimulatedBackend(replace(profile), seed=args.seed))
+
+    print(f"{len(jobs)} conversion jobs, {args.prompt_format} prompts, {args.backend} backend, "
+          f"server: {args.server_concurrency} slots, prefill {args.prefill_tps:g} tok/s, decode {args.decode_tps:g} tok/s")
+    try:
+        results = []
+        for concurrency in args.concurrency:
+            results.append(asyncio.run(run_level(make_client, jobs, concurrency, prompt_encoder, arrival_rate, limiter_args, args.seed)))
+        print_report(results, time_scale)
+    finally:
+        if stub:
+            stub.terminate()
+
+
+if __name__ == '__main__':
+    main()
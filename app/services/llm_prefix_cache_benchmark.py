@@ -0,0 +1,49 @@
+import asyncio
+import time
+from pathlib import Path
+from statistics import median
+
+from app.core.settings import get_settings
+from app.models.provider_schema import LLMProvider
+from app.infrastructure.llm.llm_client_factory import llm_client_factory
+from app.services.activity_converter import build_activity_prompt, CSV_PLACEHOLDER
+
+
+base_path = Path(__file__).parent.parent
+
+
+async def time_to_first_token(llm_client, model: str, prompt: list) -> float:
+    start_time = time.perf_counter()
+    token_stream = llm_client.stream_generate(operation="ttft benchmark", model=model, prompt=prompt)
+    async for _ in token_stream:
+        break
+    ttft = time.perf_counter() - start_time
+    await token_stream.aclose()     # stop the generation, only the first token matters
+    return ttft
+
+
+async def main(runs: int = 3):
+    """
+    Time-to-first-token of the activity conversion prompt with and without the prefix KV cache
+    """
+    llm_client = llm_client_factory.of(LLMProvider.hg_local)
+    model = "meta-llama/Meta-Llama-3-8B-Instruct"
+
+    activity_example = (base_path / "json_templates" / "activity_example.json").read_text(encoding="utf-8")
+    csv_files = sorted(Path(get_settings().OUTPUT_DIR).glob("*_activities.csv"))
+    csv_text = csv_files[0].read_text(encoding="utf-8") if csv_files else "Procedure,Screening,Day 1\nECG,X,X\n"
+    prompt = build_activity_prompt(activity_example, csv_text)
+
+    llm_client.register_prefix(model, build_activity_prompt(activity_example, CSV_PLACEHOLDER), CSV_PLACEHOLDER)
+
+    results = {}
+    for cache_enabled in (False, True):
+        llm_client.prefix_cache_enabled = cache_enabled
+        results[cache_enabled] = [await time_to_first_token(llm_client, model, prompt) for _ in range(runs)]
+
+    print(f"TTFT without prefix cache: median {median(results[False]):.2f}s  {results[False]}")
+    print(f"TTFT with prefix cache:    median {median(results[True]):.2f}s  {results[True]}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import multiprocessing
+import time
+from typing import Optional
+
+from app.core.memory import current_rss_mb, peak_rss_mb
+from app.infrastructure.llm.clients.local_hf_client import LocalHFClient, INFERENCE_PROFILES
+
+
+MODEL = "meta-llama/Meta-Llama-3-8B-Instruct"
+PROMPT = "Below is a table of scheduled activities. Extract each row into JSON with fields: activity, day, time, location"
+
+
+def run_profile(profile: str, num_threads: Optional[int], max_new_tokens: int) -> dict:
+    """
+    Runs in a fresh process, so RSS of one profile does not leak into the next one
+    """
+    client = LocalHFClient(inference_profile=profile, num_threads=num_threads)
+
+    start_time = time.perf_counter()
+    tokenizer, _ = client._load_model(MODEL)
+    load_time = time.perf_counter() - start_time
+    rss_after_load = current_rss_mb()
+    peak_rss_load = peak_rss_mb()
+
+    start_time = time.perf_counter()
+    text = client._generate_text(PROMPT, MODEL, max_new_tokens=max_new_tokens)
+    generation_time = time.perf_counter() - start_time
+    new_tokens = len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    return {
+        "profile": profile,
+        "load_s": load_time,
+        "rss_mb": rss_after_load,
+        "peak_load_rss_mb": peak_rss_load,
+        "peak_rss_mb": peak_rss_mb(),
+        "tokens_per_s": new_tokens / generation_time if generation_time else 0.0,
+    }
+
+
+def main(num_threads: Optional[int] = None, max_new_tokens: int = 64):
+    """
+    Load time, RSS and generation speed of LocalHFClient for every CPU inference profile
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for profile in INFERENCE_PROFILES:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_profile, (profile, num_threads, max_new_tokens)))
+
+    print(f"{'profile':<10}{'load, s':>10}{'RSS, MB':>12}{'load peak, MB':>16}{'peak, MB':>12}{'tokens/s':>10}")
+    for r in results:
+        print(f"{r['profile']:<10}{r['load_s']:>10.1f}{r['rss_mb']:>12.0f}{r['peak_load_rss_mb']:>16.0f}"
+              f"{r['peak_rss_mb']:>12.0f}{r['tokens_per_s']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@ import json
 import string
 import os
 import re
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List
 
 from bs4 import BeautifulSoup
 from pathlib import Path
@@ -11,12 +11,17 @@ from injector import inject
 
 from app.core.settings import Settings
 from app.infrastructure.grobid_client import GrobidClient
+from app.infrastructure.page_text_index import PageTextIndex
+from app.infrastructure.tei_artifact_store import TeiArtifactStore
 
 
 class PDFConvertor:
     @inject
-    def __init__(self, client: GrobidClient, settings: Settings):
+    def __init__(self, client: GrobidClient, settings: Settings, page_index: PageTextIndex, tei_store: TeiArtifactStore):
         self._client = client
+        self._page_index = page_index if settings.PAGE_INDEX_ENABLED else None
+        self._tei_store = tei_store
+        self._grobid_version = settings.GROBID_VERSION     # pinned, or the live version once Grobid answered
 
 
     def _add_period_to_sentence(self, sentence:Optional[str]):
@@ -96,6 +101,25 @@ class PDFConvertor:
         return f"{title}\n{text}"
 
 
+    def _split_content_by_page(self, soup) -> List[Tuple[Optional[int], str]]:
+        """
+        Group body sentences by the page of their coordinates (needs teiCoordinates=s),
+        the whole text goes as one page None if Grobid returned no coordinates
+        """
+        body_tag = soup.find("body")
+        pages = {}
+        for s_tag in body_tag.find_all("s") if body_tag else []:
+            first_box = (s_tag.get("coords") or "").split(';')[0]
+            page_num, _ = self._extract_page_and_bbox(first_box)
+            if page_num is not None:
+                pages.setdefault(page_num + 1, []).append(s_tag.get_text())
+
+        if not pages:
+            return [(None, self._clean_text(self._extract_content(soup)))]
+
+        return [(page_num, self._clean_text(" ".join(texts))) for page_num, texts in sorted(pages.items())]
+
+
     def _replace_all_head(self, soup):
         for head_tag in soup.find_all("head"):
             number = head_tag.get("n")
@@ -123,22 +147,54 @@ class PDFConvertor:
         return cleared_text.strip()
 
 
-    def extract_pages_text_from_pdf(self, pdf_path: str, output_dir: str):
-        filename = Path(pdf_path).stem
+    def _resolve_grobid_version(self) -> Optional[str]:
+        """
+        GROBID_VERSION, otherwise the version of the running Grobid - asked once per process, so an upgraded
+        Grobid does not reuse TEI of the old one. None while Grobid is not reachable
+        """
+        if self._grobid_version is None:
+            self._grobid_version = self._client.get_version()
+        return self._grobid_version
+
+    def fetch_tei(self, pdf_path: str) -> str:
+        """
+        TEI XML of the PDF from the artifact store, Grobid is called only when it is not there yet.
+        With Grobid not reachable the stored TEI of any Grobid version is used
+        """
+        pdf_hash = self._tei_store.pdf_hash(pdf_path)
+        params_hash = self._tei_store.params_hash(self._client.fulltext_params)
+        grobid_version = self._resolve_grobid_version()
+
+        tei_xml = self._tei_store.get(pdf_hash, params_hash, grobid_version)
+        if tei_xml:
+            source = "" if grobid_version else " (Grobid is not reachable, latest stored version)"
+            print(f"Reusing stored TEI XML for {Path(pdf_path).name}{source}")
+            return tei_xml
 
         print("Processing PDF with GROBID...")
         tei_xml = self._client.call_process_fulltext(pdf_path)
+        if tei_xml:
+            grobid_version = grobid_version or self._resolve_grobid_version() or "unknown"
+            stored_path = self._tei_store.put(pdf_hash, params_hash, grobid_version, tei_xml)
+            print(f"Successfully received TEI XML from GROBID, stored to {stored_path}")
+
+        return tei_xml
+
+
+    def extract_pages_text_from_pdf(self, pdf_path: str, output_dir: str):
+        filename = Path(pdf_path).stem
+
+        tei_xml = self.fetch_tei(pdf_path)
         if not tei_xml:
             print("Failed to get TEI XML from GROBID. Aborting.")
             raise Exception("Failed to get TEI XML from GROBID. Aborting.")
 
-        print("Successfully received TEI XML from GROBID.")
-        #os.makedirs("./data/output_dir", exist_ok=True)
-        with open(os.path.join("./data/output_dir", f"{filename}.xml"), "w", encoding="utf-8") as f_xml:
-             f_xml.write(tei_xml)
-
         soup = BeautifulSoup(tei_xml, 'lxml-xml')
 
+        if self._page_index:
+            pages_count = self._page_index.index_pages(filename, "grobid", self._split_content_by_page(soup))
+            print(f"Indexed {pages_count} Grobid pages of {filename}")
+
         self._replace_all_head(soup)
         full_text = self._extract_content(soup)
         full_text = self._clean_text(full_text)
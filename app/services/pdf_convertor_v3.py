@@ -1,15 +1,33 @@
+import hashlib
 import logging
 import re
-from typing import Optional, Tuple, List, Dict, Callable
+import sqlite3
+from collections import Counter
+from typing import Optional, Tuple, List, Dict, Callable, Iterable, Iterator, Collection
 from difflib import SequenceMatcher
 
 import camelot
 import pandas as pd
 import pdfplumber
+from pdfminer.pdftypes import resolve1, PDFStream
+
+from app.core.memory import check_rss_limit
+from app.infrastructure.page_cache import PageCache
+
+
+# (page number starting from 1, page text)
+PageText = Tuple[int, str]
 
 
 class PDFConvertorV3:
-    def __init__(self):
+    def __init__(self, max_rss_mb: Optional[int] = None, page_cache: Optional[PageCache] = None):
+        self._max_rss_mb = max_rss_mb
+
+        # page level reuse between runs and protocol amendments
+        self._page_cache = page_cache
+        self._page_fingerprints: Dict[str, Dict[int, str]] = {}     # pdf path -> page number -> fingerprint
+        self._reuse_stats: Dict[str, Counter] = {}
+
         self.activities_patterns = [
             re.compile(r"Schedule\s+of\s+Activities", re.IGNORECASE),
             re.compile(r"Schedule\s+of\s+Activities\s+(SoA)", re.IGNORECASE),
@@ -30,36 +48,148 @@ class PDFConvertorV3:
             re.compile(r"Primary\s+Objectives", re.IGNORECASE),
         ]
 
-    def _extract_text_with_pdfplumber(self, pdf_path:str) -> List[str]:
-        pages_text = []
+    def _iter_text_with_pdfplumber(self, pdf_path: str, count_reuse: bool = True) -> Iterator[PageText]:
+        """
+        Yield pages one by one and drop pdfplumber layout caches of every page right after use,
+        so memory does not grow with the number of pages.
+        The table scans pass count_reuse=False: they walk the same pages again after the text stage
+        and reuse its fingerprints, the reuse stats count every page once per run.
+        """
+        fingerprints = self._page_fingerprints.setdefault(str(pdf_path), {})
+        stats = self._reuse_stats.setdefault(str(pdf_path), Counter())
         try:
             with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
+                for page_num, page in enumerate(pdf.pages, start=1):
+                    try:
+                        text = None
+                        if self._page_cache:
+                            if page_num not in fingerprints:
+                                fingerprints[page_num] = self._page_fingerprint(page)
+                            text = self._cached_text(fingerprints[page_num])
+
+                        if text is None:
+                            text = page.extract_text() or ""
+                            if count_reuse:
+                                stats["text_pages_extracted"] += 1
+                            if self._page_cache:
+                                self._store_text(fingerprints[page_num], text)
+                        elif count_reuse:
+                            stats["text_pages_reused"] += 1
+                    finally:
+                        page.close()
+
+                    check_rss_limit(self._max_rss_mb, f"on page {page_num} of {pdf_path}")
                     if text:
-                        pages_text.append(text)
+                        yield page_num, text
+        except MemoryError:
+            raise
         except Exception as e:
             print(f"Error extracting text with pdfplumber: {e}")
-        return pages_text
 
-    def _find_pages_by_pattern(self, pages_text: List[str], patterns: List[re.Pattern]) -> List[Tuple[int, str]]:
+    # page cache failures (e.g. a locked database) fall back to extraction, they must not end the page stream
+
+    def _cached_text(self, fingerprint: str) -> Optional[str]:
+        try:
+            return self._page_cache.get_text(fingerprint)
+        except sqlite3.Error as e:
+            print(f"Page cache read failed, extracting the page again: {e}")
+            return None
+
+    def _store_text(self, fingerprint: str, text: str):
+        try:
+            self._page_cache.put_text(fingerprint, text)
+        except sqlite3.Error as e:
+            print(f"Page cache write failed: {e}")
+
+    def _cached_tables(self, fingerprint: str, flavor: str) -> Optional[List[pd.DataFrame]]:
+        try:
+            return self._page_cache.get_tables(fingerprint, flavor)
+        except sqlite3.Error as e:
+            print(f"Page cache read failed, extracting the page tables again: {e}")
+            return None
+
+    def _store_tables(self, fingerprint: str, flavor: str, tables: List[pd.DataFrame]):
+        try:
+            self._page_cache.put_tables(fingerprint, flavor, tables)
+        except sqlite3.Error as e:
+            print(f"Page cache write failed: {e}")
+
+    def _page_fingerprint(self, page) -> str:
+        """
+        Hash of the raw page content streams, the page size and the fonts and XObjects the page draws with.
+        Read straight from the PDF objects: page.chars / page.objects would run the full pdfplumber layout
+        parse, which costs as much as extract_text() and would leave nothing for a text cache hit to save
+        """
+        page_obj = page.page_obj
+        digest = hashlib.sha1(f"{page.width:.0f}x{page.height:.0f}".encode())
+        for stream in page_obj.contents:
+            digest.update(resolve1(stream).get_data())
+
+        resources = resolve1(page_obj.resources) or {}
+        for kind in ("Font", "XObject"):
+            for name, ref in sorted((resolve1(resources.get(kind)) or {}).items()):
+                obj = resolve1(ref)
+                digest.update(f"|{kind}/{name}".encode())
+                if isinstance(obj, PDFStream):      # images and form XObjects
+                    digest.update(obj.get_rawdata() or b"")
+                elif isinstance(obj, dict):
+                    digest.update(str(obj.get("BaseFont")).encode())
+
+        return digest.hexdigest()
+
+    def reset_reuse_stats(self, pdf_path: str):
+        self._reuse_stats.pop(str(pdf_path), None)
+        self._page_fingerprints.pop(str(pdf_path), None)
+
+    def get_reuse_stats(self, pdf_path: str) -> Dict[str, int]:
+        """
+        How many pages were taken from the page cache vs extracted again (text and camelot)
+        """
+        return dict(self._reuse_stats.get(str(pdf_path), Counter()))
+
+    def _extract_text_with_pdfplumber(self, pdf_path:str) -> List[str]:
+        return [text for _, text in self._iter_text_with_pdfplumber(pdf_path)]
+
+    def _find_pages_by_pattern(self, pages_text: Iterable[PageText], patterns: List[re.Pattern]) -> List[Tuple[int, str]]:
         results = []
-        for page_num, text in enumerate(pages_text):
+        for page_num, text in pages_text:
             for pattern in patterns:
                 if pattern.search(text):
-                    results.append((page_num+1, text))  # +1: pages are started from 1, but enym from 0
+                    results.append((page_num, text))
         return results
 
 
+    def _read_page_tables(self, pdf_path: str, page_num: int, flavor: str = "lattice") -> List[pd.DataFrame]:
+        """
+        Cleaned camelot tables of one page, reused from the page cache when the page did not change
+        """
+        fingerprint = self._page_fingerprints.get(str(pdf_path), {}).get(page_num)
+        stats = self._reuse_stats.setdefault(str(pdf_path), Counter())
+
+        if self._page_cache and fingerprint:
+            cached = self._cached_tables(fingerprint, flavor)
+            if cached is not None:
+                stats["table_pages_reused"] += 1
+                return cached
+
+        extracted_tables = camelot.read_pdf(pdf_path, pages=str(page_num), flavor=flavor)
+        tables = [table.df.map(lambda x: self._clean_cell_value(x)) for table in extracted_tables]
+        stats["table_pages_extracted"] += 1
+
+        if self._page_cache and fingerprint:
+            self._store_tables(fingerprint, flavor, tables)
+
+        return tables
+
     def _extract_tables_with_camelot(self, pdf_path: str, page_num: int, min_table_col: int) -> Dict[int, pd.DataFrame]:
         tables = {}
         try:
-            extracted_tables = camelot.read_pdf(pdf_path, pages=str(page_num))
+            extracted_tables = self._read_page_tables(pdf_path, page_num)
             #TODO: move table checking outside
             #table contains more than min_table_col column, keep it
             for table in extracted_tables:
-                if table.df.shape[1] > min_table_col:
-                    tables[page_num] = table.df.map(lambda x: self._clean_cell_value(x))
+                if table.shape[1] > min_table_col:
+                    tables[page_num] = table
                 else:
                     print(f'    A [Table] was found with less then {min_table_col} column, skipped')
 
@@ -211,14 +341,31 @@ class PDFConvertorV3:
 
         return merged_df
 
-    def _only_continuous_and_activity_schedule_tables(self, tables: Dict[int, pd.DataFrame]) -> List[pd.DataFrame]:
+    def _source_pages(self, tables: List[pd.DataFrame], pages_tables: Dict[int, pd.DataFrame], header_count: int) -> List[Optional[int]]:
+        """
+        Follow _merge_tables_skip_headers and _merge_rows_and_rename_columns row by row
+        and return the page each row of the final table came from
+        """
+        page_of = {id(table): page_num for page_num, table in pages_tables.items()}
+
+        rows_pages = []
+        for i, table in enumerate(tables):
+            if i == 0:
+                rows_pages.extend([page_of.get(id(table))] * len(table))
+            elif len(table) > header_count:
+                rows_pages.extend([page_of.get(id(table))] * (len(table) - header_count))
+
+        return rows_pages[header_count:] if header_count > 0 else rows_pages
+
+    def _only_continuous_and_activity_schedule_tables(self, tables: Dict[int, pd.DataFrame],
+                                                      known_pages: Collection[int] = ()) -> List[pd.DataFrame]:
         """
         If the previous page (last_page) contained a schedule table (found == True)
         and the current page is immediately after (page_num - 1 == last_page),
         assume the table is a continuation of the previous schedule table
 
         Returns only those tables that:
-            Match schedule heuristics
+            Match schedule heuristics (or are on known_pages, already classified as schedule tables by the caller)
             Are grouped by page continuity
         """
 
@@ -233,7 +380,7 @@ class PDFConvertorV3:
             else:
                 found = False
 
-            if self._is_schedule_table_heuristic(tables[page_num]):
+            if page_num in known_pages or self._is_schedule_table_heuristic(tables[page_num]):
                 if not found:
                     schedule_tables.append(tables[page_num])
                 last_page, found = page_num, True
@@ -241,14 +388,15 @@ class PDFConvertorV3:
         return schedule_tables
 
 
-    def _only_continuous_and_objective_tables(self, tables: Dict[int, pd.DataFrame]) -> List[pd.DataFrame]:
+    def _only_continuous_and_objective_tables(self, tables: Dict[int, pd.DataFrame],
+                                              known_pages: Collection[int] = ()) -> List[pd.DataFrame]:
         last_page = -1
         objective_tables = []
         found = False
 
         for page_num in sorted(tables.keys()):
             current_table = tables[page_num]
-            is_objective = self._is_objectives_table_heuristic(current_table)
+            is_objective = page_num in known_pages or self._is_objectives_table_heuristic(current_table)
 
             # If previous table was valid and this page is consecutive, also require heuristic match
             if found and page_num - 1 == last_page and is_objective:
@@ -305,6 +453,11 @@ class PDFConvertorV3:
 
         return pages_text
 
+    def iter_text_pages_from_pdf(self, pdf_path: str) -> Iterator[PageText]:
+        """
+        Streaming version of extract_text_pages_from_pdf: (page_num, text) pairs, one page in memory at a time
+        """
+        return self._iter_text_with_pdfplumber(pdf_path)
 
 
     # def extract_activity_tables_from_pdf(self, pdf_path: str) -> Optional[pd.DataFrame]:
@@ -411,11 +564,11 @@ class PDFConvertorV3:
         pdf_path: str,
         patterns: List[re.Pattern],
         is_valid_table_fn: Callable[[pd.DataFrame], bool],
-        is_continuous_fn: Callable[[Dict[int, pd.DataFrame]], List[pd.DataFrame]],
+        is_continuous_fn: Callable[..., List[pd.DataFrame]],
         min_table_col_allowed: int,
         headers_row_count: Optional[int] = None
     ) -> Optional[pd.DataFrame]:
-        pages_text = self._extract_text_with_pdfplumber(pdf_path)
+        pages_text = self._iter_text_with_pdfplumber(pdf_path, count_reuse=False)
         pages_with_pattern = self._find_pages_by_pattern(pages_text, patterns)
         pattern_pages = [n for n, _ in pages_with_pattern]
 
@@ -428,7 +581,20 @@ class PDFConvertorV3:
                 tables = self._extract_tables_with_camelot(pdf_path, page_num + 1, min_table_col_allowed)
             all_tables.update(tables)
 
-        filtered_tables = is_continuous_fn(all_tables)
+        return self._process_page_tables(all_tables, is_continuous_fn, headers_row_count)
+
+    def _process_page_tables(
+        self,
+        all_tables: Dict[int, pd.DataFrame],
+        is_continuous_fn: Callable[..., List[pd.DataFrame]],
+        headers_row_count: Optional[int] = None,
+        known_pages: Collection[int] = ()
+    ) -> Optional[pd.DataFrame]:
+        """
+        Continuity, dedup and merge of the tables found per page (page number -> table);
+        tables on known_pages are taken as the table kind without the heuristic
+        """
+        filtered_tables = is_continuous_fn(all_tables, known_pages)
         if not filtered_tables:
             return None
 
@@ -438,23 +604,34 @@ class PDFConvertorV3:
 
         deduped = self._deduplicate_tables(filtered_tables)
         merged = self._merge_tables_skip_headers(deduped, headers_row_count)
-        return self._merge_rows_and_rename_columns(merged, headers_row_count)
+        result = self._merge_rows_and_rename_columns(merged, headers_row_count)
+
+        # provenance: a page number for every row of the merged table
+        result.attrs["source_pages"] = self._source_pages(deduped, all_tables, headers_row_count)
+        return result
+
+    def table_kinds(self) -> Dict[str, dict]:
+        """
+        Arguments of _extract_and_process_tables per table kind, also used by the page scheduler
+        """
+        return {
+            "activities": dict(
+                patterns=self.activities_patterns,
+                is_valid_table_fn=self._is_schedule_table_heuristic,
+                is_continuous_fn=self._only_continuous_and_activity_schedule_tables,
+                min_table_col_allowed=3,
+            ),
+            "objectives": dict(
+                patterns=self.objectives_patterns,
+                is_valid_table_fn=self._is_objectives_table_heuristic,
+                is_continuous_fn=self._only_continuous_and_objective_tables,
+                min_table_col_allowed=1,
+                headers_row_count=1,
+            ),
+        }
 
     def extract_activity_tables_from_pdf(self, pdf_path: str) -> Optional[pd.DataFrame]:
-        return self._extract_and_process_tables(
-            pdf_path,
-            self.activities_patterns,
-            self._is_schedule_table_heuristic,
-            self._only_continuous_and_activity_schedule_tables,
-            min_table_col_allowed=3,
-        )
+        return self._extract_and_process_tables(pdf_path, **self.table_kinds()["activities"])
 
     def extract_objectives_tables_from_pdf(self, pdf_path: str) -> Optional[pd.DataFrame]:
-        return self._extract_and_process_tables(
-            pdf_path,
-            self.objectives_patterns,
-            self._is_objectives_table_heuristic,
-            self._only_continuous_and_objective_tables,
-            min_table_col_allowed=1,
-            headers_row_count=1
-        )
+        return self._extract_and_process_tables(pdf_path, **self.table_kinds()["objectives"])
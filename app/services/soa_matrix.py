@@ -0,0 +1,247 @@
+import re
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+HEADER_SEPARATOR = ":"      # _merge_rows_and_rename_columns joins header rows with it
+
+# "X", "x", "✓", "●" optionally followed by footnote refs: "Xa", "X (b,c)", "X¹", "X*".
+# A ref is one character or a comma separated list of single characters, so "Xray" or "x days" are not marks
+_FOOTNOTE_REF = r"[a-z0-9¹²³⁴⁵⁶⁷⁸⁹⁰]"
+_MARK_PATTERN = re.compile(
+    rf"^(?:x|✓|✔|●|•)(?:\s*(?P<note>[\(\[]\s*{_FOOTNOTE_REF}(?:\s*,\s*{_FOOTNOTE_REF})*\s*[\)\]]"
+    rf"|{_FOOTNOTE_REF}(?:\s*,\s*{_FOOTNOTE_REF})*|[*†‡§¶]+))?$",
+    re.IGNORECASE,
+)
+
+# popcount of every byte value - row counts straight from the packed matrix
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class SoAMatrix:
+    """
+    Schedule of Activities as activities x visits:
+      - activities interned: `activities` holds distinct names, `row_activity` the name id of every table row
+      - visit header hierarchy from the merged "epoch:visit:day" column names, levels interned in `header_strings`
+      - occurrences bit-packed, 8 visits per byte (np.packbits)
+      - footnote refs and any other cell text kept sparse: (row, visit) -> text
+      - the raw text of marks other than a plain "X" ("Xa", "X (b,c)", "x") kept sparse too, so to_dataframe
+        gives back the cells of the source table
+    """
+    def __init__(self,
+                 activities: List[str],
+                 row_activity: np.ndarray,
+                 header_strings: List[str],
+                 header_codes: np.ndarray,
+                 packed: np.ndarray,
+                 visits_count: int,
+                 notes: Optional[Dict[Tuple[int, int], str]] = None,
+                 activity_header: str = "",
+                 mark_texts: Optional[Dict[Tuple[int, int], str]] = None):
+        self.activities = activities
+        self._activity_ids = {name: i for i, name in enumerate(activities)}
+        self.row_activity = row_activity            # int32 [rows]
+        self.header_strings = header_strings
+        self.header_codes = header_codes            # int32 [visits, levels], -1 where a column has fewer levels
+        self.packed = packed                        # uint8 [rows, ceil(visits / 8)]
+        self.visits_count = visits_count
+        self.notes = notes or {}
+        self.activity_header = activity_header
+        self.mark_texts = mark_texts or {}
+
+    # ---------- construction ----------
+
+    @classmethod
+    def from_dataframe(cls, table: pd.DataFrame, activity_column: Union[int, str] = 0) -> "SoAMatrix":
+        # columns by position: merged header rows of a multi-page SoA can give several columns the same name
+        activity_position = activity_column if isinstance(activity_column, int) else list(table.columns).index(activity_column)
+        visit_positions = [i for i in range(table.shape[1]) if i != activity_position]
+        visit_columns = [table.columns[i] for i in visit_positions]
+
+        names = table.iloc[:, activity_position].fillna("").astype(str).str.strip()
+        activities, row_activity = np.unique(names.to_numpy(), return_inverse=True)
+        # keep the table order of first appearance instead of the sorted one
+        first_row = {name: i for i, name in reversed(list(enumerate(names)))}
+        order = sorted(range(len(activities)), key=lambda i: first_row[activities[i]])
+        remap = np.empty(len(order), dtype=np.int32)
+        remap[order] = np.arange(len(order), dtype=np.int32)
+
+        header_strings, header_codes = cls._intern_headers([str(c) for c in visit_columns])
+
+        cells = table.iloc[:, visit_positions].fillna("").astype(str).to_numpy()
+        occurrences = np.zeros(cells.shape, dtype=bool)
+        notes, mark_texts = {}, {}
+        for (row, visit), cell in np.ndenumerate(cells):
+            cell = cell.strip()
+            if not cell:
+                continue
+            match = _MARK_PATTERN.match(cell)
+            if match:
+                occurrences[row, visit] = True
+                if cell != "X":
+                    mark_texts[(row, visit)] = cell
+                if match.group("note"):
+                    notes[(row, visit)] = match.group("note").strip("()[] ")
+            else:
+                notes[(row, visit)] = cell
+
+        return cls(
+            activities=[activities[i] for i in order],
+            row_activity=remap[row_activity.astype(np.int32)],
+            header_strings=header_strings,
+            header_codes=header_codes,
+            packed=np.packbits(occurrences, axis=1),
+            visits_count=len(visit_columns),
+            notes=notes,
+            activity_header=str(table.columns[activity_position]),
+            mark_texts=mark_texts,
+        )
+
+    @staticmethod
+    def _intern_headers(columns: List[str]) -> Tuple[List[str], np.ndarray]:
+        paths = [[level.strip() for level in column.split(HEADER_SEPARATOR)] for column in columns]
+        depth = max((len(p) for p in paths), default=0)
+        strings: Dict[str, int] = {}
+        codes = np.full((len(paths), depth), -1, dtype=np.int32)
+        for visit, path in enumerate(paths):
+            for level, text in enumerate(path):
+                codes[visit, level] = strings.setdefault(text, len(strings))
+        return list(strings), codes
+
+    # ---------- headers ----------
+
+    def header_path(self, visit: int) -> Tuple[str, ...]:
+        return tuple(self.header_strings[c] for c in self.header_codes[visit] if c >= 0)
+
+    def visit_label(self, visit: int) -> str:
+        """
+        The most specific (last non-empty) header level
+        """
+        return next((text for text in reversed(self.header_path(visit)) if text), "")
+
+    @property
+    def visit_labels(self) -> List[str]:
+        return [self.visit_label(v) for v in range(self.visits_count)]
+
+    @property
+    def epochs(self) -> List[str]:
+        """
+        Distinct top header level in column order (epochs when the SoA header has them)
+        """
+        if not self.header_codes.size:
+            return []
+        codes = self.header_codes[:, 0]
+        _, first = np.unique(codes, return_index=True)
+        return [self.header_strings[codes[i]] for i in sorted(first)]
+
+    def visits_of_epoch(self, epoch: str) -> np.ndarray:
+        code = self.header_strings.index(epoch)
+        return np.flatnonzero(self.header_codes[:, 0] == code)
+
+    # ---------- occurrences ----------
+
+    @property
+    def rows_count(self) -> int:
+        return len(self.row_activity)
+
+    def occurrences(self) -> np.ndarray:
+        """
+        bool [rows, visits]
+        """
+        return np.unpackbits(self.packed, axis=1, count=self.visits_count).astype(bool)
+
+    def activity_occurrences(self) -> np.ndarray:
+        """
+        bool [activities, visits] - rows of the same activity OR-ed together
+        """
+        result = np.zeros((len(self.activities), self.packed.shape[1]), dtype=np.uint8)
+        np.bitwise_or.at(result, self.row_activity, self.packed)
+        return np.unpackbits(result, axis=1, count=self.visits_count).astype(bool)
+
+    def visits_per_activity(self, activity: str) -> List[str]:
+        rows = self.row_activity == self._activity_ids[activity]
+        packed = np.bitwise_or.reduce(self.packed[rows], axis=0)
+        visits = np.flatnonzero(np.unpackbits(packed, count=self.visits_count))
+        return [self.visit_label(v) for v in visits]
+
+    def rows_of_visit(self, visit: int) -> np.ndarray:
+        """
+        Table rows scheduled at the visit, straight from its bit column
+        """
+        byte, bit = divmod(visit, 8)
+        return np.flatnonzero((self.packed[:, byte] >> (7 - bit)) & 1)
+
+    def activities_per_visit(self, visit: int) -> List[str]:
+        ids = np.unique(self.row_activity[self.rows_of_visit(visit)])
+        return [self.activities[i] for i in sorted(ids)]
+
+    def row_counts(self) -> np.ndarray:
+        """
+        Visits per table row, popcount of the packed bytes
+        """
+        return _POPCOUNT[self.packed].sum(axis=1, dtype=np.int32)
+
+    def visit_counts(self) -> np.ndarray:
+        """
+        Rows scheduled at every visit
+        """
+        return self.occurrences().sum(axis=0, dtype=np.int32)
+
+    def nbytes(self) -> int:
+        strings = sum(len(s.encode("utf-8")) for s in self.activities + self.header_strings)
+        notes = sum(len(n.encode("utf-8")) + 8 for n in list(self.notes.values()) + list(self.mark_texts.values()))
+        return self.row_activity.nbytes + self.header_codes.nbytes + self.packed.nbytes + strings + notes
+
+    # ---------- conversion ----------
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        The source table: plain marks as "X", annotated marks and other cell text as they were read
+        """
+        cells = np.where(self.occurrences(), "X", "").astype(object)
+        for (row, visit), note in self.notes.items():
+            if not cells[row, visit]:
+                cells[row, visit] = note
+        for (row, visit), text in self.mark_texts.items():
+            cells[row, visit] = text
+
+        columns = [HEADER_SEPARATOR.join(self.header_path(v)) for v in range(self.visits_count)]
+        table = pd.DataFrame(cells, columns=columns)
+        table.insert(0, self.activity_header, [self.activities[i] for i in self.row_activity])
+        return table
+
+    def save(self, path: Union[str, Path]):
+        note_keys = np.array(list(self.notes.keys()), dtype=np.int32).reshape(-1, 2)
+        mark_keys = np.array(list(self.mark_texts.keys()), dtype=np.int32).reshape(-1, 2)
+        np.savez(
+            path,
+            activities=np.array(self.activities, dtype=str),
+            row_activity=self.row_activity,
+            header_strings=np.array(self.header_strings, dtype=str),
+            header_codes=self.header_codes,
+            packed=self.packed,
+            visits_count=np.array(self.visits_count),
+            note_keys=note_keys,
+            note_values=np.array(list(self.notes.values()), dtype=str),
+            activity_header=np.array(self.activity_header),
+            mark_keys=mark_keys,
+            mark_values=np.array(list(self.mark_texts.values()), dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "SoAMatrix":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                activities=data["activities"].tolist(),
+                row_activity=data["row_activity"],
+                header_strings=data["header_strings"].tolist(),
+                header_codes=data["header_codes"],
+                packed=data["packed"],
+                visits_count=int(data["visits_count"]),
+                notes={(int(r), int(v)): str(n) for (r, v), n in zip(data["note_keys"], data["note_values"])},
+                activity_header=str(data["activity_header"]),
+                mark_texts={(int(r), int(v)): str(t) for (r, v), t in zip(data["mark_keys"], data["mark_values"])},
+            )
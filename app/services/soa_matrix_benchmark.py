@@ -0,0 +1,76 @@
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.services.soa_matrix import SoAMatrix
+
+
+def synthetic_soa(rows: int, visits: int, density: float = 0.3, seed: int = 0) -> pd.DataFrame:
+    """
+    Wide string SoA as the extractor produces it: merged "epoch:visit:day" headers, "X"/"Xa"/"" cells
+    """
+    rng = np.random.default_rng(seed)
+    epochs = ["Screening", "Treatment Period 1", "Treatment Period 2", "Follow-up"]
+    columns = [f"{epochs[v * len(epochs) // visits]}:Visit {v + 1}:Day {v * 7 - 28}" for v in range(visits)]
+    marks = np.where(rng.random((rows, visits)) < density, "X", "")
+    footnotes = rng.random((rows, visits)) < 0.02
+    marks = np.where(footnotes & (marks == "X"), "Xa", marks)
+
+    table = pd.DataFrame(marks, columns=columns)
+    table.insert(0, "Procedure", [f"Procedure {i % (rows // 2 or 1)}" for i in range(rows)])
+    return table
+
+
+def timed(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def main(rows: int = 2000, visits: int = 240):
+    """
+    Memory and query time of the wide string DataFrame vs SoAMatrix on a large multi-page SoA
+    """
+    table = synthetic_soa(rows, visits)
+    matrix = SoAMatrix.from_dataframe(table)
+    activity, visit = matrix.activities[len(matrix.activities) // 2], visits // 2
+    visit_columns = table.columns[1:]
+
+    def df_visits_per_activity():
+        rows_of_activity = table[table["Procedure"] == activity][visit_columns]
+        return [c.split(":")[-1] for c in visit_columns[rows_of_activity.apply(lambda col: col.str.startswith("X")).any()]]
+
+    def df_activities_per_visit():
+        return sorted(set(table.loc[table[visit_columns[visit]].str.startswith("X"), "Procedure"]))
+
+    def df_visit_counts():
+        return table[visit_columns].apply(lambda col: col.str.startswith("X")).sum()
+
+    assert df_visits_per_activity() == matrix.visits_per_activity(activity)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path, npz_path = Path(tmp_dir) / "soa.csv", Path(tmp_dir) / "soa.npz"
+        results = [
+            ("memory, KB", table.memory_usage(deep=True).sum() / 1024, matrix.nbytes() / 1024),
+            ("visits per activity, ms", timed(df_visits_per_activity) * 1000, timed(lambda: matrix.visits_per_activity(activity)) * 1000),
+            ("activities per visit, ms", timed(df_activities_per_visit) * 1000, timed(lambda: matrix.activities_per_visit(visit)) * 1000),
+            ("rows per visit, ms", timed(df_visit_counts) * 1000, timed(matrix.visit_counts) * 1000),
+            ("save, ms", timed(lambda: table.to_csv(csv_path, index=False)) * 1000, timed(lambda: matrix.save(npz_path)) * 1000),
+            ("load, ms", timed(lambda: pd.read_csv(csv_path)) * 1000, timed(lambda: SoAMatrix.load(npz_path)) * 1000),
+            ("file size, KB", csv_path.stat().st_size / 1024, npz_path.stat().st_size / 1024),
+        ]
+
+    print(f"SoA {rows} rows x {visits} visits, {len(matrix.activities)} distinct activities, {len(matrix.notes)} footnotes")
+    print(f"{'':<26}{'DataFrame':>12}{'SoAMatrix':>12}{'ratio':>8}")
+    for name, df_value, matrix_value in results:
+        print(f"{name:<26}{df_value:>12.2f}{matrix_value:>12.2f}{df_value / matrix_value if matrix_value else 0:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Callable, Optional, Tuple, Any
+
+import pandas as pd
+
+from app.services.soa_matrix import SoAMatrix
+
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_VISIT_ID = re.compile(r"\bV(\d+)\b")
+_VISIT_REF = re.compile(r"\bV\d+(?:-V\d+)?\b")   # "V3" or a collapsed range "V3-V6"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough BPE token count without a tokenizer: a word is one token per ~8 letters,
+    numbers split every 3 digits (Llama 3 style), every punctuation char is a token
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        if piece[0].isalpha():
+            tokens += 1 + len(piece) // 8
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+class VisitMap:
+    """
+    Short visit ids of the compact prompt (V1, V2, ...) <-> full visit headers, to expand LLM output back
+    """
+    def __init__(self, matrix: SoAMatrix):
+        self.matrix = matrix
+
+    @staticmethod
+    def visit_id(visit: int) -> str:
+        return f"V{visit + 1}"
+
+    def visit_index(self, visit_id: str) -> Optional[int]:
+        match = _VISIT_ID.fullmatch(visit_id.strip())
+        if match and 0 < int(match.group(1)) <= self.matrix.visits_count:
+            return int(match.group(1)) - 1
+        return None
+
+    def describe(self, visit: int) -> str:
+        return " / ".join(level for level in self.matrix.header_path(visit) if level)
+
+    def epoch(self, visit: int) -> str:
+        path = self.matrix.header_path(visit)
+        return path[0] if len(path) > 1 else ""
+
+    def describe_in_epoch(self, visit: int) -> str:
+        path = [level for level in self.matrix.header_path(visit) if level]
+        return " / ".join(path[1:] if self.epoch(visit) else path)
+
+    def legend(self, visits: List[int]) -> List[str]:
+        """
+        One line per epoch: "Screening: V1 = Visit 1 / Day -28, V2 = Visit 2 / Day -21"
+        """
+        lines, current_epoch, entries = [], None, []
+        for visit in sorted(visits):
+            epoch = self.epoch(visit)
+            if entries and epoch != current_epoch:
+                lines.append((f"{current_epoch}: " if current_epoch else "") + ", ".join(entries))
+                entries = []
+            current_epoch = epoch
+            entries.append(f"{self.visit_id(visit)} = {self.describe_in_epoch(visit)}")
+        if entries:
+            lines.append((f"{current_epoch}: " if current_epoch else "") + ", ".join(entries))
+        return lines
+
+    def expand(self, text: str) -> str:
+        def replace(match):
+            visits = [self.visit_index(visit_id) for visit_id in match.group(0).split("-")]
+            if any(visit is None for visit in visits):
+                return match.group(0)
+            return " to ".join(self.describe(visit) for visit in visits)
+        return _VISIT_REF.sub(replace, text)
+
+    def expand_json(self, value: Any) -> Any:
+        """
+        Visit ids in every string of an LLM produced object replaced with full visit headers
+        """
+        if isinstance(value, str):
+            return self.expand(value)
+        if isinstance(value, dict):
+            return {k: self.expand_json(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.expand_json(v) for v in value]
+        return value
+
+
+@dataclass
+class EncodedChunk:
+    text: str               # legend + activity lines
+    rows: List[int]         # positions of the table rows in this chunk
+    tokens: int
+
+
+class SoAPromptEncoder:
+    """
+    SoA table -> compact prompt text: one legend of the visits a chunk refers to and
+    one line per activity row with its 1-based row number and the visit ids it is scheduled at (ranges collapsed, footnotes kept):
+
+        Visits:
+        Screening: V1 = Visit 1 / Day -28, V2 = Visit 2 / Day -21
+        Treatment: V3 = Visit 3 / Day 1, ...
+        Activities:
+        - [1] Informed consent: V1
+        - [2] Vital signs: V1(a), V2-V6
+
+    Rows are split into chunks so that each one stays within `max_tokens`.
+    """
+    def __init__(self, max_tokens: int = 2048, token_counter: Callable[[str], int] = estimate_tokens):
+        self._max_tokens = max_tokens
+        self._count_tokens = token_counter
+
+    def _row_visits(self, matrix: SoAMatrix, occurrences, row: int) -> Tuple[str, List[int]]:
+        visits = [v for v in range(matrix.visits_count) if occurrences[row, v] or (row, v) in matrix.notes]
+        parts, run = [], []
+
+        def flush():
+            if run:
+                ids = (VisitMap.visit_id(run[0]), VisitMap.visit_id(run[-1]))
+                parts.append(ids[0] if len(run) == 1 else f"{ids[0]}-{ids[1]}")
+                run.clear()
+
+        for v in visits:
+            note = matrix.notes.get((row, v))
+            if note is not None:
+                flush()
+                parts.append(f"{VisitMap.visit_id(v)}({note})")
+            elif run and v == run[-1] + 1:
+                run.append(v)
+            else:
+                flush()
+                run.append(v)
+        flush()
+        return ", ".join(parts) or "-", visits
+
+    def encode(self, table: pd.DataFrame) -> Tuple[List[EncodedChunk], VisitMap]:
+        matrix = SoAMatrix.from_dataframe(table)
+        visit_map = VisitMap(matrix)
+        occurrences = matrix.occurrences()
+
+        chunks: List[EncodedChunk] = []
+        lines: List[str] = []
+        rows: List[int] = []
+        legend: dict = {}           # visit -> legend entry, only visits used by the chunk rows
+        chunk_tokens = 0
+
+        def chunk_text(legend_visits, activity_lines) -> str:
+            return "Visits:\n" + "\n".join(visit_map.legend(legend_visits)) + "\nActivities:\n" + "\n".join(activity_lines)
+
+        def legend_line(visit: int) -> str:
+            # epoch names are counted with every visit - an upper bound of the grouped legend
+            return f"{visit_map.epoch(visit)} {VisitMap.visit_id(visit)} = {visit_map.describe_in_epoch(visit)}"
+
+        for row in range(matrix.rows_count):
+            visits_text, visits = self._row_visits(matrix, occurrences, row)
+            line = f"- [{row + 1}] {matrix.activities[matrix.row_activity[row]]}: {visits_text}"
+            new_legend = {v: legend_line(v) for v in visits if v not in legend}
+            row_tokens = self._count_tokens(line) + sum(self._count_tokens(l) for l in new_legend.values())
+
+            if rows and chunk_tokens + row_tokens > self._max_tokens:
+                text = chunk_text(list(legend), lines)
+                chunks.append(EncodedChunk(text, rows, self._count_tokens(text)))
+                lines, rows, legend = [], [], {}
+                new_legend = {v: legend_line(v) for v in visits}
+                row_tokens = self._count_tokens(line) + sum(self._count_tokens(l) for l in new_legend.values())
+                chunk_tokens = 0
+
+            lines.append(line)
+            rows.append(row)
+            legend.update(new_legend)
+            chunk_tokens += row_tokens
+
+        if rows:
+            text = chunk_text(list(legend), lines)
+            chunks.append(EncodedChunk(text, rows, self._count_tokens(text)))
+
+        return chunks, visit_map
@@ -0,0 +1,242 @@
+import queue
+import threading
+from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor, Future
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Tuple, Set, Iterable
+
+import pandas as pd
+
+from app.infrastructure.page_cache import PageCache
+from app.services.pdf_convertor_v3 import PDFConvertorV3
+
+
+# ---------- warm worker process: camelot is imported and the convertor built once per process ----------
+
+_worker_convertor: Optional[PDFConvertorV3] = None
+
+
+def _init_worker(max_rss_mb: Optional[int], page_cache_path: Optional[str]):
+    global _worker_convertor
+    page_cache = PageCache(page_cache_path) if page_cache_path else None
+    _worker_convertor = PDFConvertorV3(max_rss_mb=max_rss_mb, page_cache=page_cache)
+
+
+def _scan_job(pdf_path: str, kinds: Tuple[str, ...]) -> Tuple[Dict[int, str], Dict[str, List[int]], int, Dict[str, int]]:
+    """
+    One text pass over the document: page fingerprints, pages matching the patterns of every table kind,
+    the last page number and the page cache reuse stats of the pass
+    """
+    convertor = _worker_convertor
+    table_kinds = convertor.table_kinds()
+    pattern_pages: Dict[str, List[int]] = {kind: [] for kind in kinds}
+    last_page = 0
+    try:
+        for page_num, text in convertor._iter_text_with_pdfplumber(pdf_path):
+            last_page = page_num
+            for kind in kinds:
+                if any(pattern.search(text) for pattern in table_kinds[kind]["patterns"]):
+                    pattern_pages[kind].append(page_num)
+        fingerprints = dict(convertor._page_fingerprints.get(str(pdf_path), {}))
+        stats = convertor.get_reuse_stats(pdf_path)
+    finally:
+        convertor.reset_reuse_stats(pdf_path)
+    return fingerprints, pattern_pages, max([last_page] + list(fingerprints)), stats
+
+
+def _page_job(pdf_path: str, page_num: int, flavor: str, fingerprint: Optional[str]) -> Tuple[List[pd.DataFrame], Dict[str, int]]:
+    convertor = _worker_convertor
+    if fingerprint:
+        convertor._page_fingerprints[str(pdf_path)] = {page_num: fingerprint}
+    try:
+        return convertor._read_page_tables(pdf_path, page_num, flavor), convertor.get_reuse_stats(pdf_path)
+    except Exception as e:
+        # also the page after the last one, asked for by a continuation
+        print(f"Error in camelot: {e}")
+        return [], convertor.get_reuse_stats(pdf_path)
+    finally:
+        convertor.reset_reuse_stats(pdf_path)
+
+
+# ---------- scheduler ----------
+
+@dataclass
+class _Document:
+    pdf_path: str
+    kinds: Tuple[str, ...]
+    result: Future
+    fingerprints: Dict[int, str] = field(default_factory=dict)
+    pages: Dict[int, List[pd.DataFrame]] = field(default_factory=dict)         # camelot tables of finished pages
+    in_flight: Set[int] = field(default_factory=set)
+    waiters: Dict[int, List[Tuple[str, bool]]] = field(default_factory=lambda: defaultdict(list))
+    visited: Set[Tuple[str, int, bool]] = field(default_factory=set)           # (kind, page, is_seed)
+    tables: Dict[str, Dict[int, pd.DataFrame]] = field(default_factory=lambda: defaultdict(dict))
+    scanned: bool = False
+    last_page: int = 0
+    submitted: Set[int] = field(default_factory=set)       # pages sent to the workers, needed or speculative
+    needed: Set[int] = field(default_factory=set)          # pages some table kind evaluated or waits for
+    reuse_stats: Counter = field(default_factory=Counter)
+
+
+class CamelotPageScheduler:
+    """
+    Table extraction of many documents as per-page camelot jobs on one pool of warm worker processes.
+
+    A document starts with a text scan job; every page matching a table pattern becomes a page job,
+    a page with a table continues on its next page - the same chain PDFConvertorV3._extract_tables_with_camelot
+    follows serially. The `prefetch_pages` pages after a table page are extracted speculatively, so a long table
+    (later pages without the title) runs on all workers instead of one page at a time; prefetch stops at a page
+    without tables, wasted pages end up in the page cache. All pending pages of all documents share
+    the pool queue, so an idle worker picks up pages of whichever document still has work.
+    Continuity, dedup and merge run once all needed pages of a document are back.
+    Only the page scan is scheduled: Grobid table regions (TABLE_EXTRACTOR=grobid) need the TEI of the whole
+    document first and are read by GrobidTableExtractor in the calling process.
+
+        with CamelotPageScheduler(workers=4) as scheduler:
+            futures = [scheduler.submit(pdf) for pdf in pdf_files]
+            tables = futures[0].result()    # {"activities": DataFrame or None, "objectives": ...}
+            scheduler.reuse_stats(pdf_files[0])     # page cache reuse of the text scan and the page jobs
+    """
+    def __init__(self,
+                 workers: int,
+                 max_rss_mb: Optional[int] = None,
+                 page_cache_path: Optional[str] = None,
+                 flavor: str = "lattice",
+                 prefetch_pages: int = 4):
+        self._flavor = flavor
+        self._prefetch_pages = prefetch_pages
+        self._reuse_stats: Dict[str, Dict[str, int]] = {}
+        self._convertor = PDFConvertorV3()      # heuristics and merge only, camelot runs in the workers
+        self._table_kinds = self._convertor.table_kinds()
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(max_rss_mb, page_cache_path)
+        )
+        # job results are handled by one dispatcher thread, so document state needs no locks
+        self._events: queue.Queue = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, pdf_path: str, kinds: Iterable[str] = ("activities", "objectives")) -> Future:
+        document = _Document(str(pdf_path), tuple(kinds), Future())
+        self._events.put(("submit", document, None, None))
+        return document.result
+
+    def reuse_stats(self, pdf_path: str) -> Dict[str, int]:
+        """
+        Page cache reuse of a finished document, counted in the workers and returned with every job
+        """
+        return self._reuse_stats.get(str(pdf_path), {})
+
+    def close(self):
+        self._events.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ---------- dispatcher thread ----------
+
+    def _dispatch(self):
+        while (event := self._events.get()) is not None:
+            action, document, payload, job_future = event
+            if document.result.done():
+                continue
+            try:
+                if action == "submit":
+                    self._start(document)
+                elif action == "scanned":
+                    self._on_scanned(document, job_future.result())
+                else:
+                    self._on_page(document, payload, job_future.result())
+                self._finish_if_complete(document)
+            except Exception as e:
+                document.result.set_exception(e)
+
+    def _notify(self, action: str, document: _Document, payload=None):
+        return lambda job_future: self._events.put((action, document, payload, job_future))
+
+    def _start(self, document: _Document):
+        job = self._executor.submit(_scan_job, document.pdf_path, document.kinds)
+        job.add_done_callback(self._notify("scanned", document))
+
+    def _on_scanned(self, document: _Document, scan_result):
+        document.fingerprints, pattern_pages, document.last_page, stats = scan_result
+        document.reuse_stats.update(stats)
+        document.scanned = True
+        for kind, pages in pattern_pages.items():
+            for page_num in pages:
+                self._need_page(document, kind, page_num, is_seed=True)
+
+    def _submit_page(self, document: _Document, page_num: int):
+        if page_num in document.submitted:
+            return
+        document.submitted.add(page_num)
+        document.in_flight.add(page_num)
+        job = self._executor.submit(
+            _page_job, document.pdf_path, page_num, self._flavor, document.fingerprints.get(page_num)
+        )
+        job.add_done_callback(self._notify("page", document, page_num))
+
+    def _prefetch(self, document: _Document, page_num: int):
+        """
+        Speculative jobs for the pages after a table page, up to a page known to have no tables
+        """
+        for next_page in range(page_num + 1, min(page_num + self._prefetch_pages, document.last_page) + 1):
+            if next_page in document.pages and not document.pages[next_page]:
+                break
+            self._submit_page(document, next_page)
+
+    def _need_page(self, document: _Document, kind: str, page_num: int, is_seed: bool):
+        if (kind, page_num, is_seed) in document.visited:
+            return
+        document.visited.add((kind, page_num, is_seed))
+        document.needed.add(page_num)
+
+        if page_num in document.pages:
+            self._evaluate(document, kind, page_num, is_seed)
+            return
+
+        document.waiters[page_num].append((kind, is_seed))
+        self._submit_page(document, page_num)
+
+    def _on_page(self, document: _Document, page_num: int, job_result: Tuple[List[pd.DataFrame], Dict[str, int]]):
+        tables, stats = job_result
+        document.reuse_stats.update(stats)
+        document.in_flight.discard(page_num)
+        document.pages[page_num] = tables
+        for kind, is_seed in document.waiters.pop(page_num, []):
+            self._evaluate(document, kind, page_num, is_seed)
+
+    def _evaluate(self, document: _Document, kind: str, page_num: int, is_seed: bool):
+        """
+        Same decisions as _extract_tables_with_camelot / _extract_and_process_tables:
+        a page with a wide enough table continues on the next page, a pattern page without one tries the next page
+        """
+        min_table_col = self._table_kinds[kind]["min_table_col_allowed"]
+        wide_tables = [table for table in document.pages[page_num] if table.shape[1] > min_table_col]
+        if wide_tables:
+            document.tables[kind][page_num] = wide_tables[-1]
+            self._prefetch(document, page_num)
+            self._need_page(document, kind, page_num + 1, is_seed=False)
+        elif is_seed:
+            self._need_page(document, kind, page_num + 1, is_seed=False)
+
+    def _finish_if_complete(self, document: _Document):
+        # speculative pages still in flight are not waited for
+        if not document.scanned or any(document.waiters.values()):
+            return
+
+        results = {}
+        for kind in document.kinds:
+            spec = self._table_kinds[kind]
+            results[kind] = self._convertor._process_page_tables(
+                dict(document.tables[kind]), spec["is_continuous_fn"], spec.get("headers_row_count")
+            )
+        document.reuse_stats["table_pages_prefetched_unused"] += len(document.submitted - document.needed)
+        self._reuse_stats[document.pdf_path] = dict(document.reuse_stats)
+        document.pages.clear()
+        document.result.set_result(results)
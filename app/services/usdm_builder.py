@@ -0,0 +1,393 @@
+import copy
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterator, Tuple, BinaryIO, Callable
+
+import pandas as pd
+import yaml
+
+from app.services.soa_matrix import SoAMatrix
+
+try:
+    import orjson
+except ImportError:     # optional, faster serialization of entities
+    orjson = None
+
+
+DEFAULT_TEMPLATE = Path(__file__).parent.parent / "json_templates" / "usdm_template.yaml"
+
+_STUDY_VERSION = ("study", "versions", 0)
+_STUDY_DESIGN = _STUDY_VERSION + ("studyDesigns", 0)
+
+# entity collections held by the builder instead of the template: name -> path in the USDM document
+COLLECTION_PATHS: Dict[str, Tuple] = {
+    "activities": _STUDY_DESIGN + ("activities",),
+    "encounters": _STUDY_DESIGN + ("encounters",),
+    "epochs": _STUDY_DESIGN + ("epochs",),
+    "arms": _STUDY_DESIGN + ("arms",),
+    "elements": _STUDY_DESIGN + ("elements",),
+    "objectives": _STUDY_DESIGN + ("objectives",),
+    "scheduleTimelines": _STUDY_DESIGN + ("scheduleTimelines",),
+    "biomedicalConcepts": _STUDY_VERSION + ("biomedicalConcepts",),
+}
+
+# collections which entities are ordered with previousId/nextId in the USDM schema
+# (ScheduledActivityInstances are not - their order comes from the timeline entry, conditions and timings)
+LINKED_COLLECTIONS = {"activities", "encounters", "epochs"}
+
+_SLOT_PATTERN = re.compile(r'"@@SLOT:(\w+)@@"')
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@lru_cache
+def load_template(template_path: str) -> dict:
+    """
+    Parsed YAML template, read once per process. Never mutate the returned dict.
+    """
+    with open(template_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+class CompiledTemplate:
+    """
+    USDM template serialized once to JSON, split into static byte chunks around the entity collections:
+    parts = [static, slot name, static, slot name, ..., static]
+    """
+    __slots__ = ("parts", "slots")
+
+    def __init__(self, parts: List, slots: List[str]):
+        self.parts = parts
+        self.slots = slots
+
+
+@lru_cache
+def compile_template(template_path: str, overrides_json: str = "{}") -> CompiledTemplate:
+    """
+    overrides_json - {"study.name": "...", ...} as a JSON string (hashable for the cache)
+    """
+    skeleton = copy.deepcopy(load_template(template_path))
+
+    for dotted_path, value in json.loads(overrides_json).items():
+        keys = [int(k) if k.isdigit() else k for k in dotted_path.split(".")]
+        parent = skeleton
+        for key in keys[:-1]:
+            parent = parent[key]
+        parent[keys[-1]] = value
+
+    slots = []
+    for name, path in COLLECTION_PATHS.items():
+        try:
+            parent = skeleton
+            for key in path[:-1]:
+                parent = parent[key]
+        except (KeyError, IndexError, TypeError):
+            continue
+        parent[path[-1]] = f"@@SLOT:{name}@@"
+        slots.append(name)
+
+    pieces = _SLOT_PATTERN.split(json.dumps(skeleton, ensure_ascii=False, separators=(",", ":")))
+    parts = [piece.encode("utf-8") if i % 2 == 0 else piece for i, piece in enumerate(pieces)]
+    return CompiledTemplate(parts, slots)
+
+
+class Entity:
+    """
+    A USDM entity (Activity, Encounter, ...) - id, chain links and the rest of its attributes.
+    Attribute values may be EntityChain (e.g. ScheduleTimeline.instances).
+    """
+    __slots__ = ("id", "fields", "previous_id", "next_id", "has_chains")
+
+    def __init__(self, entity_id: str, fields: Dict[str, Any]):
+        self.id = entity_id
+        self.fields = fields
+        self.previous_id: Optional[str] = None
+        self.next_id: Optional[str] = None
+        self.has_chains = any(isinstance(v, EntityChain) for v in fields.values())
+
+    def to_dict(self, linked: bool) -> dict:
+        result = {"id": self.id, **self.fields}
+        if linked:
+            result["previousId"] = self.previous_id
+            result["nextId"] = self.next_id
+        return result
+
+
+class EntityChain:
+    """
+    Ordered entities keyed by id: append, insert_after, remove and lookup are O(1),
+    previousId/nextId are kept up to date on every change
+    """
+    __slots__ = ("name", "linked", "_by_id", "_head", "_tail")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.linked = name in LINKED_COLLECTIONS
+        self._by_id: Dict[str, Entity] = {}
+        self._head: Optional[str] = None
+        self._tail: Optional[str] = None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, entity_id: str):
+        return entity_id in self._by_id
+
+    def __iter__(self) -> Iterator[Entity]:
+        entity_id = self._head
+        while entity_id is not None:
+            entity = self._by_id[entity_id]
+            yield entity
+            entity_id = entity.next_id
+
+    def get(self, entity_id: str) -> Optional[Entity]:
+        return self._by_id.get(entity_id)
+
+    def append(self, entity: Entity) -> Entity:
+        return self.insert_after(self._tail, entity)
+
+    def insert_after(self, after_id: Optional[str], entity: Entity) -> Entity:
+        if entity.id in self._by_id:
+            raise ValueError(f"Duplicate id {entity.id} in {self.name}")
+
+        next_id = self._by_id[after_id].next_id if after_id is not None else self._head
+
+        entity.previous_id, entity.next_id = after_id, next_id
+        if after_id is not None:
+            self._by_id[after_id].next_id = entity.id
+        else:
+            self._head = entity.id
+        if next_id is not None:
+            self._by_id[next_id].previous_id = entity.id
+        else:
+            self._tail = entity.id
+
+        self._by_id[entity.id] = entity
+        return entity
+
+    def remove(self, entity_id: str) -> Entity:
+        entity = self._by_id.pop(entity_id)
+        if entity.previous_id is not None:
+            self._by_id[entity.previous_id].next_id = entity.next_id
+        else:
+            self._head = entity.next_id
+        if entity.next_id is not None:
+            self._by_id[entity.next_id].previous_id = entity.previous_id
+        else:
+            self._tail = entity.previous_id
+        return entity
+
+
+class UsdmBuilder:
+    """
+    Builds a USDM document from the (compiled, cached) template and entity collections,
+    writes it straight to a file without building the whole document in memory.
+
+        builder = UsdmBuilder(overrides={"study.name": "NCT03421379"})
+        builder.add("activities", activity)
+        builder.write(output_dir / "usdm.json")
+    """
+    def __init__(self, template_path: Path = DEFAULT_TEMPLATE, overrides: Optional[Dict[str, Any]] = None):
+        self._template = compile_template(str(template_path), json.dumps(overrides or {}, sort_keys=True))
+        self._collections: Dict[str, EntityChain] = {name: EntityChain(name) for name in self._template.slots}
+        self._index: Dict[str, Entity] = {}         # all entities of the document by id
+        self._id_counters: Dict[str, int] = {}
+
+    def collection(self, name: str) -> EntityChain:
+        return self._collections[name]
+
+    def get(self, entity_id: str) -> Optional[Entity]:
+        return self._index.get(entity_id)
+
+    def _next_id(self, instance_type: str) -> str:
+        while True:
+            self._id_counters[instance_type] = self._id_counters.get(instance_type, 0) + 1
+            entity_id = f"{instance_type}_{self._id_counters[instance_type]}"
+            if entity_id not in self._index:
+                return entity_id
+
+    def _make_entity(self, payload: dict) -> Entity:
+        fields = {k: v for k, v in payload.items() if k not in ("id", "previousId", "nextId")}
+        entity_id = payload.get("id") or self._next_id(fields.get("instanceType", "Entity"))
+        if entity_id in self._index:
+            raise ValueError(f"Duplicate id {entity_id}")
+        return Entity(entity_id, fields)
+
+    def add(self, collection: str, payload: dict, after_id: Optional[str] = None) -> Entity:
+        """
+        Append the entity (a USDM dict) to the collection, or insert it right after `after_id`.
+        A missing id is generated as <instanceType>_<n>, previousId/nextId are managed by the builder.
+        """
+        chain = self._collections[collection]
+        entity = self._make_entity(payload)
+        if after_id is None:
+            chain.append(entity)
+        else:
+            chain.insert_after(after_id, entity)
+        self._index[entity.id] = entity
+        return entity
+
+    def add_child(self, parent_id: str, attribute: str, payload: dict) -> Entity:
+        """
+        Append to a nested collection of an entity, e.g. ScheduledActivityInstance to ScheduleTimeline.instances
+        """
+        parent = self._index[parent_id]
+        chain = parent.fields.get(attribute)
+        if not isinstance(chain, EntityChain):
+            # plain list from the payload -> chain, once
+            items, chain = chain or [], EntityChain(attribute)
+            for item in items:
+                entity = chain.append(self._make_entity(item))
+                self._index[entity.id] = entity
+            parent.fields[attribute] = chain
+            parent.has_chains = True
+
+        entity = chain.append(self._make_entity(payload))
+        self._index[entity.id] = entity
+        return entity
+
+    def remove(self, collection: str, entity_id: str) -> Entity:
+        entity = self._collections[collection].remove(entity_id)
+        self._unindex(entity)
+        return entity
+
+    def _unindex(self, entity: Entity):
+        # nested children go with their parent, so their ids can be used again
+        del self._index[entity.id]
+        if entity.has_chains:
+            for value in entity.fields.values():
+                if isinstance(value, EntityChain):
+                    for child in value:
+                        self._unindex(child)
+
+    # ---------- streaming serialization ----------
+
+    def _write_entity(self, out: BinaryIO, entity: Entity, linked: bool):
+        if not entity.has_chains:
+            out.write(_dumps(entity.to_dict(linked)))
+            return
+
+        out.write(b"{")
+        for i, (key, value) in enumerate(entity.to_dict(linked).items()):
+            if i:
+                out.write(b",")
+            out.write(_dumps(key) + b":")
+            if isinstance(value, EntityChain):
+                self._write_chain(out, value)
+            else:
+                out.write(_dumps(value))
+        out.write(b"}")
+
+    def _write_chain(self, out: BinaryIO, chain: EntityChain):
+        out.write(b"[")
+        for i, entity in enumerate(chain):
+            out.write(b",\n" if i else b"\n")
+            self._write_entity(out, entity, chain.linked)
+        out.write(b"\n]" if len(chain) else b"]")
+
+    def write(self, output_path: Path):
+        with open(output_path, "wb") as out:
+            for i, part in enumerate(self._template.parts):
+                if i % 2 == 0:
+                    out.write(part)
+                else:
+                    self._write_chain(out, self._collections[part])
+
+    def to_dict(self) -> dict:
+        """
+        Whole document in memory - for small documents and tests
+        """
+        raw = json.loads(b"".join(
+            part if i % 2 == 0 else f'"@@SLOT:{part}@@"'.encode() for i, part in enumerate(self._template.parts)
+        ))
+
+        def fill(value):
+            if isinstance(value, str) and value.startswith("@@SLOT:"):
+                chain = self._collections[value[len("@@SLOT:"):-len("@@")]]
+                return [self._entity_to_plain(e, chain.linked) for e in chain]
+            if isinstance(value, dict):
+                return {k: fill(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [fill(v) for v in value]
+            return value
+
+        return fill(raw)
+
+    def _entity_to_plain(self, entity: Entity, linked: bool) -> dict:
+        result = entity.to_dict(linked)
+        for key, value in result.items():
+            if isinstance(value, EntityChain):
+                result[key] = [self._entity_to_plain(e, value.linked) for e in value]
+        return result
+
+
+def add_schedule_timeline(builder: UsdmBuilder, matrix: SoAMatrix, activity_ids: List[str], name: str = "Main Timeline") -> Entity:
+    """
+    Epochs, encounters and the main ScheduleTimeline of the SoA straight from the SoAMatrix:
+    one encounter per visit column, one ScheduledActivityInstance per visit with the activities of its rows.
+    `activity_ids` - id of the activity of every table row of the matrix
+    """
+    epoch_ids = {}
+    for epoch in matrix.epochs if matrix.header_codes.shape[1] > 1 else []:
+        if not epoch:
+            continue
+        epoch_ids[epoch] = builder.add("epochs", {
+            "name": epoch, "label": epoch, "description": epoch, "instanceType": "StudyEpoch",
+        }).id
+
+    timeline = builder.add("scheduleTimelines", {
+        "name": name, "label": name, "description": name, "mainTimeline": True,
+        "entryCondition": "", "entryId": None, "exits": [], "instances": [], "timings": [],
+        "instanceType": "ScheduleTimeline",
+    })
+    previous = None
+    for visit in range(matrix.visits_count):
+        path = [level for level in matrix.header_path(visit) if level]
+        encounter = builder.add("encounters", {
+            "name": matrix.visit_label(visit), "label": matrix.visit_label(visit), "description": " / ".join(path),
+            "instanceType": "Encounter",
+        })
+        row_activity_ids = dict.fromkeys(activity_ids[row] for row in matrix.rows_of_visit(visit))
+        instance = builder.add_child(timeline.id, "instances", {
+            "name": f"{timeline.id}_{encounter.id}",
+            "activityIds": list(row_activity_ids),
+            "encounterId": encounter.id,
+            "epochId": epoch_ids.get(matrix.header_path(visit)[0]),
+            "defaultConditionId": None,
+            "instanceType": "ScheduledActivityInstance",
+        })
+        # visits in column order: the timeline enters at the first one, each goes on to the next by default
+        if previous is None:
+            timeline.fields["entryId"] = instance.id
+        else:
+            previous.fields["defaultConditionId"] = instance.id
+        previous = instance
+    return timeline
+
+
+def build_activity_usdm(activities: List[dict],
+                        table: Optional[pd.DataFrame] = None,
+                        find_concept: Optional[Callable[[str], Optional[dict]]] = None) -> UsdmBuilder:
+    """
+    USDM document of converted activities: the activities, the BiomedicalConcepts they refer to (when `find_concept`
+    resolves them) and the schedule timeline of the SoA table - only when there is one activity for every table row
+    """
+    builder = UsdmBuilder()
+    for activity in activities:
+        builder.add("activities", activity)
+    if find_concept is not None:
+        for bc_id in dict.fromkeys(bc_id for a in activities for bc_id in a.get("biomedicalConceptIds") or []):
+            concept = find_concept(bc_id)
+            if concept is not None:
+                builder.add("biomedicalConcepts", concept)
+    if table is not None:
+        matrix = SoAMatrix.from_dataframe(table)
+        if len(activities) == matrix.rows_count:
+            add_schedule_timeline(builder, matrix, [a["id"] for a in activities])
+    return builder
@@ -0,0 +1,50 @@
+import os
+import sys
+import asyncio
+import argparse
+sys.path.append(os.path.abspath(os.sep.join(os.path.dirname(__file__).split(os.sep)[:-1])))
+from pathlib import Path
+from injector import Injector
+
+from app.core.settings import get_settings
+from app.di.app_module import AppModule
+from app.infrastructure.llm.llm_client_factory import llm_client_factory
+from app.services.activity_converter import ActivityConverter
+from app.services.biomedical_concept_matcher import BiomedicalConceptMatcher
+from app.services.soa_prompt_encoder import SoAPromptEncoder
+from app.use_cases.streaming_pipeline_use_case import StreamingPipelineUseCase
+
+
+def main():
+    """
+    PDF -> USDM JSON in one run: table extraction of the next protocols overlaps LLM conversion of the previous ones
+    """
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Streaming PDF -> USDM pipeline")
+    parser.add_argument("--input-dir", default=settings.INPUT_DIR)
+    parser.add_argument("--model", default="meta-llama/Meta-Llama-3-8B-Instruct")
+    args = parser.parse_args()
+
+    pdf_files = sorted(Path(args.input_dir).glob("*.pdf"))
+    if not pdf_files:
+        print(f"No PDF files found in {args.input_dir}")
+        return
+
+    activity_example = (Path(__file__).parent / "json_templates" / "activity_example.json").read_text(encoding="utf-8")
+    converter = ActivityConverter(
+        llm_client=llm_client_factory.for_pipeline(),
+        model=args.model,
+        activity_example=activity_example,
+        concept_matcher=BiomedicalConceptMatcher(settings.BC_VOCABULARY_PATHS),
+        prompt_encoder=SoAPromptEncoder(settings.LLM_PROMPT_TOKEN_BUDGET) if settings.LLM_PROMPT_FORMAT == "compact" else None,
+    )
+
+    use_case = Injector([AppModule()]).get(StreamingPipelineUseCase)
+    summary = asyncio.run(use_case.run(pdf_files, converter))
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.abspath(os.sep.join(os.path.dirname(__file__).split(os.sep)[:-1])))
+from pathlib import Path
+from injector import Injector
+
+from app.core.settings import get_settings
+from app.di.app_module import AppModule
+from app.services.pdf_convertor import PDFConvertor
+
+
+def main():
+    """
+    Fill the TEI artifact store for a whole corpus, so later runs do not call Grobid at all
+    """
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Pre-warm the Grobid TEI artifact store")
+    parser.add_argument("--input-dir", default=settings.INPUT_DIR)
+    parser.add_argument("--workers", type=int, default=2, help="parallel Grobid requests")
+    args = parser.parse_args()
+
+    pdf_files = sorted(Path(args.input_dir).glob("*.pdf"))
+    print(f"Pre-warming TEI store for {len(pdf_files)} files from {args.input_dir}")
+
+    convertor = Injector([AppModule()]).get(PDFConvertor)
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(lambda pdf_file: bool(convertor.fetch_tei(str(pdf_file))), pdf_files))
+
+    print(f"TEI available for {sum(results)} of {len(pdf_files)} files")
+
+
+if __name__ == "__main__":
+    main()
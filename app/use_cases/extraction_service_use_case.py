@@ -0,0 +1,198 @@
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging import Logger
+from pathlib import Path
+from typing import Optional, Dict, List
+
+import pandas as pd
+from injector import inject, Injector
+
+from app.core.settings import Settings
+from app.di.app_module import AppModule
+from app.infrastructure.job_queue import JobQueue, Job
+from app.infrastructure.run_journal import RUNNING, DONE, FAILED
+from app.services.activity_converter import ActivityConverter
+from app.services.usdm_builder import build_activity_usdm
+from app.use_cases.processing_pdf_use_case import ProcessingPdfUseCase
+
+
+# ---------- warm worker process: imports, DI wiring and convertors are set up once per process ----------
+
+_worker_use_case: Optional[ProcessingPdfUseCase] = None
+
+
+def _init_worker():
+    global _worker_use_case
+    _worker_use_case = Injector([AppModule()]).get(ProcessingPdfUseCase)
+
+
+def _warm_up() -> int:
+    return multiprocessing.current_process().pid
+
+
+def _document_job(pdf_path: str, output_dir: str, stages: List[str]) -> Dict[str, Dict]:
+    """
+    All extraction stages of a document in one worker: one text pass through the page cache,
+    and no two workers writing the artifacts and journal rows of the same document
+    """
+    results = _worker_use_case.run_extraction_pipeline(Path(pdf_path), output_dir, stages=stages)
+    return {stage: results.get(stage, {"artifacts": [], "error": f"Stage {stage} was not run"}) for stage in stages}
+
+
+# ---------- service ----------
+
+class ExtractionServiceUseCase:
+    """
+    Extraction as a long running service: uploaded PDFs become jobs in a bounded queue, the extraction stages
+    of a job (text, activities and objectives tables) run as one job on a pool of warm worker processes,
+    the optional LLM conversion on the loaded LLM of this process, each limited by its own concurrency setting.
+    Several uploads are extracted at the same time on different workers.
+    """
+    @inject
+    def __init__(self, settings: Settings, logger: Logger):
+        self._settings = settings
+        self._workers = settings.SERVICE_WORKERS
+        self._jobs_concurrency = settings.SERVICE_JOBS_CONCURRENCY
+        self._queue = JobQueue(settings.SERVICE_DATA_DIR, settings.SERVICE_MAX_PENDING_JOBS,
+                               settings.SERVICE_MAX_FINISHED_JOBS, settings.SERVICE_JOB_RETENTION_S)
+        self._logger = logger
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._converter: Optional[ActivityConverter] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._job_workers: List[asyncio.Task] = []
+
+    @property
+    def jobs(self) -> JobQueue:
+        return self._queue
+
+    async def _start_pool(self):
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        # spawn: the parent holds threads and possibly a loaded model, a fork would copy them half-way
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+        )
+        pids = await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_up) for _ in range(self._workers)))
+        self._logger.info(f"{len(set(pids))} extraction workers are warm in {time.perf_counter() - start_time:.1f}s")
+
+    async def start(self, converter: Optional[ActivityConverter] = None):
+        start_time = time.perf_counter()
+        await self._start_pool()
+
+        self._converter = converter
+        if converter is not None and self._settings.SERVICE_PRELOAD_LLM:
+            await asyncio.to_thread(converter.warm_up)
+            self._logger.info(f"LLM is loaded in {time.perf_counter() - start_time:.1f}s")
+
+        self._limits = {
+            "extraction": asyncio.Semaphore(self._settings.SERVICE_EXTRACTION_CONCURRENCY),
+            "llm": asyncio.Semaphore(self._settings.SERVICE_LLM_CONCURRENCY),
+        }
+        self._job_workers = [asyncio.create_task(self._job_worker()) for _ in range(self._jobs_concurrency)]
+
+    async def stop(self):
+        for task in self._job_workers:
+            task.cancel()
+        await asyncio.gather(*self._job_workers, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+
+    def submit(self, filename: str, content: bytes, convert: bool = False) -> Job:
+        if convert and self._converter is None:
+            raise ValueError("LLM conversion is not configured for this service")
+        job = self._queue.create(filename, content, convert)
+        self._logger.info(f"Job {job.id}: {filename} queued, {self._queue.pending} pending")
+        return job
+
+    def stats(self) -> dict:
+        statuses = [job.status for job in self._queue.list()]
+        return {
+            "workers": self._workers,
+            "pending": self._queue.pending,
+            "jobs": {status: statuses.count(status) for status in set(statuses)},
+            "llm": self._converter is not None,
+        }
+
+    # ---------- jobs ----------
+
+    async def _job_worker(self):
+        while True:
+            job = await self._queue.next()
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                self._logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+                await self._queue.publish(job, FAILED, error=str(e))
+
+    async def _run_job(self, job: Job):
+        start_time = time.perf_counter()
+        await self._queue.publish(job, RUNNING)
+
+        await self._run_extraction(job, ["text", "activities", "objectives"])
+        if job.convert and job.stages["activities"]["status"] == DONE:
+            await self._run_llm_stage(job)
+
+        errors = [f"{stage}: {result['error']}" for stage, result in job.stages.items() if result.get("error")]
+        job.error = "; ".join(errors) or None
+        elapsed = time.perf_counter() - start_time
+        await self._queue.publish(job, FAILED if errors else DONE, elapsed_s=round(elapsed, 2),
+                                  artifacts=[Path(a).name for a in job.artifacts])
+        self._logger.info(f"Job {job.id}: {job.status} in {elapsed:.1f}s")
+
+    async def _set_stage(self, job: Job, stage: str, status: str, artifacts: Optional[List[str]] = None, error: Optional[str] = None):
+        job.stages[stage] = {"status": status, "artifacts": artifacts or [], "error": error}
+        await self._queue.publish(job, "stage", stage=stage, status=status,
+                                  artifacts=[Path(a).name for a in artifacts or []], error=error)
+
+    async def _run_extraction(self, job: Job, stages: List[str]):
+        loop = asyncio.get_running_loop()
+        async with self._limits["extraction"]:
+            for stage in stages:
+                await self._set_stage(job, stage, RUNNING)
+            executor = self._executor
+            try:
+                results = await loop.run_in_executor(executor, _document_job, str(job.pdf_path), str(job.output_dir), stages)
+            except BrokenProcessPool as e:
+                # a worker killed (e.g. by the OOM killer) breaks the whole pool: fail the stages, start a new pool once
+                results = {stage: {"artifacts": [], "error": f"Worker process died: {e}"} for stage in stages}
+                if self._executor is executor:
+                    self._logger.error("Extraction worker died, restarting the pool")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    await self._start_pool()
+            except Exception as e:
+                results = {stage: {"artifacts": [], "error": f"Worker failed: {e}"} for stage in stages}
+        for stage, result in results.items():
+            await self._set_stage(job, stage, FAILED if result["error"] else DONE, result["artifacts"], result["error"])
+
+    async def _run_llm_stage(self, job: Job):
+        csv_files = [a for a in job.stages["activities"]["artifacts"] if a.endswith(".csv")]
+        if not csv_files:
+            await self._set_stage(job, "llm", DONE)
+            return
+
+        async with self._limits["llm"]:
+            await self._set_stage(job, "llm", RUNNING)
+            try:
+                table = pd.read_csv(csv_files[0])
+                activities = await self._converter.convert(table)
+                artifacts = await asyncio.to_thread(self._write_usdm, job, activities, table)
+            except Exception as e:
+                self._logger.error(f"Job {job.id}: LLM conversion failed: {e}", exc_info=True)
+                await self._set_stage(job, "llm", FAILED, error=str(e))
+                return
+        await self._set_stage(job, "llm", DONE, artifacts)
+
+    def _write_usdm(self, job: Job, activities: List[dict], table: pd.DataFrame) -> List[str]:
+        document = job.pdf_path.stem
+        activities_path = job.output_dir / f"{document}_activities.json"
+        with open(activities_path, "w", encoding="utf-8") as f:
+            json.dump(activities, f, indent=2)
+
+        usdm_path = job.output_dir / f"{document}_usdm.json"
+        find_concept = self._converter.concept_matcher.find_concept if self._converter.concept_matcher else None
+        build_activity_usdm(activities, table, find_concept).write(usdm_path)
+        return [str(activities_path), str(usdm_path)]
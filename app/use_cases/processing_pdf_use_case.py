@@ -2,39 +2,140 @@ import os
 import pandas as pd
 from logging import Logger
 from pathlib import Path
-from typing import Callable, Any
+from typing import Callable, Any, Iterator, Optional, List, Tuple, Dict, Iterable
 from injector import inject
 
 from app.core.settings import Settings
+from app.core.shutdown import GracefulShutdown
+from app.core.profiling import DocumentProfiler
+from app.infrastructure.run_journal import RunJournal
+from app.infrastructure.parquet_corpus_store import ParquetCorpusStore
+from app.infrastructure.page_text_index import PageTextIndex
 from app.services.pdf_convertor import PDFConvertor
 from app.services.pdf_convertor_v3 import PDFConvertorV3
 
 
+PAGE_SEPARATOR = "\n\n                                     --- PAGE ---\n\n"
+
+# journal stages of the extraction, in the order they run
+EXTRACTION_STAGES = ("text", "activities", "objectives")
+
 
 class ProcessingPdfUseCase:
     @inject
     # change PDFConvertorV3 annotation here to use another convertor like PDFConvertor
-    def __init__(self, pdf_convertor: PDFConvertorV3, logger: Logger):
+    def __init__(self,
+                 pdf_convertor: PDFConvertorV3,
+                 corpus_store: ParquetCorpusStore,
+                 page_index: PageTextIndex,
+                 journal: RunJournal,
+                 shutdown: GracefulShutdown,
+                 profiler: DocumentProfiler,
+                 settings: Settings,
+                 logger: Logger):
         self._pdf_convertor = pdf_convertor
+        self._corpus_store = corpus_store
+        self._journal = journal
+        self._shutdown = shutdown
+        self._profiler = profiler
+        self._max_attempts = settings.RUN_MAX_ATTEMPTS
+        self._page_index = page_index if settings.PAGE_INDEX_ENABLED else None
+        self._write_files = settings.OUTPUT_BACKEND in ("files", "both")
+        self._write_parquet = settings.OUTPUT_BACKEND in ("parquet", "both")
         self._logger = logger
 
 
-    def run_extraction_pipeline(self, pdf_file: Path, output_dir: str):
+    def run_extraction_pipeline(self,
+                                pdf_file: Path,
+                                output_dir: str,
+                                resume: bool = False,
+                                stages: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
         """
         Run PDF parsing, Hide extractions_func from outer user (function injection pattern)
         can use different extractors, pdf->text, pdf->tables etc
+        Every stage is recorded in the run journal, with resume=True stages done by a previous run are skipped
+        `stages` - subset of text/activities/objectives to run, all when not set
+        Returns stage -> {"artifacts": [...], "error": ...} of the stages run
         """
-        # extract text pages - [_pdf_convertor.extract_text_pages_from_pdf]
-        self._process_extracts_and_save(self._pdf_convertor.extract_text_pages_from_pdf, pdf_file, output_dir)
-
-        # extract activity and objective tables
-        self._process_extracts_and_save(self._pdf_convertor.extract_activity_tables_from_pdf, pdf_file, output_dir)
-        self._process_extracts_and_save(self._pdf_convertor.extract_objectives_tables_from_pdf, pdf_file, output_dir)
-
-
-    def _process_extracts_and_save(self, extractions_func: Callable[..., Any], pdf_file_path: Path, output_dir: str):
+        stages = list(stages) if stages is not None else None
+        with self._profiler.profile(pdf_file.stem, "-".join(stages) if stages is not None else None):
+            return self._run_stages(pdf_file, output_dir, resume, set(stages) if stages is not None else None)
+
+
+    def _run_stages(self, pdf_file: Path, output_dir: str, resume: bool, selected: Optional[set]) -> Dict[str, Dict]:
+        self._pdf_convertor.reset_reuse_stats(pdf_file)
+        document = pdf_file.stem
+        results = {}
+
+        stages = [
+            # extract text pages page by page - [_pdf_convertor.iter_text_pages_from_pdf]
+            ("text", self._pdf_convertor.iter_text_pages_from_pdf),
+            # extract activity and objective tables
+            ("activities", self._pdf_convertor.extract_activity_tables_from_pdf),
+            ("objectives", self._pdf_convertor.extract_objectives_tables_from_pdf),
+        ]
+        try:
+            for stage, extractions_func in stages:
+                if selected is not None and stage not in selected:
+                    continue
+                if self._shutdown.requested:
+                    break
+                if resume and not self._journal.should_run(document, stage, self._max_attempts):
+                    self._logger.info(f"   Skipping {stage} of {pdf_file.name}: done or out of attempts")
+                    continue
+
+                self._journal.start(document, stage)
+                artifacts, error = self._process_extracts_and_save(extractions_func, pdf_file, output_dir)
+                if error is None:
+                    self._journal.finish(document, stage, artifacts)
+                else:
+                    self._journal.fail(document, stage, error)
+                results[stage] = {"artifacts": artifacts, "error": error}
+        finally:
+            stats = self._pdf_convertor.get_reuse_stats(pdf_file)
+            self._logger.info(
+                f"   Page cache for {pdf_file.name}: "
+                f"text pages reused {stats.get('text_pages_reused', 0)}, extracted {stats.get('text_pages_extracted', 0)}; "
+                f"camelot pages reused {stats.get('table_pages_reused', 0)}, extracted {stats.get('table_pages_extracted', 0)}"
+            )
+            # per-path fingerprints and stats would otherwise stay in a warm worker for every document it ever saw
+            self._pdf_convertor.reset_reuse_stats(pdf_file)
+        return results
+
+
+    def _write_pages_stream(self,
+                            pages: Iterator,
+                            output_txt_path: Optional[Path],
+                            page_sinks: List[Callable[[int, str], None]]) -> int:
+        """
+        Write (page_num, text) pairs to the file and every other sink (corpus store, page index) as they come,
+        nothing is accumulated in memory
+        """
+        pages_count = 0
+        file = open(output_txt_path, 'w', encoding='utf-8') if output_txt_path else None
+        try:
+            for page_num, text in pages:
+                if file:
+                    if pages_count:
+                        file.write(PAGE_SEPARATOR)
+                    file.write(text)
+                for sink in page_sinks:
+                    sink(page_num, text)
+                pages_count += 1
+        finally:
+            if file:
+                file.close()
+
+        return pages_count
+
+
+    def _process_extracts_and_save(self,
+                                   extractions_func: Callable[..., Any],
+                                   pdf_file_path: Path,
+                                   output_dir: str) -> Tuple[List[str], Optional[str]]:
         """
         Extract a piece of info (text, table etc) from pdf and save it
+        Returns paths of the written artifacts and the error message when it failed
         """
         self._logger.info(f"   Processing file: {pdf_file_path}")
 
@@ -42,35 +143,90 @@ class ProcessingPdfUseCase:
             "extract_activity_tables_from_pdf": "_activities",
             "extract_objectives_tables_from_pdf": "_objectives",
             "extract_text_pages_from_pdf": "",
+            "iter_text_pages_from_pdf": "",
         }
 
         file_suffix = suffix_map.get(extractions_func.__name__)
 
         output_stem = pdf_file_path.stem + file_suffix
         output_txt_path = Path(output_dir) / f"{output_stem}.txt"
+        artifacts = []
 
         try:
             result = extractions_func(pdf_file_path)
 
-            if isinstance(result, list):
-                content = "\n\n                                     --- PAGE ---\n\n".join(result)
+            if result is None:
+                self._logger.warning(f"   Nothing found by {extractions_func.__name__} in {pdf_file_path}")
+
+            elif isinstance(result, list):
+                content = PAGE_SEPARATOR.join(result)
                 output_txt_path.write_text(content, encoding='utf-8')
+                artifacts.append(str(output_txt_path))
                 self._logger.info(f"   Writing TXT to {output_txt_path}")
 
+            elif isinstance(result, Iterator):
+                document = pdf_file_path.stem
+                page_sinks = []
+                page_writer = None
+                if self._write_parquet:
+                    page_writer = self._corpus_store.open_page_writer(document)
+                    page_sinks.append(page_writer.write)
+                if self._page_index:
+                    self._page_index.begin_document(document, "pdfplumber")
+                    page_sinks.append(lambda page_num, text: self._page_index.add_page(document, "pdfplumber", page_num, text))
+
+                try:
+                    pages_count = self._write_pages_stream(result, output_txt_path if self._write_files else None, page_sinks)
+                except Exception:
+                    if self._page_index:
+                        self._page_index.rollback()
+                    raise
+                finally:
+                    if page_writer:
+                        self._corpus_store.close_page_writer(page_writer, source=str(pdf_file_path))
+
+                if self._page_index:
+                    self._page_index.commit_document(document, "pdfplumber", pages_count)
+                if self._write_files:
+                    artifacts.append(str(output_txt_path))
+
+                if not pages_count:
+                    self._logger.warning(f"   No text was extracted from {pdf_file_path}")
+                self._logger.info(f"   Writing TXT ({pages_count} pages) to {output_txt_path if self._write_files else 'corpus store'}")
+
             elif isinstance(result, pd.DataFrame):
-                output_csv_path = output_txt_path.with_suffix('.csv')
-                result.to_csv(output_csv_path, index=False)
-                self._logger.info(f"   Writing TABLE to {output_csv_path}")
+                if self._write_files:
+                    output_csv_path = output_txt_path.with_suffix('.csv')
+                    result.to_csv(output_csv_path, index=False)
+                    artifacts.append(str(output_csv_path))
+                    self._logger.info(f"   Writing TABLE to {output_csv_path}")
+                if self._write_parquet:
+                    self._corpus_store.append_table(
+                        document=pdf_file_path.stem,
+                        kind=file_suffix.lstrip('_'),
+                        table=result,
+                        source_pages=result.attrs.get("source_pages"),
+                        source=str(pdf_file_path),
+                    )
+                    self._logger.info(f"   Appending TABLE to corpus store ({file_suffix.lstrip('_')})")
 
             else:
                 raise TypeError(f"Unsupported extracted result type: {type(result)}")
 
         except FileNotFoundError as e:
             self._logger.error(f"File not found: {e}", exc_info=True)
+            return artifacts, f"File not found: {e}"
+        except MemoryError as e:
+            self._logger.error(f"Memory limit reached: {e}", exc_info=True)
+            return artifacts, f"Memory limit reached: {e}"
         except IOError as e:
             self._logger.error(f"I/O error: {e}", exc_info=True)
+            return artifacts, f"I/O error: {e}"
         except Exception as e:
             self._logger.error(f"An unexpected error occurred: {e}", exc_info=True)
+            return artifacts, f"An unexpected error occurred: {e}"
+
+        return artifacts, None
 
         # output_filename = Path(pdf_file_path).stem + file_suffix +".txt"
         # output_txt_file_path = os.path.join(output_dir, output_filename)
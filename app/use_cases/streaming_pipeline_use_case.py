@@ -0,0 +1,215 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from logging import Logger
+from pathlib import Path
+from typing import List, Optional, Dict, Tuple
+
+import pandas as pd
+from injector import inject
+
+from app.core.settings import Settings
+from app.services.activity_converter import ActivityConverter, link_activities
+from app.services.table_page_scheduler import CamelotPageScheduler
+from app.services.usdm_builder import build_activity_usdm
+
+
+# ---------- messages between stages ----------
+
+@dataclass
+class ActivityChunk:
+    document: str
+    index: int
+    total: int
+    table: pd.DataFrame
+
+
+@dataclass
+class ConvertedChunk:
+    document: str
+    index: int
+    total: int
+    activities: List[dict]
+    error: Optional[str] = None
+    table: Optional[pd.DataFrame] = None     # rows of the chunk, visits of the schedule timeline
+
+
+@dataclass
+class StageTimes:
+    busy: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+
+    def add(self, stage: str, start_time: float):
+        self.busy[stage] += time.perf_counter() - start_time
+
+
+_DONE = None    # end of stream marker in the queues
+
+
+class StreamingPipelineUseCase:
+    """
+    PDF -> activity table -> row chunks -> LLM -> USDM JSON, all stages run at the same time.
+    Stages are connected by bounded queues (a full queue pauses the stage before it), tables stay in memory.
+    Extraction runs as per-page camelot jobs on a pool of warm processes, LLM conversion in async workers.
+    """
+    @inject
+    def __init__(self, settings: Settings, logger: Logger):
+        self._settings = settings
+        self._output_dir = Path(settings.OUTPUT_DIR)
+        self._extract_workers = settings.PIPELINE_EXTRACT_WORKERS
+        self._llm_workers = settings.PIPELINE_LLM_WORKERS
+        self._queue_size = settings.PIPELINE_QUEUE_SIZE
+        self._chunk_rows = settings.PIPELINE_CHUNK_ROWS
+        self._logger = logger
+
+    def _split_chunks(self, document: str, table: Optional[pd.DataFrame]) -> List[ActivityChunk]:
+        if table is None or table.empty:
+            return []
+        starts = range(0, len(table), self._chunk_rows)
+        return [ActivityChunk(document, i, len(starts), table.iloc[start:start + self._chunk_rows])
+                for i, start in enumerate(starts)]
+
+    async def _extraction_worker(self,
+                                 scheduler: CamelotPageScheduler,
+                                 pdf_queue: asyncio.Queue,
+                                 chunk_queue: asyncio.Queue,
+                                 result_queue: asyncio.Queue,
+                                 times: StageTimes):
+        while (pdf_file := await pdf_queue.get()) is not _DONE:
+            document = pdf_file.stem
+            start_time = time.perf_counter()
+            try:
+                tables = await asyncio.wrap_future(scheduler.submit(str(pdf_file), kinds=("activities",)))
+                table = tables["activities"]
+                stats = scheduler.reuse_stats(str(pdf_file))
+                self._logger.info(
+                    f"   Page cache for {pdf_file.name}: "
+                    f"text pages reused {stats.get('text_pages_reused', 0)}, extracted {stats.get('text_pages_extracted', 0)}; "
+                    f"camelot pages reused {stats.get('table_pages_reused', 0)}, extracted {stats.get('table_pages_extracted', 0)}, "
+                    f"prefetched unused {stats.get('table_pages_prefetched_unused', 0)}"
+                )
+            except Exception as e:
+                self._logger.error(f"   Table extraction failed for {pdf_file}: {e}", exc_info=True)
+                # reported by the writer as a failed document instead of dropping out of the run
+                await result_queue.put(ConvertedChunk(document, 0, 0, [], error=f"table extraction failed: {e}"))
+                continue
+            finally:
+                times.add("extraction", start_time)
+
+            chunks = self._split_chunks(document, table)
+            self._logger.info(f"   {document}: {0 if table is None else len(table)} activity rows, {len(chunks)} chunks")
+            if not chunks:
+                self._logger.warning(f"   No activity table found in {pdf_file}")
+                await result_queue.put(ConvertedChunk(document, 0, 0, []))
+            for chunk in chunks:
+                await chunk_queue.put(chunk)
+
+    async def _llm_worker(self, converter: ActivityConverter, chunk_queue: asyncio.Queue, result_queue: asyncio.Queue, times: StageTimes):
+        while (chunk := await chunk_queue.get()) is not _DONE:
+            start_time = time.perf_counter()
+            try:
+                activities = await converter.convert(chunk.table)
+                result = ConvertedChunk(chunk.document, chunk.index, chunk.total, activities, table=chunk.table)
+            except Exception as e:
+                self._logger.error(f"   LLM conversion failed for {chunk.document} chunk {chunk.index}: {e}", exc_info=True)
+                result = ConvertedChunk(chunk.document, chunk.index, chunk.total, [], error=str(e))
+            finally:
+                times.add("llm", start_time)
+            await result_queue.put(result)
+
+    async def _writer(self, result_queue: asyncio.Queue, times: StageTimes) -> Tuple[int, int]:
+        """
+        Collects chunks of every document and writes it as soon as the last one arrives.
+        Returns the number of written and failed documents
+        """
+        pending: Dict[str, Dict[int, ConvertedChunk]] = defaultdict(dict)
+        written = failed = 0
+        while (result := await result_queue.get()) is not _DONE:
+            chunks = pending[result.document]
+            if result.total:
+                chunks[result.index] = result
+                if len(chunks) < result.total:
+                    continue
+            del pending[result.document]
+
+            if result.error and not result.total:
+                self._logger.error(f"   {result.document}: {result.error}, USDM is not written")
+                failed += 1
+                continue
+            errors = [c.error for c in chunks.values() if c.error]
+            if errors:
+                self._logger.error(f"   {result.document}: {len(errors)} chunks failed, USDM is not written")
+                failed += 1
+                continue
+
+            start_time = time.perf_counter()
+            activities = link_activities([a for i in sorted(chunks) for a in chunks[i].activities])
+            tables = [chunks[i].table for i in sorted(chunks) if chunks[i].table is not None]
+            table = pd.concat(tables) if tables else None
+            try:
+                await asyncio.to_thread(self._write_document, result.document, activities, table)
+                written += 1
+            except Exception as e:
+                self._logger.error(f"   {result.document}: writing USDM failed: {e}", exc_info=True)
+                failed += 1
+            finally:
+                times.add("write", start_time)
+
+        for document in pending:
+            self._logger.error(f"   {document}: not all chunks were converted, USDM is not written")
+        return written, failed + len(pending)
+
+    def _write_document(self, document: str, activities: List[dict], table: Optional[pd.DataFrame] = None):
+        with open(self._output_dir / f"{document}_activities.json", "w", encoding="utf-8") as f:
+            json.dump(activities, f, indent=2)
+
+        builder = build_activity_usdm(activities, table)
+        builder.write(self._output_dir / f"{document}_usdm.json")
+        self._logger.info(f"   {document}: {len(activities)} activities -> {document}_usdm.json")
+
+    async def run(self, pdf_files: List[Path], converter: ActivityConverter) -> Dict:
+        """
+        Returns the run summary: documents, written, failed (extraction, LLM or write), makespan_s
+        """
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+        pdf_queue = asyncio.Queue()
+        chunk_queue = asyncio.Queue(maxsize=self._queue_size)
+        result_queue = asyncio.Queue(maxsize=self._queue_size)
+        for pdf_file in pdf_files:
+            pdf_queue.put_nowait(pdf_file)
+        # two documents per process in flight, so a process done with its pages takes pages of another document
+        documents_in_flight = 2 * self._extract_workers
+        for _ in range(documents_in_flight):
+            pdf_queue.put_nowait(_DONE)
+
+        times = StageTimes()
+        start_time = time.perf_counter()
+        page_cache_path = self._settings.PAGE_CACHE_PATH if self._settings.PAGE_CACHE_ENABLED else None
+        if self._settings.TABLE_EXTRACTOR != 'scan':
+            self._logger.warning(f"TABLE_EXTRACTOR={self._settings.TABLE_EXTRACTOR} is not supported by the page scheduler, "
+                                 f"tables are extracted by the page scan")
+
+        with CamelotPageScheduler(workers=self._extract_workers,
+                                  max_rss_mb=self._settings.MAX_RSS_MB,
+                                  page_cache_path=page_cache_path,
+                                  prefetch_pages=self._settings.PIPELINE_PREFETCH_PAGES) as scheduler:
+            writer = asyncio.create_task(self._writer(result_queue, times))
+            llm_workers = [asyncio.create_task(self._llm_worker(converter, chunk_queue, result_queue, times))
+                           for _ in range(self._llm_workers)]
+
+            await asyncio.gather(*(self._extraction_worker(scheduler, pdf_queue, chunk_queue, result_queue, times)
+                                   for _ in range(documents_in_flight)))
+            for _ in llm_workers:
+                await chunk_queue.put(_DONE)
+            await asyncio.gather(*llm_workers)
+            await result_queue.put(_DONE)
+            written, failed = await writer
+
+        makespan = time.perf_counter() - start_time
+        self._logger.info(
+            f"Streaming pipeline: {written}/{len(pdf_files)} documents in {makespan:.1f}s, {failed} failed; busy time "
+            f"extraction {times.busy['extraction']:.1f}s ({self._extract_workers} workers), "
+            f"LLM {times.busy['llm']:.1f}s ({self._llm_workers} workers), write {times.busy['write']:.1f}s"
+        )
+        return {"documents": len(pdf_files), "written": written, "failed": failed, "makespan_s": round(makespan, 2)}